@@ -0,0 +1,85 @@
+# coding: utf-8
+"""
+Benchmark of the database operations made by LaunchPad.checkout_fw.
+
+A workflow of N independent Fireworks is added to a scratch database and every Firework is checked
+out (and marked RUNNING) in turn. The run reports the wall time and the number of MongoDB commands
+per checkout, counted with pymongo's command monitoring, for:
+
+    - lock-free: the default path, which updates the workflow with one conditional update
+    - refresh: the same checkout followed by a full locked workflow refresh, as before
+
+Requires a MongoDB server on localhost:27017. The scratch database is dropped at the end.
+
+Usage: python benchmarks/bench_checkout.py [-n 200] [--db fireworks_bench_checkout]
+"""
+
+from __future__ import unicode_literals, print_function
+
+import argparse
+import time
+from collections import Counter
+
+from pymongo import monitoring
+
+from fireworks import Firework, FWorker, LaunchPad, Workflow
+from fireworks.user_objects.firetasks.script_task import ScriptTask
+
+
+class CommandCounter(monitoring.CommandListener):
+
+    def __init__(self):
+        self.counts = Counter()
+        self.active = False
+
+    def started(self, event):
+        if self.active:
+            self.counts[event.command_name] += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+def run(lp, counter, n, full_refresh):
+    lp.reset('', require_password=False, max_reset_wo_password=10)
+    lp.add_wf(Workflow([Firework(ScriptTask.from_str('echo "{}"'.format(i))) for i in range(n)]))
+    if full_refresh:
+        lp._set_checkout_wf_state = lambda fw_id, prev_state, state: False
+
+    fworker = FWorker()
+    counter.counts.clear()
+    counter.active = True
+    t0 = time.time()
+    for _ in range(n):
+        lp.checkout_fw(fworker, '.', host='localhost', ip='127.0.0.1')
+    secs = time.time() - t0
+    counter.active = False
+    return secs, counter.counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument('-n', '--nfws', type=int, default=200)
+    parser.add_argument('--db', default='fireworks_bench_checkout')
+    args = parser.parse_args()
+
+    counter = CommandCounter()
+    monitoring.register(counter)
+    print("{:>10} {:>8} {:>12} {:>12}  {}".format("mode", "fws", "ms/checkout", "ops/checkout",
+                                                 "commands"))
+    for mode, full_refresh in [("lock-free", False), ("refresh", True)]:
+        lp = LaunchPad(name=args.db, strm_lvl='ERROR')
+        secs, counts = run(lp, counter, args.nfws, full_refresh)
+        n_ops = sum(counts.values())
+        detail = ", ".join("{}: {:.1f}".format(k, v / float(args.nfws))
+                           for k, v in sorted(counts.items()))
+        print("{:>10} {:>8} {:>12.2f} {:>12.1f}  {}".format(
+            mode, args.nfws, 1000 * secs / args.nfws, n_ops / float(args.nfws), detail))
+        lp.connection.drop_database(args.db)
+
+
+if __name__ == '__main__':
+    main()
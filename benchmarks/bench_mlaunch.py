@@ -0,0 +1,66 @@
+# coding: utf-8
+"""
+Benchmark of the throughput of mlaunch (launch_multiprocess) with many parallel jobs.
+
+A workflow of N independent Fireworks, each running a Python task that returns at once, is added to
+a scratch database and run by J parallel jobs until completion. The run reports the wall time and
+the number of Fireworks completed per second for:
+
+    - proxy: all the jobs use the LaunchPad of a single DataServer process, as before
+    - per-process: each job connects to the database with its own LaunchPad (--lp_per_process)
+
+Requires a MongoDB server on localhost:27017. The launcher directories are written to a temporary
+directory, and the scratch database is dropped at the end.
+
+Usage: python benchmarks/bench_mlaunch.py [-n 1000] [-j 4 16 32] [--db fireworks_bench_mlaunch]
+"""
+
+from __future__ import unicode_literals, print_function
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from fireworks import Firework, FWorker, LaunchPad, Workflow
+from fireworks.features.multi_launcher import launch_multiprocess
+from fireworks.user_objects.firetasks.script_task import PyTask
+
+
+def setup(lp, n):
+    lp.reset('', require_password=False, max_reset_wo_password=10)
+    lp.add_wf(Workflow([Firework(PyTask(func='time.sleep', args=[0])) for _ in range(n)]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument('-n', '--nfws', type=int, default=1000)
+    parser.add_argument('-j', '--jobs', nargs='+', type=int, default=[4, 16, 32])
+    parser.add_argument('--db', default='fireworks_bench_mlaunch')
+    args = parser.parse_args()
+
+    lp = LaunchPad(name=args.db, strm_lvl='ERROR')
+    old_wd = os.getcwd()
+    run_dir = tempfile.mkdtemp()
+    os.chdir(run_dir)
+    print("{:>12} {:>6} {:>8} {:>10} {:>10}".format("mode", "jobs", "fws", "secs", "fws/sec"))
+    try:
+        for jobs in args.jobs:
+            for mode, lp_per_process in [("proxy", False), ("per-process", True)]:
+                setup(lp, args.nfws)
+                t0 = time.time()
+                launch_multiprocess(lp, FWorker(), 'ERROR', 0, jobs, 1,
+                                    lp_per_process=lp_per_process)
+                secs = time.time() - t0
+                assert lp.get_fw_ids({'state': 'COMPLETED'}, count_only=True) == args.nfws
+                print("{:>12} {:>6} {:>8} {:>10.3f} {:>10.1f}".format(mode, jobs, args.nfws, secs,
+                                                                      args.nfws / secs))
+    finally:
+        os.chdir(old_wd)
+        shutil.rmtree(run_dir)
+        lp.connection.drop_database(args.db)
+
+
+if __name__ == '__main__':
+    main()
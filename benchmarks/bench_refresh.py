@@ -0,0 +1,74 @@
+# coding: utf-8
+"""
+Benchmark of Workflow.refresh and Workflow.rerun_fw on synthetic workflows.
+
+    - deep: a linear chain of N Fireworks
+    - wide: one root, N children and a single join Firework
+
+All Fireworks carry a COMPLETED launch, so that a refresh of the root propagates through the
+whole workflow, and the run reports the wall time and the number of single-Firework refreshes.
+
+Usage: python benchmarks/bench_refresh.py [-s 100 1000 10000]
+"""
+
+from __future__ import unicode_literals, print_function
+
+import argparse
+import time
+
+from fireworks.core.firework import Firework, FWAction, Launch, Workflow
+from fireworks.user_objects.firetasks.script_task import ScriptTask
+
+
+def _fw(fw_id, parents=None):
+    fw = Firework(ScriptTask.from_str('echo "{}"'.format(fw_id)), fw_id=fw_id, parents=parents)
+    fw.launches = [Launch('COMPLETED', '.', host='localhost', ip='127.0.0.1', action=FWAction(),
+                          fw_id=fw_id)]
+    return fw
+
+
+def deep_wf(n):
+    fws = [_fw(1)]
+    for i in range(2, n + 1):
+        fws.append(_fw(i, parents=fws[-1]))
+    return Workflow(fws)
+
+
+def wide_wf(n):
+    root = _fw(1)
+    children = [_fw(i, parents=root) for i in range(2, n + 2)]
+    return Workflow([root] + children + [_fw(n + 2, parents=children)])
+
+
+def _timed(wf, method):
+    visits = [0]
+    refresh_fw = wf._refresh_fw
+
+    def counting_refresh_fw(fw_id, updated_ids):
+        visits[0] += 1
+        return refresh_fw(fw_id, updated_ids)
+
+    wf._refresh_fw = counting_refresh_fw
+    t0 = time.time()
+    updated_ids = method(1)
+    return time.time() - t0, visits[0], len(updated_ids)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument('-s', '--sizes', nargs='+', type=int, default=[100, 1000, 10000])
+    args = parser.parse_args()
+
+    print("{:>6} {:>8} {:>8} {:>10} {:>8} {:>8}".format(
+        "shape", "size", "method", "time (s)", "visits", "updated"))
+    for shape, builder in [("deep", deep_wf), ("wide", wide_wf)]:
+        for n in args.sizes:
+            wf = builder(n)
+            for name in ("refresh", "rerun_fw"):
+                secs, visits, n_updated = _timed(wf, getattr(wf, name))
+                print("{:>6} {:>8} {:>8} {:>10.4f} {:>8} {:>8}".format(
+                    shape, n, name, secs, visits, n_updated))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+# coding: utf-8
+"""
+Benchmark of loading a whole workflow with LaunchPad.get_wf_by_fw_id.
+
+A workflow of one root and N-1 children is added to a scratch database and every Firework is run
+(checked out and completed), so that each one carries a launch. The run reports the wall time and
+the number of MongoDB commands to load the workflow, counted with pymongo's command monitoring,
+for:
+
+    - bulk: get_wf_by_fw_id, which loads all the Fireworks and all their launches at once
+    - per-firework: the Workflow built from get_fw_by_id for every node, as before
+
+Requires a MongoDB server on localhost:27017. The scratch database is dropped at the end.
+
+Usage: python benchmarks/bench_wf_load.py [-s 100 1000 3000] [--db fireworks_bench_wf_load]
+"""
+
+from __future__ import unicode_literals, print_function
+
+import argparse
+import time
+from collections import Counter
+
+from pymongo import monitoring
+
+from fireworks import Firework, FWAction, FWorker, LaunchPad, Workflow
+from fireworks.user_objects.firetasks.script_task import ScriptTask
+
+
+class CommandCounter(monitoring.CommandListener):
+
+    def __init__(self):
+        self.counts = Counter()
+        self.active = False
+
+    def started(self, event):
+        if self.active:
+            self.counts[event.command_name] += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+def setup(lp, n):
+    lp.reset('', require_password=False, max_reset_wo_password=10)
+    root = Firework(ScriptTask.from_str('echo "root"'))
+    children = [Firework(ScriptTask.from_str('echo "{}"'.format(i)), parents=root)
+                for i in range(n - 1)]
+    lp.add_wf(Workflow([root] + children))
+    fworker = FWorker()
+    while True:
+        checked_out = lp.checkout_fws(fworker, 500, ['.'] * 500, host='localhost', ip='127.0.0.1')
+        if not checked_out:
+            break
+        lp.complete_launches([(launch_id, FWAction(), 'COMPLETED')
+                              for _, launch_id in checked_out])
+
+
+def per_firework(lp, fw_id):
+    links_dict = lp.workflows.find_one({'nodes': fw_id})
+    fws = map(lp.get_fw_by_id, links_dict["nodes"])
+    return Workflow(fws, links_dict['links'], links_dict['name'], links_dict['metadata'],
+                    links_dict['created_on'], links_dict['updated_on'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument('-s', '--sizes', nargs='+', type=int, default=[100, 1000, 3000])
+    parser.add_argument('--db', default='fireworks_bench_wf_load')
+    args = parser.parse_args()
+
+    counter = CommandCounter()
+    monitoring.register(counter)
+    lp = LaunchPad(name=args.db, strm_lvl='ERROR')
+    print("{:>14} {:>8} {:>10} {:>8}".format("mode", "fws", "secs", "ops"))
+    for n in args.sizes:
+        setup(lp, n)
+        for mode, load in [("bulk", lp.get_wf_by_fw_id), ("per-firework",
+                                                         lambda fw_id: per_firework(lp, fw_id))]:
+            counter.counts.clear()
+            counter.active = True
+            t0 = time.time()
+            wf = load(1)
+            secs = time.time() - t0
+            counter.active = False
+            assert len(wf.fws) == n
+            print("{:>14} {:>8} {:>10.3f} {:>8}".format(mode, n, secs, sum(counter.counts.values())))
+    lp.connection.drop_database(args.db)
+
+
+if __name__ == '__main__':
+    main()
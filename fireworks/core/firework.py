@@ -16,7 +16,7 @@ This module contains some of the most central FireWorks classes:
         a job completes.
 """
 
-from collections import defaultdict, OrderedDict
+from collections import defaultdict, deque, OrderedDict
 import abc
 from datetime import datetime
 import os
@@ -54,6 +54,11 @@ class FiretaskBase(defaultdict, FWSerializable):
     # Specify required parameters with class variable. Consistency will be checked upon init.
     required_params = []
 
+    # Directory in which the Firetask runs, set by the Rocket before calling run_task. Firetasks
+    # should resolve relative paths against it rather than the current directory, which is shared
+    # by all the Rockets running in threads of the same process (rlaunch rapidfire --nthreads).
+    launch_dir = None
+
     def __init__(self, *args, **kwargs):
         dict.__init__(self, *args, **kwargs)
 
@@ -231,6 +236,9 @@ class Firework(FWSerializable):
 
         self._state = state
 
+        # the document this Firework was loaded from, if any (see to_db_update)
+        self._db_dict = None
+
     @property
     def state(self):
         """
@@ -306,6 +314,24 @@ class Firework(FWSerializable):
         m_dict['state'] = self.state
         return m_dict
 
+    def to_db_update(self):
+        """
+        Return a Mongo update with only the fields of to_db_dict() that differ from the document
+        the Firework was loaded from or last written as (e.g. state, launches). The spec is
+        compared per key, so spec changes are sent as patches. The update is assumed to be written,
+        so later calls only return the changes made after this one.
+
+        Returns:
+            dict: the update document (empty if nothing changed), or None if the Firework was not
+                loaded from the database and the whole document must be written.
+        """
+        if self._db_dict is None:
+            return None
+        m_dict = self.to_db_dict()
+        m_update = get_db_update(self._db_dict, m_dict)
+        self._db_dict = m_dict
+        return m_update
+
     @classmethod
     @recursive_deserialize
     def from_dict(cls, m_dict):
@@ -324,12 +350,45 @@ class Firework(FWSerializable):
         return 'Firework object: (id: %i , name: %s)' % (self.fw_id, self.fw_name)
 
 
+def get_db_update(old_dict, new_dict):
+    """
+    Compute the Mongo update that turns a stored Firework document into a new one. Top-level
+    fields are $set when they differ, spec keys are $set or $unset individually.
+
+    Args:
+        old_dict (dict): the document as stored in the database
+        new_dict (dict): the new document, e.g. from Firework.to_db_dict()
+
+    Returns:
+        dict: update document with $set and/or $unset, empty if nothing changed
+    """
+    m_set, m_unset = {}, {}
+    for k, v in new_dict.items():
+        if k == 'spec' and isinstance(old_dict.get(k), dict):
+            old_spec = old_dict[k]
+            for sk, sv in v.items():
+                if sk not in old_spec or old_spec[sk] != sv:
+                    m_set['spec.{}'.format(sk)] = sv
+            for sk in old_spec:
+                if sk not in v:
+                    m_unset['spec.{}'.format(sk)] = ''
+        elif k not in old_dict or old_dict[k] != v:
+            m_set[k] = v
+    m_update = {}
+    if m_set:
+        m_update['$set'] = m_set
+    if m_unset:
+        m_update['$unset'] = m_unset
+    return m_update
+
+
 class Tracker(FWSerializable, object):
     """
     A Tracker monitors a file and returns the last N lines for updating the Launch object.
     """
 
     MAX_TRACKER_LINES = 1000
+    ZIPPED_EXTENSIONS = ('.BZ2', '.GZ', '.Z', '.XZ', '.LZMA')  # files that are read with zopen
 
     def __init__(self, filename, nlines=TRACKER_LINES, content='', allow_zipped=False):
         """
@@ -346,11 +405,20 @@ class Tracker(FWSerializable, object):
         self.nlines = nlines
         self.content = content
         self.allow_zipped = allow_zipped
+        # state of the tracked file when the content was read: inode, size, modification time,
+        # and offset of the first line of the content
+        self.inode = None
+        self.size = None
+        self.mtime = None
+        self.offset = None
 
     def track_file(self, launch_dir=None):
         """
         Reads the monitored file and returns back the last N lines
 
+        Uncompressed files are read incrementally: the file is not read if it did not change since
+        the previous call, and otherwise only the bytes after the previous content are read.
+
         Args:
             launch_dir (str): directory where job was launched in case of relative filename
 
@@ -360,28 +428,78 @@ class Tracker(FWSerializable, object):
         m_file = self.filename
         if launch_dir and not os.path.isabs(self.filename):
             m_file = os.path.join(launch_dir, m_file)
-        lines = []
         if self.allow_zipped:
             m_file = zpath(m_file)
-        if os.path.exists(m_file):
+        if not os.path.exists(m_file):
+            return self.content
+        if os.path.splitext(m_file)[1].upper() in self.ZIPPED_EXTENSIONS:
+            lines = []
             with zopen(m_file, "rt") as f:
                 for l in reverse_readline(f):
-                    lines.append(l)
+                    lines.append(l.rstrip('\r\n'))
                     if len(lines) == self.nlines:
                         break
             self.content = '\n'.join(reversed(lines))
+            return self.content
+
+        stat = os.stat(m_file)
+        # inodes are stored as strings, as they might not fit in a BSON integer
+        inode = str(stat.st_ino)
+        if (inode, stat.st_size, stat.st_mtime) == (self.inode, self.size, self.mtime):
+            return self.content
+        start = 0
+        if inode == self.inode and self.offset is not None and stat.st_size >= self.size:
+            # the file was appended to, the lines before the previous content are not needed
+            start = self.offset
+        end = stat.st_size
+        with open(m_file, 'rb') as f:
+            pos, data = self._read_tail(f, start, end)
+            old = self.content.encode('utf-8')
+            if start and pos == start and not (data.startswith(old) and
+                                               data[len(old):len(old) + 1] in (b'', b'\n')):
+                # the file was replaced by another one with the same inode
+                pos, data = self._read_tail(f, 0, end)
+        lines = data.split(b'\n')
+        if lines[-1] == b'':
+            lines.pop()
+        lines = lines[-self.nlines:] if self.nlines else []
+        self.offset = end - len(b'\n'.join(lines)) - (1 if data.endswith(b'\n') else 0)
+        self.inode, self.size, self.mtime = inode, end, stat.st_mtime
+        self.content = '\n'.join(l.decode('utf-8', 'replace').rstrip('\r') for l in lines)
         return self.content
 
+    def _read_tail(self, f, start, end):
+        """
+        Reads f backwards from end until nlines full lines are found, or until start.
+
+        Returns:
+            (int, bytes): the offset from which f was read, and the bytes read
+        """
+        pos, data = end, b''
+        while pos > start and data.count(b'\n') <= self.nlines:
+            step = min(8192, pos - start)
+            pos -= step
+            f.seek(pos)
+            data = f.read(step) + data
+        return pos, data
+
     def to_dict(self):
         m_dict = {'filename': self.filename, 'nlines': self.nlines, 'allow_zipped': self.allow_zipped}
         if self.content:
             m_dict['content'] = self.content
+        if self.inode is not None:
+            m_dict.update(inode=self.inode, size=self.size, mtime=self.mtime, offset=self.offset)
         return m_dict
 
     @classmethod
     def from_dict(cls, m_dict):
-        return Tracker(m_dict['filename'], m_dict['nlines'], m_dict.get('content', ''),
-                       m_dict.get('allow_zipped', False))
+        tracker = Tracker(m_dict['filename'], m_dict['nlines'], m_dict.get('content', ''),
+                          m_dict.get('allow_zipped', False))
+        tracker.inode = m_dict.get('inode')
+        tracker.size = m_dict.get('size')
+        tracker.mtime = m_dict.get('mtime')
+        tracker.offset = m_dict.get('offset')
+        return tracker
 
     def __str__(self):
         return '### Filename: {}\n{}'.format(self.filename, self.content)
@@ -393,7 +511,7 @@ class Launch(FWSerializable, object):
     """
 
     def __init__(self, state, launch_dir, fworker=None, host=None, ip=None, trackers=None,
-                 action=None, state_history=None, launch_id=None, fw_id=None):
+                 action=None, state_history=None, launch_id=None, fw_id=None, active=True):
         """
         Args:
             state (str): the state of the Launch (e.g. RUNNING, COMPLETED)
@@ -406,6 +524,8 @@ class Launch(FWSerializable, object):
             state_history ([dict]): a history of all states of the Launch and when they occurred
             launch_id (int): launch_id set by the LaunchPad
             fw_id (int): id of the Firework this Launch is running
+            active (bool): False if the Launch is no longer in the launches of any Firework
+                (e.g. archived by a rerun), see LaunchPad.mark_active_launches
         """
         if state not in Firework.STATE_RANKS:
             raise ValueError("Invalid launch state: {}".format(state))
@@ -419,6 +539,7 @@ class Launch(FWSerializable, object):
         self.state = state
         self.launch_id = launch_id
         self.fw_id = fw_id
+        self.active = active
 
     def touch_history(self, update_time=None, checkpoint=None):
         """
@@ -539,6 +660,9 @@ class Launch(FWSerializable, object):
         m_d['runtime_secs'] = self.runtime_secs
         if self.reservedtime_secs:
             m_d['reservedtime_secs'] = self.reservedtime_secs
+        if not self.active:
+            # only the inactive launches have the field, see LaunchPad.mark_active_launches
+            m_d['active'] = False
         return m_d
 
     @classmethod
@@ -549,7 +673,8 @@ class Launch(FWSerializable, object):
         trackers = [Tracker.from_dict(f) for f in m_dict['trackers']] if m_dict.get('trackers') else None
         return Launch(m_dict['state'], m_dict['launch_dir'], fworker,
                       m_dict['host'], m_dict['ip'], trackers, action,
-                      m_dict['state_history'], m_dict['launch_id'], m_dict['fw_id'])
+                      m_dict['state_history'], m_dict['launch_id'], m_dict['fw_id'],
+                      m_dict.get('active', True))
 
     def _update_state_history(self, state):
         """
@@ -599,49 +724,211 @@ class Workflow(FWSerializable):
 
     class Links(dict, FWSerializable):
         """
-        An inner class for storing the DAG links between FireWorks
+        An inner class for storing the DAG links between FireWorks.
+
+        Besides the parent -> children mapping, the Links keep an index of the parents of each
+        node, the set of nodes and the root/leaf ids. The index is updated incrementally by every
+        mutating method, so the children lists must not be modified in place; use add_link(),
+        remove_link() or item assignment instead. The mutating methods also record which entries
+        changed, see to_db_update().
         """
 
         def __init__(self, *args, **kwargs):
-            super(Workflow.Links, self).__init__(*args, **kwargs)
-
-            for k, v in list(self.items()):
+            super(Workflow.Links, self).__init__()
+            self._parent_links = {}
+            self._nodes = set()
+            self._roots = OrderedDict()
+            self._leaves = OrderedDict()
+            self._changed_links = set()
+            self._changed_parent_links = set()
+            self._nodes_changed = False
+
+            links = dict(*args, **kwargs)
+            for k, v in list(links.items()):
                 if not isinstance(v, (list, tuple)):
-                    self[k] = [v]  # v must be list
+                    links[k] = [v]  # v must be list
 
-                self[k] = [x.fw_id if hasattr(x, "fw_id") else x for x in self[k]]
+                links[k] = [x.fw_id if hasattr(x, "fw_id") else x for x in links[k]]
 
                 if not isinstance(k, int):
                     if hasattr(k, "fw_id"):  # maybe it's a String?
-                        self[k.fw_id] = self[k]
+                        links[k.fw_id] = links[k]
                     else:  # maybe it's a String?
                         try:
-                            self[int(k)] = self[k]  # k must be int
+                            links[int(k)] = links[k]  # k must be int
                         except:
                             pass  # garbage input
-                    del self[k]
+                    del links[k]
+
+            for k, v in links.items():
+                self[k] = v
+
+        def __setitem__(self, parent, children):
+            children = list(children)
+            if dict.__contains__(self, parent):
+                for child in dict.__getitem__(self, parent):
+                    self._unindex_link(parent, child)
+            dict.__setitem__(self, parent, children)
+            self._changed_links.add(parent)
+            self._add_node(parent)
+            if parent not in self._parent_links:
+                self._roots[parent] = True
+            for child in children:
+                self._index_link(parent, child)
+            if children:
+                self._leaves.pop(parent, None)
+            else:
+                self._leaves[parent] = True
+
+        def __delitem__(self, parent):
+            for child in dict.__getitem__(self, parent):
+                self._unindex_link(parent, child)
+            dict.__delitem__(self, parent)
+            self._changed_links.add(parent)
+            self._roots.pop(parent, None)
+            self._leaves.pop(parent, None)
+            if parent not in self._parent_links:
+                self._remove_node(parent)
+
+        def pop(self, parent, *default):
+            if parent in self:
+                children = self[parent]
+                del self[parent]
+                return children
+            if default:
+                return default[0]
+            raise KeyError(parent)
+
+        def popitem(self):
+            parent, children = dict.popitem(self)
+            dict.__setitem__(self, parent, children)
+            del self[parent]
+            return parent, children
+
+        def setdefault(self, parent, children=None):
+            if parent not in self:
+                self[parent] = children if children is not None else []
+            return self[parent]
+
+        def update(self, *args, **kwargs):
+            for parent, children in dict(*args, **kwargs).items():
+                self[parent] = children
+
+        def clear(self):
+            self._changed_links.update(self)
+            self._changed_parent_links.update(self._parent_links)
+            self._nodes_changed = self._nodes_changed or bool(self._nodes)
+            dict.clear(self)
+            self._parent_links.clear()
+            self._nodes.clear()
+            self._roots.clear()
+            self._leaves.clear()
+
+        def add_link(self, parent, child):
+            """
+            Add child to the children of parent (which must already be in the Links).
+
+            Args:
+                parent (int): parent fw_id
+                child (int): child fw_id
+            """
+            dict.__getitem__(self, parent).append(child)
+            self._changed_links.add(parent)
+            self._index_link(parent, child)
+            self._leaves.pop(parent, None)
+
+        def remove_link(self, parent, child):
+            """
+            Remove child from the children of parent.
+
+            Args:
+                parent (int): parent fw_id
+                child (int): child fw_id
+            """
+            children = dict.__getitem__(self, parent)
+            children.remove(child)
+            self._changed_links.add(parent)
+            self._unindex_link(parent, child)
+            if not children:
+                self._leaves[parent] = True
+
+        def reassign_ids(self, old_new):
+            """
+            Rename nodes in place. Only the renamed nodes and their parents are touched.
+
+            Args:
+                old_new (dict): mapping between old and new fw_ids
+            """
+            old_new = {old: new for old, new in old_new.items() if old != new and old in self._nodes}
+            if not old_new:
+                return
+            affected = set(old for old in old_new if old in self)
+            for old in old_new:
+                affected.update(self._parent_links.get(old, []))
+            entries = [(parent, self[parent]) for parent in sorted(affected)]
+            for parent, _ in entries:
+                del self[parent]
+            for parent, children in entries:
+                self[old_new.get(parent, parent)] = [old_new.get(c, c) for c in children]
+
+        def _index_link(self, parent, child):
+            self._parent_links.setdefault(child, []).append(parent)
+            self._changed_parent_links.add(child)
+            self._add_node(child)
+            self._roots.pop(child, None)
+
+        def _unindex_link(self, parent, child):
+            parents = self._parent_links[child]
+            parents.remove(parent)
+            self._changed_parent_links.add(child)
+            if not parents:
+                del self._parent_links[child]
+                if dict.__contains__(self, child):
+                    self._roots[child] = True
+                else:
+                    self._remove_node(child)
+
+        def _add_node(self, fw_id):
+            if fw_id not in self._nodes:
+                self._nodes.add(fw_id)
+                self._nodes_changed = True
+
+        def _remove_node(self, fw_id):
+            if fw_id in self._nodes:
+                self._nodes.discard(fw_id)
+                self._nodes_changed = True
+
+        def _clear_changes(self):
+            """
+            Forget the recorded changes, e.g. once the Links have been written to the database.
+            """
+            self._changed_links.clear()
+            self._changed_parent_links.clear()
+            self._nodes_changed = False
 
         @property
         def nodes(self):
             """ Return list of all nodes"""
-            allnodes = list(self.keys())
-            for v in self.values():
-                allnodes.extend(v)
-            return list(set(allnodes))
+            return list(self._nodes)
 
         @property
         def parent_links(self):
             """
             Return a dict of child and its parents.
 
-            Note: if performance of parent_links becomes an issue, override delitem/setitem to
-            update parent_links
+            Note: this is the incrementally maintained index itself, do not modify it.
             """
-            child_parents = defaultdict(list)
-            for (parent, children) in self.items():
-                for child in children:
-                    child_parents[child].append(parent)
-            return dict(child_parents)
+            return self._parent_links
+
+        @property
+        def root_ids(self):
+            """ Return list of nodes without parents"""
+            return list(self._roots)
+
+        @property
+        def leaf_ids(self):
+            """ Return list of nodes without children"""
+            return list(self._leaves)
 
         def to_dict(self):
             """
@@ -665,6 +952,29 @@ class Workflow(FWSerializable):
                 'nodes': self.nodes}
             return m_dict
 
+        def to_db_update(self):
+            """
+            Convert the entries changed since the last _clear_changes() to Mongo update paths.
+
+            Returns:
+                (dict, dict): the paths to $set and to $unset, or None if the set of nodes
+                    changed and the whole document must be rewritten.
+            """
+            if self._nodes_changed:
+                return None
+            m_set, m_unset = {}, {}
+            for k in self._changed_links:
+                if k in self:
+                    m_set['links.{}'.format(k)] = self[k]
+                else:
+                    m_unset['links.{}'.format(k)] = ''
+            for k in self._changed_parent_links:
+                if k in self._parent_links:
+                    m_set['parent_links.{}'.format(k)] = self._parent_links[k]
+                else:
+                    m_unset['parent_links.{}'.format(k)] = ''
+            return m_set, m_unset
+
         @classmethod
         def from_dict(cls, m_dict):
             return Workflow.Links(m_dict)
@@ -718,7 +1028,7 @@ class Workflow(FWSerializable):
                         "FW_id: {} defines a dependent link to FW_id: {}, but the latter was not "
                         "added to the workflow!".format(fw.fw_id, pfw.fw_id))
                 if fw.fw_id not in self.links[pfw.fw_id]:
-                    self.links[pfw.fw_id].append(fw.fw_id)
+                    self.links.add_link(pfw.fw_id, fw.fw_id)
 
         self.name = name
 
@@ -741,6 +1051,9 @@ class Workflow(FWSerializable):
         else:
             self.fw_states = {key: self.id_fw[key].state for key in self.id_fw}
 
+        # ids whose fw_states entry changed since the last _clear_changes(), see to_db_update()
+        self._changed_fw_states = set(self.fw_states)
+
     @property
     def fws(self):
         """
@@ -757,7 +1070,7 @@ class Workflow(FWSerializable):
         m_state = 'READY'
         #states = [fw.state for fw in self.fws]
         states = self.fw_states.values()
-        leaf_fw_ids = self.leaf_fw_ids  # to save recalculating this
+        leaf_fw_ids = set(self.leaf_fw_ids)  # to save recalculating this
 
         leaf_states = (self.fw_states[fw_id] for fw_id in leaf_fw_ids)
         if all(s == 'COMPLETED' for s in leaf_states):
@@ -817,7 +1130,7 @@ class Workflow(FWSerializable):
         if action.defuse_children:
             for cfid in self.links[fw_id]:
                 self.id_fw[cfid].state = 'DEFUSED'
-                self.fw_states[cfid] = 'DEFUSED'
+                self._set_fw_state(cfid, 'DEFUSED')
                 updated_ids.append(cfid)
 
         # defuse workflow
@@ -825,7 +1138,7 @@ class Workflow(FWSerializable):
             for fw_id in self.links.nodes:
                 if self.id_fw[fw_id].state not in ['FIZZLED', 'COMPLETED']:
                     self.id_fw[fw_id].state = 'DEFUSED'
-                    self.fw_states[fw_id] = 'DEFUSED'
+                    self._set_fw_state(fw_id, 'DEFUSED')
                     updated_ids.append(fw_id)
 
         # add detour FireWorks. This should be done *before* additions
@@ -850,7 +1163,8 @@ class Workflow(FWSerializable):
 
     def rerun_fw(self, fw_id, updated_ids=None):
         """
-        Archives the launches of a Firework so that it can be re-run.
+        Archives the launches of a Firework so that it can be re-run. Any children that are not
+        WAITING are re-run as well; each Firework is visited at most once.
 
         Args:
             fw_id (int): id of firework to tbe rerun
@@ -861,18 +1175,22 @@ class Workflow(FWSerializable):
         """
 
         updated_ids = updated_ids if updated_ids else set()
-        m_fw = self.id_fw[fw_id]
-        m_fw._rerun()
-        updated_ids.add(fw_id)
-
-        # refresh the states of the current fw before rerunning the children
-        # so that they get the correct state of the parent.
-        updated_ids.union(self.refresh(fw_id, updated_ids))
-
-        # re-run all the children
-        for child_id in self.links[fw_id]:
-            if self.id_fw[child_id].state != 'WAITING':
-                updated_ids = updated_ids.union(self.rerun_fw(child_id, updated_ids))
+        rerun_ids = deque([fw_id])
+        visited = {fw_id}
+        while rerun_ids:
+            m_fw_id = rerun_ids.popleft()
+            self.id_fw[m_fw_id]._rerun()
+            updated_ids.add(m_fw_id)
+
+            # refresh the states of the current fw before rerunning the children
+            # so that they get the correct state of the parent.
+            self.refresh(m_fw_id, updated_ids)
+
+            # re-run all the children
+            for child_id in self.links[m_fw_id]:
+                if child_id not in visited and self.id_fw[child_id].state != 'WAITING':
+                    visited.add(child_id)
+                    rerun_ids.append(child_id)
 
         return updated_ids
 
@@ -930,7 +1248,7 @@ class Workflow(FWSerializable):
 
         for fw_id in fw_ids:
             for root_id in root_ids:
-                self.links[fw_id].append(root_id)  # add the root id as my child
+                self.links.add_link(fw_id, root_id)  # add the root id as my child
                 if pull_spec_mods:  # re-apply some actions of the parent
                     m_fw = self.id_fw[fw_id]  # get the parent FW
                     m_launch = self._get_representative_launch(m_fw)  # get Launch of parent
@@ -945,7 +1263,7 @@ class Workflow(FWSerializable):
 
         # set the FW state variable for all new fw ids to be WAITING
         for new_fw in new_wf.fws:
-            self.fw_states[new_fw.fw_id] = 'WAITING'  # this should get updated by refresh() below
+            self._set_fw_state(new_fw.fw_id, 'WAITING')  # this should get updated by refresh() below
 
         for new_fw in new_wf.fws:
             updated_ids = self.refresh(new_fw.fw_id, set(updated_ids))
@@ -956,6 +1274,9 @@ class Workflow(FWSerializable):
         """
         Refreshes the state of a Firework and any affected children.
 
+        The affected part of the DAG is refreshed with a worklist in topological order, so that
+        each Firework is visited at most once, after all of its affected parents.
+
         Args:
             fw_id (int): id of the Firework on which to perform the refresh
             updated_ids ([int])
@@ -966,13 +1287,80 @@ class Workflow(FWSerializable):
         # these are the fw_ids to re-enter into the database
         updated_ids = updated_ids if updated_ids else set()
 
+        # collect the Fireworks that may be affected, i.e. the children of every Firework that
+        # can become COMPLETED or FIZZLED, and count how many collected parents each one has
+        n_parents = {fw_id: 0}
+        expanded = set()
+        stack = [fw_id]
+        while stack:
+            m_fw_id = stack.pop()
+            if self._may_finish(m_fw_id):
+                expanded.add(m_fw_id)
+                for child_id in self.links[m_fw_id]:
+                    if child_id not in n_parents:
+                        n_parents[child_id] = 0
+                        stack.append(child_id)
+                    n_parents[child_id] += 1
+
+        # refresh them once all their collected parents have been refreshed
+        triggered = {fw_id}
+        worklist = deque([fw_id])
+        while worklist:
+            m_fw_id = worklist.popleft()
+            finished = m_fw_id in triggered and self._refresh_fw(m_fw_id, updated_ids)
+
+            # refresh all the children that could possibly now be READY to run
+            if finished:
+                triggered.update(self.links[m_fw_id])
+            for child_id in self.links[m_fw_id]:
+                if child_id not in n_parents:
+                    # e.g. Fireworks that were just added by the FWAction
+                    if finished:
+                        n_parents[child_id] = 0
+                        worklist.append(child_id)
+                elif m_fw_id in expanded:
+                    n_parents[child_id] -= 1
+                    if n_parents[child_id] == 0:
+                        worklist.append(child_id)
+
+        return updated_ids
+
+    def _may_finish(self, fw_id):
+        """
+        Internal method to check whether a refresh could move a Firework to COMPLETED or FIZZLED,
+        i.e. whether its children need to be refreshed after it.
+
+        Args:
+            fw_id (int)
+
+        Returns:
+            bool
+        """
+        fw = self.id_fw[fw_id]
+        if fw.state in ['DEFUSED', 'ARCHIVED', 'PAUSED']:
+            return False
+        m_launch = self._get_representative_launch(fw)
+        return bool(m_launch and m_launch.state in ['COMPLETED', 'FIZZLED'] and
+                    m_launch.state != fw.state)
+
+    def _refresh_fw(self, fw_id, updated_ids):
+        """
+        Internal method to refresh the state of a single Firework (but not of its children).
+
+        Args:
+            fw_id (int): id of the Firework on which to perform the refresh
+            updated_ids (set(int)): updated in place with the Firework ids that were updated
+
+        Returns:
+            bool: True if the Firework moved to COMPLETED or FIZZLED
+        """
         fw = self.id_fw[fw_id]
         prev_state = fw.state
 
         # if we're paused, defused or archived, just skip altogether
         if fw.state == 'DEFUSED' or fw.state == 'ARCHIVED' or fw.state == 'PAUSED':
-            self.fw_states[fw_id] = fw.state
-            return updated_ids
+            self._set_fw_state(fw_id, fw.state)
+            return False
 
         completed_parent_states = ['COMPLETED']
         if fw.spec.get('_allow_fizzled_parents'):
@@ -1000,23 +1388,19 @@ class Workflow(FWSerializable):
 
         fw.state = m_state
         # Brings self.fw_states in sync with fw_states in db
-        self.fw_states[fw_id] = m_state
-
-        if m_state != prev_state:
-            updated_ids.add(fw_id)
+        self._set_fw_state(fw_id, m_state)
+        self.updated_on = datetime.utcnow()
 
-            if m_state == 'COMPLETED':
-                updated_ids = updated_ids.union(self.apply_action(m_action, fw.fw_id))
+        if m_state == prev_state:
+            return False
 
-            # refresh all the children that could possibly now be READY to run
-            # note that "FIZZLED" is for _allow_fizzled_parents children
-            if m_state in ['COMPLETED', 'FIZZLED']:
-                for child_id in self.links[fw_id]:
-                    updated_ids = updated_ids.union(self.refresh(child_id, updated_ids))
+        updated_ids.add(fw_id)
 
-        self.updated_on = datetime.utcnow()
+        if m_state == 'COMPLETED':
+            updated_ids.update(self.apply_action(m_action, fw.fw_id))
 
-        return updated_ids
+        # note that "FIZZLED" is for _allow_fizzled_parents children
+        return m_state in ['COMPLETED', 'FIZZLED']
 
     @property
     def root_fw_ids(self):
@@ -1026,10 +1410,7 @@ class Workflow(FWSerializable):
         Returns:
             [int]: Firework ids of root FWs
         """
-        all_ids = set(self.links.nodes)
-        child_ids = set(self.links.parent_links.keys())
-        root_ids = all_ids.difference(child_ids)
-        return list(root_ids)
+        return self.links.root_ids
 
     @property
     def leaf_fw_ids(self):
@@ -1039,11 +1420,7 @@ class Workflow(FWSerializable):
         Returns:
             [int]: Firework ids of leaf FWs
         """
-        leaf_ids = []
-        for id, children in self.links.items():
-            if len(children) == 0:
-                leaf_ids.append(id)
-        return leaf_ids
+        return self.links.leaf_ids
 
     def _reassign_ids(self, old_new):
         """
@@ -1052,6 +1429,9 @@ class Workflow(FWSerializable):
         Args:
             old_new (dict)
         """
+        if all(old == new for old, new in old_new.items()):
+            return
+
         # update id_fw
         new_id_fw = {}
         for (fwid, fws) in self.id_fw.items():
@@ -1059,16 +1439,14 @@ class Workflow(FWSerializable):
         self.id_fw = new_id_fw
 
         # update the Links
-        new_l = {}
-        for (parent, children) in self.links.items():
-            new_l[old_new.get(parent, parent)] = [old_new.get(child, child) for child in children]
-        self.links = Workflow.Links(new_l)
+        self.links.reassign_ids(old_new)
 
         # update the states
         new_fw_states = {}
         for (fwid, fw_state) in self.fw_states.items():
             new_fw_states[old_new.get(fwid, fwid)] = fw_state
         self.fw_states = new_fw_states
+        self._changed_fw_states = set(new_fw_states)
 
     def to_dict(self):
         return {'fws': [f.to_dict() for f in self.id_fw.values()],
@@ -1088,6 +1466,51 @@ class Workflow(FWSerializable):
         m_dict['fw_states'] = dict([(str(k), v) for (k, v) in self.fw_states.items()])
         return m_dict
 
+    def to_db_update(self):
+        """
+        Return a Mongo update document for the fw_states and links that changed since the
+        Workflow was loaded (see _clear_changes), along with the workflow state.
+
+        Returns:
+            dict: the update document, or None if the structure of the Workflow changed (e.g.
+                Fireworks were added or renumbered) and the whole document must be replaced.
+        """
+        links_update = self.links.to_db_update()
+        if links_update is None:
+            return None
+        m_set, m_unset = links_update
+        for fw_id in self._changed_fw_states:
+            if fw_id in self.fw_states:
+                m_set['fw_states.{}'.format(fw_id)] = self.fw_states[fw_id]
+            else:
+                m_unset['fw_states.{}'.format(fw_id)] = ''
+        m_set['state'] = self.state
+        m_set['updated_on'] = self.updated_on
+        m_update = {'$set': m_set}
+        if m_unset:
+            m_update['$unset'] = m_unset
+        return m_update
+
+    def _clear_changes(self):
+        """
+        Internal method to mark the Workflow as in sync with the database, e.g. after loading
+        it or writing it.
+        """
+        self._changed_fw_states.clear()
+        self.links._clear_changes()
+
+    def _set_fw_state(self, fw_id, state):
+        """
+        Internal method to update fw_states and record the change for to_db_update().
+
+        Args:
+            fw_id (int)
+            state (str)
+        """
+        if self.fw_states.get(fw_id) != state:
+            self.fw_states[fw_id] = state
+            self._changed_fw_states.add(fw_id)
+
     def to_display_dict(self):
         m_dict = self.to_db_dict()
         nodes = sorted(m_dict['nodes'])
@@ -1176,6 +1599,7 @@ class Workflow(FWSerializable):
         for fw in self.fws:
             fw.state = 'WAITING'
         self.fw_states = {key: self.id_fw[key].state for key in self.id_fw}
+        self._changed_fw_states = set(self.fw_states)
 
     @classmethod
     def from_dict(cls, m_dict):
@@ -1256,6 +1680,7 @@ class Workflow(FWSerializable):
 
         new_wf = Workflow.from_dict(wf_dict)
         self.fw_states = new_wf.fw_states
+        self._changed_fw_states = set(new_wf.fw_states)
         self.id_fw = new_wf.id_fw
         self.links = new_wf.links
 
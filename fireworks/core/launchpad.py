@@ -16,23 +16,27 @@ import random
 import time
 import traceback
 import shutil
+import socket
+import threading
+import uuid
 import gridfs
 from collections import OrderedDict, defaultdict
-from itertools import chain
+from itertools import chain, islice
 from tqdm import tqdm
 from bson import ObjectId
 
-from pymongo import MongoClient
-from pymongo import DESCENDING, ASCENDING
-from pymongo.errors import DocumentTooLarge
+from pymongo import DESCENDING, ASCENDING, DeleteMany, ReplaceOne, ReturnDocument, UpdateMany, \
+    UpdateOne
+from pymongo.errors import BulkWriteError, CollectionInvalid, DocumentTooLarge, OperationFailure
 from monty.serialization import loadfn
 
 from fireworks.fw_config import LAUNCHPAD_LOC, SORT_FWS, RESERVATION_EXPIRATION_SECS, \
     RUN_EXPIRATION_SECS, MAINTAIN_INTERVAL, WFLOCK_EXPIRATION_SECS, WFLOCK_EXPIRATION_KILL, \
-    MONGO_SOCKET_TIMEOUT_MS, GRIDFS_FALLBACK_COLLECTION
+    WFLOCK_LEASE_SECS, WFLOCK_POLL_MAX_SECS, ID_BLOCK_SIZE, REFRESHER_INTERVAL, MONGO_SOCKET_TIMEOUT_MS, \
+    GRIDFS_FALLBACK_COLLECTION, MAINTAIN_OVERLAP_SECS, MAINTAIN_METRICS_MAX, RAPIDFIRE_POLL_SECS
 from fireworks.utilities.fw_serializers import FWSerializable, reconstitute_dates
-from fireworks.core.firework import Firework, Launch, Workflow, FWAction, Tracker
-from fireworks.utilities.fw_utilities import get_fw_logger
+from fireworks.core.firework import Firework, Launch, Workflow, FWAction, Tracker, get_db_update
+from fireworks.utilities.fw_utilities import get_fw_logger, get_mongo_client
 from fireworks.utilities.fw_serializers import recursive_dict
 
 
@@ -54,13 +58,42 @@ class LockedWorkflowError(ValueError):
     pass
 
 
+# Launches that are no longer in the launches of any firework (e.g. archived by a rerun) have
+# active: False; the field is absent from the other launches, so that launch documents written
+# whole by a new Launch object are active. A Launch read from the database keeps the flag.
+ACTIVE_LAUNCH = {'$ne': False}
+
+# fields of the fireworks kept in the ready queue, enough to match FWorker queries and sort them
+READY_QUEUE_FIELDS = ('fw_id', 'created_on', 'spec._fworker', 'spec._category', 'spec._priority')
+
+# new workflow state after checking out one of its Fireworks, by new Firework state: a list of
+# (current workflow states, new workflow state), see LaunchPad._set_checkout_wf_state
+CHECKOUT_WF_STATES = {
+    'RUNNING': [(['RUNNING', 'READY', 'RESERVED'], 'RUNNING')],
+    'RESERVED': [(['RUNNING'], 'RUNNING'), (['READY', 'RESERVED'], 'RESERVED')]}
+
+
 class WFLock(object):
     """
     Lock a Workflow, i.e. for performing update operations
     Raises a LockedWorkflowError if the lock couldn't be acquired withing expire_secs and kill==False.
     Calling functions are responsible for handling the error in order to avoid database inconsistencies.
+
+    The lock is a lease: the workflow document gets a 'locked' field with the id of the owner and
+    an expiration time. The lease is renewed in the background while the lock is held, so a lock
+    left behind by a crashed process can be taken over once it expires. Waiting for the lock is
+    counted in the 'lock_stats' field of the workflow (acquisitions, retries, wait_secs and
+    takeovers).
+
+    A waiting WFLock retries as soon as the lock is released: if the MongoDB server supports change
+    streams, it watches the workflow for the release by any process. Otherwise, only the releases
+    by the same process wake it up, and it retries with an exponential backoff up to
+    WFLOCK_POLL_MAX_SECS, which also covers the expiration of a lease.
     """
 
+    # notifies waiting WFLocks of this process when a lock is released
+    _released = threading.Condition()
+
     def __init__(self, lp, fw_id, expire_secs=WFLOCK_EXPIRATION_SECS, kill=WFLOCK_EXPIRATION_KILL):
         """
         Args:
@@ -73,37 +106,219 @@ class WFLock(object):
         self.fw_id = fw_id
         self.expire_secs = expire_secs
         self.kill = kill
+        self.lease_secs = WFLOCK_LEASE_SECS
+        self.owner = '{}-{}-{}'.format(socket.gethostname(), os.getpid(), uuid.uuid4().hex)
+
+        # contention metrics of the last acquisition
+        self.wait_secs = 0
+        self.retries = 0
+        self.takeover = False
+
+        self._stop_renewal = None
+        self._renewal = None
 
     def __enter__(self):
-        ctr = 0
-        waiting_time = 0
+        start = time.time()
         # acquire lock
-        links_dict = self.lp.workflows.find_one_and_update({'nodes': self.fw_id,
-                                                            'locked': {"$exists": False}},
-                                                           {'$set': {'locked': True}})
-        # could not acquire lock b/c WF is already locked for writing
-        while not links_dict:
-            ctr += 1
-            time_incr = ctr/10.0+random.random()/100.0
-            time.sleep(time_incr)  # wait a bit for lock to free up
-            waiting_time += time_incr
-            if waiting_time > self.expire_secs:  # too much time waiting, expire lock
-                wf = self.lp.workflows.find_one({'nodes': self.fw_id})
-                if not wf:
-                    raise ValueError("Could not find workflow in database: {}".format(self.fw_id))
-                if self.kill:  # force lock acquisition
-                    self.lp.m_logger.warning('FORCIBLY ACQUIRING LOCK, WF: {}'.format(self.fw_id))
-                    links_dict = self.lp.workflows.find_one_and_update({'nodes': self.fw_id},
-                                                                       {'$set': {'locked': True}})
-                else:  # throw error if we don't want to force lock acquisition
-                    raise LockedWorkflowError("Could not get workflow - LOCKED: {}".format(self.fw_id))
-            else:
-                # retry lock
-                links_dict = self.lp.workflows.find_one_and_update(
-                    {'nodes': self.fw_id, 'locked': {"$exists": False}}, {'$set': {'locked': True}})
+        links_dict = self._acquire(start)
+        stream = None
+        try:
+            # could not acquire lock b/c WF is already locked for writing
+            while not links_dict:
+                self.retries += 1
+                if time.time() - start > self.expire_secs:  # too much time waiting, expire lock
+                    wf = self.lp.workflows.find_one({'nodes': self.fw_id})
+                    if not wf:
+                        raise ValueError("Could not find workflow in database: {}".format(
+                            self.fw_id))
+                    if self.kill:  # force lock acquisition
+                        self.lp.m_logger.warning('FORCIBLY ACQUIRING LOCK, WF: {}'.format(
+                            self.fw_id))
+                        links_dict = self._acquire(start, force=True)
+                    else:  # throw error if we don't want to force lock acquisition
+                        raise LockedWorkflowError("Could not get workflow - LOCKED: {}".format(
+                            self.fw_id))
+                elif stream is None and self.retries == 1 and self.lp._change_streams is not False:
+                    stream = self._watch_release()
+                    # the stream only reports later releases, so retry once after opening it
+                    links_dict = self._acquire(start)
+                else:
+                    # wait for a release or for the backoff, then retry lock
+                    delay = min(WFLOCK_POLL_MAX_SECS, 0.01 * 2 ** min(self.retries, 16))
+                    delay *= 0.5 + random.random()
+                    if stream is not None:
+                        stream = self._wait_for_release(stream, delay)
+                    else:
+                        with WFLock._released:
+                            WFLock._released.wait(delay)
+                    links_dict = self._acquire(start)
+        finally:
+            if stream is not None:
+                stream.close()
+
+        self.takeover = 'locked' in links_dict
+        if self.takeover:
+            self.lp.m_logger.info('Took over expired lock of WF: {}'.format(self.fw_id))
+            self.lp.workflows.update_one({'nodes': self.fw_id, 'locked.owner': self.owner},
+                                         {'$inc': {'lock_stats.takeovers': 1}})
+        self.lp.m_logger.debug('Acquired lock of WF: {} after {:.3f}s and {} retries'.format(
+            self.fw_id, self.wait_secs, self.retries))
+        self._start_renewal()
+        return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        self.lp.workflows.find_one_and_update({"nodes": self.fw_id}, {"$unset": {"locked": True}})
+        self._stop_renewal.set()
+        # a renewal in flight must not reach the server after the release
+        self._renewal.join()
+        # only release the lock if it was not taken over in the meantime
+        result = self.lp.workflows.update_one({'nodes': self.fw_id, 'locked.owner': self.owner},
+                                              {'$unset': {'locked': True}})
+        if not result.matched_count:
+            self.lp.m_logger.warning('Lost lock of WF: {} before releasing it'.format(self.fw_id))
+        with WFLock._released:
+            WFLock._released.notify_all()
+
+    def _acquire(self, start, force=False):
+        """
+        Internal method to try to take the lock once.
+
+        Args:
+            start (float): time at which the waiting started
+            force (bool): take the lock even if it is held by someone else
+
+        Returns:
+            dict: the workflow document before locking (only the 'locked' field), or None if the
+                lock is held by someone else.
+        """
+        now = datetime.datetime.utcnow()
+        query = {'nodes': self.fw_id}
+        if not force:
+            query['$or'] = [{'locked': {'$exists': False}}, {'locked.expires': {'$lt': now}}]
+        self.wait_secs = time.time() - start
+        update = {'$set': {'locked': self._lease(now)},
+                  '$inc': {'lock_stats.acquisitions': 1, 'lock_stats.retries': self.retries,
+                           'lock_stats.wait_secs': self.wait_secs}}
+        return self.lp.workflows.find_one_and_update(query, update, projection={'locked': 1})
+
+    def _watch_release(self):
+        """
+        Internal method to watch the releases of the lock of the workflow by any process.
+
+        Returns:
+            ChangeStream: the stream of releases, or None if change streams are not supported
+        """
+        wf = self.lp.workflows.find_one({'nodes': self.fw_id}, {'_id': 1})
+        if not wf:
+            return None
+        pipeline = [{'$match': {'operationType': 'update', 'documentKey._id': wf['_id'],
+                                'updateDescription.removedFields': 'locked'}}]
+        try:
+            stream = self.lp.workflows.watch(pipeline, max_await_time_ms=100)
+        except (OperationFailure, NotImplementedError):
+            self.lp.m_logger.debug('Change streams are not supported, polling for the lock of '
+                                   'WF: {}'.format(self.fw_id))
+            self.lp._change_streams = False
+            return None
+        self.lp._change_streams = True
+        return stream
+
+    def _wait_for_release(self, stream, timeout):
+        """
+        Internal method to wait for a release of the lock reported by the change stream.
+
+        Args:
+            stream (ChangeStream): from _watch_release
+            timeout (float): max number of seconds to wait
+
+        Returns:
+            ChangeStream: the stream, or None if it failed and was closed
+        """
+        deadline = time.time() + timeout
+        try:
+            while time.time() < deadline:
+                if stream.try_next() is not None:
+                    break
+        except (OperationFailure, NotImplementedError) as e:
+            self.lp.m_logger.warning('Change stream failed ({}), polling for the lock of '
+                                     'WF: {}'.format(e, self.fw_id))
+            stream.close()
+            return None
+        return stream
+
+    def _lease(self, now):
+        return {'owner': self.owner,
+                'expires': now + datetime.timedelta(seconds=self.lease_secs)}
+
+    def _start_renewal(self):
+        """
+        Internal method to renew the lease in a background thread until the lock is released.
+        """
+        self._stop_renewal = threading.Event()
+
+        def renew():
+            while not self._stop_renewal.wait(self.lease_secs / 3.0):
+                result = self.lp.workflows.update_one(
+                    {'nodes': self.fw_id, 'locked.owner': self.owner},
+                    {'$set': {'locked': self._lease(datetime.datetime.utcnow())}})
+                if not result.matched_count:
+                    self.lp.m_logger.warning('Lost lock of WF: {}'.format(self.fw_id))
+                    break
+
+        self._renewal = threading.Thread(target=renew)
+        self._renewal.daemon = True
+        self._renewal.start()
+
+
+class IdBlockAllocator(object):
+    """
+    Hands out the ids of one counter of the fw_id_assigner document (next_fw_id or
+    next_launch_id) from blocks of ids leased from the database, so that most ids are allocated
+    without a database round trip. The ids stay unique across processes, but are not consecutive
+    anymore when several processes allocate ids, and the unused ids of a block are skipped.
+    """
+
+    def __init__(self, coll, field, block_size):
+        """
+        Args:
+            coll (Collection): the fw_id_assigner collection
+            field (str): the counter, 'next_fw_id' or 'next_launch_id'
+            block_size (int): number of ids leased at once
+        """
+        self.coll = coll
+        self.field = field
+        self.block_size = block_size
+        self._next = self._end = 0
+        self._lock = threading.Lock()
+
+    def get(self, quantity=1):
+        """
+        Args:
+            quantity (int): number of consecutive ids
+
+        Returns:
+            int: the first id of the range
+        """
+        with self._lock:
+            if self._end - self._next >= quantity:
+                first_id = self._next
+                self._next += quantity
+                return first_id
+            if quantity >= self.block_size:
+                # a large range is leased on its own, the current block is kept
+                return self._lease(quantity)
+            first_id = self._lease(self.block_size)
+            self._next, self._end = first_id + quantity, first_id + self.block_size
+            return first_id
+
+    def clear(self):
+        """
+        Forget the current block, e.g. after the counters were restarted.
+        """
+        with self._lock:
+            self._next = self._end = 0
+
+    def _lease(self, quantity):
+        return self.coll.find_one_and_update({}, {'$inc': {self.field: quantity}})[self.field]
 
 
 class LaunchPad(FWSerializable):
@@ -114,7 +329,8 @@ class LaunchPad(FWSerializable):
     def __init__(self, host=None, port=None, name=None, username=None, password=None,
                  logdir=None, strm_lvl=None, user_indices=None, wf_user_indices=None, ssl=False,
                  ssl_ca_certs=None, ssl_certfile=None, ssl_keyfile=None, ssl_pem_passphrase=None,
-                 authsource=None, uri_mode=False):
+                 authsource=None, uri_mode=False, defer_refresh=False, ready_queue=False,
+                 mongoclient_kwargs=None):
         """
         Args:
             host (str): hostname. If uri_mode is True, a MongoDB connection string URI (https://docs.mongodb.com/manual/reference/connection-string/) can be used instead of the remaining options below.
@@ -133,6 +349,14 @@ class LaunchPad(FWSerializable):
             ssl_pem_passphrase (str): passphrase for the client private key
             authsource (str): authsource parameter for MongoDB authentication; defaults to "name" (i.e., db name) if not set
             uri_mode (bool): if set True, all Mongo connection parameters occur through a MongoDB URI string (set as the host).
+            defer_refresh (bool): if set True, completed launches are queued for a refresher (see
+                refresh_queued_wfs) instead of refreshing their workflow right away.
+            ready_queue (bool): if set True, the READY fireworks are also kept in a small
+                'ready_fws' collection, from which the fireworks are checked out (see
+                rebuild_ready_queue). All the LaunchPads of a database should use the same setting.
+            mongoclient_kwargs (dict): other keyword arguments of the MongoClient, e.g.
+                {"maxPoolSize": 10}. The LaunchPads of a process with the same connection
+                parameters share a single MongoClient.
         """
 
         self.host = host if (host or uri_mode) else "localhost"
@@ -147,6 +371,9 @@ class LaunchPad(FWSerializable):
         self.ssl_pem_passphrase = ssl_pem_passphrase
         self.authsource = authsource or self.name
         self.uri_mode = uri_mode
+        self.defer_refresh = defer_refresh
+        self.ready_queue = ready_queue
+        self.mongoclient_kwargs = mongoclient_kwargs or {}
 
         # set up logger
         self.logdir = logdir
@@ -158,19 +385,21 @@ class LaunchPad(FWSerializable):
 
         # get connection
         if uri_mode:
-            self.connection = MongoClient(host)
+            self.connection = get_mongo_client(host, **self.mongoclient_kwargs)
             dbname = host.split('/')[-1].split('?')[0]  # parse URI to extract dbname
             self.db = self.connection[dbname]
         else:
-            self.connection = MongoClient(self.host, self.port, ssl=self.ssl,
-                                          ssl_ca_certs=self.ssl_ca_certs,
-                                          ssl_certfile=self.ssl_certfile,
-                                          ssl_keyfile=self.ssl_keyfile,
-                                          ssl_pem_passphrase=self.ssl_pem_passphrase,
-                                          socketTimeoutMS=MONGO_SOCKET_TIMEOUT_MS,
-                                          username=self.username,
-                                          password=self.password,
-                                          authSource=self.authsource)
+            client_kwargs = dict(ssl=self.ssl,
+                                 ssl_ca_certs=self.ssl_ca_certs,
+                                 ssl_certfile=self.ssl_certfile,
+                                 ssl_keyfile=self.ssl_keyfile,
+                                 ssl_pem_passphrase=self.ssl_pem_passphrase,
+                                 socketTimeoutMS=MONGO_SOCKET_TIMEOUT_MS,
+                                 username=self.username,
+                                 password=self.password,
+                                 authSource=self.authsource)
+            client_kwargs.update(self.mongoclient_kwargs)
+            self.connection = get_mongo_client(self.host, self.port, **client_kwargs)
             self.db = self.connection[self.name]
 
         self.fireworks = self.db.fireworks
@@ -178,10 +407,21 @@ class LaunchPad(FWSerializable):
         self.offline_runs = self.db.offline_runs
         self.fw_id_assigner = self.db.fw_id_assigner
         self.workflows = self.db.workflows
+        self.refresh_events = self.db.refresh_events
+        self.ready_fws = self.db.ready_fws
+        self.maintenance = self.db.maintenance
+        self.maintenance_metrics = self.db.maintenance_metrics
+        self.fw_id_allocator = IdBlockAllocator(self.fw_id_assigner, 'next_fw_id', ID_BLOCK_SIZE)
+        self.launch_id_allocator = IdBlockAllocator(self.fw_id_assigner, 'next_launch_id',
+                                                    ID_BLOCK_SIZE)
         if GRIDFS_FALLBACK_COLLECTION:
             self.gridfs_fallback = gridfs.GridFS(self.db, GRIDFS_FALLBACK_COLLECTION)
         else:
             self.gridfs_fallback = None
+        # whether the server supports change streams (unknown until first used)
+        self._change_streams = None
+        # whether the indexes of the ready queue were created by this LaunchPad
+        self._ready_queue_indexed = False
 
         self.backup_launch_data = {}
         self.backup_fw_data = {}
@@ -206,7 +446,10 @@ class LaunchPad(FWSerializable):
             'ssl_keyfile': self.ssl_keyfile,
             'ssl_pem_passphrase': self.ssl_pem_passphrase,
             'authsource': self.authsource,
-            'uri_mode': self.uri_mode}
+            'uri_mode': self.uri_mode,
+            'defer_refresh': self.defer_refresh,
+            'ready_queue': self.ready_queue,
+            'mongoclient_kwargs': self.mongoclient_kwargs}
 
     def update_spec(self, fw_ids, spec_document, mongo=False):
         """
@@ -228,6 +471,7 @@ class LaunchPad(FWSerializable):
         allowed_states = ["READY", "WAITING", "FIZZLED", "DEFUSED", "PAUSED"]
         self.fireworks.update_many({'fw_id': {"$in": fw_ids},
                                     'state': {"$in": allowed_states}}, mod_spec)
+        self._sync_ready_queue(fw_ids)
         for fw in self.fireworks.find({'fw_id': {"$in": fw_ids}, 'state': {"$nin": allowed_states}},
                                       {"fw_id": 1, "state": 1}):
             self.m_logger.warning("Cannot update spec of fw_id: {} with state: {}. "
@@ -250,10 +494,13 @@ class LaunchPad(FWSerializable):
         ssl_pem_passphrase = d.get('ssl_pem_passphrase', None)
         authsource= d.get('authsource', None)
         uri_mode = d.get('uri_mode', False)
+        defer_refresh = d.get('defer_refresh', False)
+        ready_queue = d.get('ready_queue', False)
+        mongoclient_kwargs = d.get('mongoclient_kwargs', None)
         return LaunchPad(d['host'], port, name, username, password,
                          logdir, strm_lvl, user_indices, wf_user_indices, ssl,
                          ssl_ca_certs, ssl_certfile, ssl_keyfile, ssl_pem_passphrase,
-                         authsource, uri_mode)
+                         authsource, uri_mode, defer_refresh, ready_queue, mongoclient_kwargs)
 
     @classmethod
     def auto_load(cls):
@@ -281,6 +528,10 @@ class LaunchPad(FWSerializable):
             self.launches.delete_many({})
             self.workflows.delete_many({})
             self.offline_runs.delete_many({})
+            self.refresh_events.delete_many({})
+            self.ready_fws.delete_many({})
+            self.maintenance.delete_many({})
+            self.db.drop_collection(self.maintenance_metrics.name)
             self._restart_ids(1, 1)
             if self.gridfs_fallback is not None:
                 self.db.drop_collection("{}.chunks".format(GRIDFS_FALLBACK_COLLECTION))
@@ -294,31 +545,40 @@ class LaunchPad(FWSerializable):
         else:
             raise ValueError("Invalid password! Password is today's date: {}".format(m_password))
 
-    def maintain(self, infinite=True, maintain_interval=None):
+    def maintain(self, infinite=True, maintain_interval=None, incremental=False):
         """
         Perform launchpad maintenance: detect lost runs and unreserved RESERVE launches.
 
         Args:
             infinite (bool)
             maintain_interval (seconds): sleep time
+            incremental (bool): only examine the launches that expired since the previous pass
+                and run the checks concurrently (see maintain_incremental).
         """
         maintain_interval = maintain_interval if maintain_interval else MAINTAIN_INTERVAL
 
         while True:
             self.m_logger.info('Performing maintenance on Launchpad...')
-            self.m_logger.debug('Tracking down FIZZLED jobs...')
-            fl, ff, inconsistent_fw_ids = self.detect_lostruns(fizzle=True)
-            if fl:
-                self.m_logger.info('Detected {} FIZZLED launches: {}'.format(len(fl), fl))
-                self.m_logger.info('Detected {} FIZZLED FWs: {}'.format(len(ff), ff))
-            if inconsistent_fw_ids:
-                self.m_logger.info('Detected {} FIZZLED inconsistent fireworks: {}'.format(len(inconsistent_fw_ids),
-                                                                                           inconsistent_fw_ids))
-
-            self.m_logger.debug('Tracking down stuck RESERVED jobs...')
-            ur = self.detect_unreserved(rerun=True)
-            if ur:
-                self.m_logger.info('Unreserved {} RESERVED launches: {}'.format(len(ur), ur))
+            if incremental:
+                self.maintain_incremental()
+            else:
+                self.m_logger.debug('Tracking down FIZZLED jobs...')
+                fl, ff, inconsistent_fw_ids = self.detect_lostruns(fizzle=True)
+                self._log_maintenance(fl, ff, inconsistent_fw_ids)
+
+                self.m_logger.debug('Tracking down stuck RESERVED jobs...')
+                ur = self.detect_unreserved(rerun=True)
+                self._log_maintenance(unreserved=ur)
+
+            self.m_logger.debug('Applying queued workflow refreshes...')
+            self.refresh_queued_wfs()
+
+            if self.ready_queue:
+                self.m_logger.debug('Checking the ready queue...')
+                added, removed = self.rebuild_ready_queue()
+                if added or removed:
+                    self.m_logger.info('Added {} missing and removed {} stale ready queue '
+                                       'entries'.format(added, removed))
 
             self.m_logger.info('LaunchPad was MAINTAINED.')
 
@@ -328,6 +588,115 @@ class LaunchPad(FWSerializable):
             self.m_logger.debug('Sleeping for {} secs...'.format(maintain_interval))
             time.sleep(maintain_interval)
 
+    def _log_maintenance(self, fl=(), ff=(), inconsistent_fw_ids=(), unreserved=()):
+        """
+        Internal method to log the problems found by a maintenance pass.
+        """
+        if fl:
+            self.m_logger.info('Detected {} FIZZLED launches: {}'.format(len(fl), fl))
+            self.m_logger.info('Detected {} FIZZLED FWs: {}'.format(len(ff), ff))
+        if inconsistent_fw_ids:
+            self.m_logger.info('Detected {} FIZZLED inconsistent fireworks: {}'.format(len(inconsistent_fw_ids),
+                                                                                       inconsistent_fw_ids))
+        if unreserved:
+            self.m_logger.info('Unreserved {} RESERVED launches: {}'.format(len(unreserved),
+                                                                           unreserved))
+
+    def maintain_incremental(self):
+        """
+        Perform one incremental maintenance pass. The lost run, stale reservation and
+        inconsistent firework checks run concurrently, and each one only examines the launches
+        whose expiration time (or end, for inconsistent fireworks) was crossed since the
+        previous successful pass, as recorded in the maintenance collection. The first pass
+        examines everything. The time and counts of each pass are added to the capped
+        maintenance_metrics collection.
+
+        Returns:
+            dict: the metrics of the pass
+        """
+        started = datetime.datetime.utcnow()
+        watermarks = self.maintenance.find_one({'_id': 'watermarks'}) or {}
+        new_watermarks = {
+            'lostruns': (started - datetime.timedelta(seconds=RUN_EXPIRATION_SECS)).isoformat(),
+            'unreserved': (started - datetime.timedelta(
+                seconds=RESERVATION_EXPIRATION_SECS)).isoformat(),
+            'inconsistent': started.isoformat()}
+
+        def since(check):
+            # look a bit before the previous watermark, to allow for the clocks of other hosts
+            if not watermarks.get(check):
+                return None
+            mark = reconstitute_dates(watermarks[check])
+            return (mark - datetime.timedelta(seconds=MAINTAIN_OVERLAP_SECS)).isoformat()
+
+        checks = OrderedDict([
+            ('lostruns', lambda: self._detect_lost_launches(fizzle=True,
+                                                            since=since('lostruns'))),
+            ('unreserved', lambda: self.detect_unreserved(rerun=True,
+                                                          since=since('unreserved'))),
+            # the launches fizzled by this pass are only examined by the next one, so that the
+            # refresh of their workflow is not mistaken for an inconsistency
+            ('inconsistent', lambda: self._detect_inconsistent_fws(
+                since=since('inconsistent'), until=new_watermarks['inconsistent']))])
+        results = {}
+
+        def run_check(name):
+            t0 = time.time()
+            try:
+                results[name] = {'result': checks[name]()}
+            except Exception:
+                self.m_logger.error('Maintenance check {} failed:\n{}'.format(
+                    name, traceback.format_exc()))
+                results[name] = {'error': traceback.format_exc()}
+            results[name]['secs'] = time.time() - t0
+
+        threads = [threading.Thread(target=run_check, args=(name,)) for name in checks]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        metrics = {'started_on': started, 'secs': (datetime.datetime.utcnow() - started).total_seconds(),
+                   'incremental': bool(watermarks)}
+        for name in checks:
+            metrics[name] = {'secs': results[name]['secs'],
+                             'since': since(name)}
+            if 'error' in results[name]:
+                metrics[name]['error'] = results[name]['error']
+                # examine the same launches again at the next pass
+                new_watermarks.pop(name)
+        if 'result' in results['lostruns']:
+            fl, ff = results['lostruns']['result']
+            metrics['lostruns'].update(launches=len(fl), fws=len(ff))
+            self._log_maintenance(fl, ff)
+        if 'result' in results['unreserved']:
+            metrics['unreserved']['launches'] = len(results['unreserved']['result'])
+            self._log_maintenance(unreserved=results['unreserved']['result'])
+        if 'result' in results['inconsistent']:
+            metrics['inconsistent']['fws'] = len(results['inconsistent']['result'])
+            self._log_maintenance(inconsistent_fw_ids=results['inconsistent']['result'])
+
+        if new_watermarks:
+            self.maintenance.update_one({'_id': 'watermarks'}, {'$set': new_watermarks},
+                                        upsert=True)
+        self._maintenance_metrics_coll().insert_one(dict(metrics))
+        return metrics
+
+    def _maintenance_metrics_coll(self):
+        """
+        Internal method to get the capped maintenance_metrics collection, creating it if needed.
+
+        Returns:
+            Collection
+        """
+        try:
+            # the metrics of a pass take less than 1kB
+            self.db.create_collection(self.maintenance_metrics.name, capped=True,
+                                      size=1024 * MAINTAIN_METRICS_MAX, max=MAINTAIN_METRICS_MAX)
+        except CollectionInvalid:
+            pass  # already created
+        return self.maintenance_metrics
+
     def add_wf(self, wf, reassign_all=True):
         """
         Add workflow(or firework) to the launchpad. The firework ids will be reassigned.
@@ -373,8 +742,7 @@ class LaunchPad(FWSerializable):
 
         # Initialize new firework counter, starting from the next fw id
         total_num_fws = sum([len(wf.fws) for wf in wfs])
-        new_fw_counter = self.fw_id_assigner.find_one_and_update(
-            {}, {'$inc': {'next_fw_id': total_num_fws}})['next_fw_id']
+        new_fw_counter = self.get_new_fw_id(quantity=total_num_fws)
         for wf in tqdm(wfs):
             # Reassign fw_ids and increment the counter
             old_new = dict(zip(
@@ -395,6 +763,7 @@ class LaunchPad(FWSerializable):
         self.workflows.insert_many(wf.to_db_dict() for wf in wfs)
         all_fws = chain.from_iterable(wf.fws for wf in wfs)
         self.fireworks.insert_many(fw.to_db_dict() for fw in all_fws)
+        self._sync_ready_queue([fw_id for wf in wfs for fw_id in wf.root_fw_ids])
         return None
 
     def append_wf(self, new_wf, fw_ids, detour=False, pull_spec_mods=True):
@@ -443,17 +812,71 @@ class LaunchPad(FWSerializable):
         fw_dict = self.fireworks.find_one({'fw_id': fw_id})
         if not fw_dict:
             raise ValueError('No Firework exists with id: {}'.format(fw_id))
-        # recreate launches from the launch collection
-        launches = list(self.launches.find({'launch_id': {"$in": fw_dict['launches']}}))
-        for l in launches:
-            l["action"] = get_action_from_gridfs(l.get("action"), self.gridfs_fallback)
-        fw_dict['launches'] = launches
-        launches = list(self.launches.find({'launch_id': {"$in": fw_dict['archived_launches']}}))
-        for l in launches:
-            l["action"] = get_action_from_gridfs(l.get("action"), self.gridfs_fallback)
-        fw_dict['archived_launches'] = launches
+        self._load_launches(fw_dict)
         return fw_dict
 
+    def _load_launches(self, *fw_dicts):
+        """
+        Internal method to recreate the launches and archived launches of firework dicts from the
+        launch collection, with a single query.
+
+        Args:
+            *fw_dicts (dict): firework dicts as stored in the database, updated in place. Dicts
+                without the launches (archived_launches) field are left without it.
+        """
+        launch_ids = [l_id for fw_dict in fw_dicts for k in ('launches', 'archived_launches')
+                      for l_id in fw_dict.get(k, [])]
+        launches = {}
+        if launch_ids:
+            for l in self.launches.find({'launch_id': {"$in": launch_ids}}):
+                launches[l['launch_id']] = l
+            self._load_gridfs_actions(launches.values())
+        for fw_dict in fw_dicts:
+            # fields left out by a projection are left out of the result as well
+            for k in ('launches', 'archived_launches'):
+                if k in fw_dict:
+                    fw_dict[k] = [launches[l_id] for l_id in fw_dict[k] if l_id in launches]
+
+    def _load_gridfs_actions(self, launch_dicts):
+        """
+        Internal method to replace the actions stored in GridFS (see complete_launch) by their
+        content, reading the chunks of all the actions with a single query.
+
+        Args:
+            launch_dicts ([dict]): launch dicts as stored in the database, updated in place
+        """
+        gridfs_launches = [l for l in launch_dicts if l.get('action') and 'gridfs_id' in l['action']]
+        if not gridfs_launches:
+            return
+        if self.gridfs_fallback is None:
+            for l in gridfs_launches:
+                l['action'] = get_action_from_gridfs(l['action'], self.gridfs_fallback)
+            return
+        files_ids = [ObjectId(l['action']['gridfs_id']) for l in gridfs_launches]
+        chunks = defaultdict(list)
+        for c in self.db["{}.chunks".format(GRIDFS_FALLBACK_COLLECTION)].find(
+                {'files_id': {'$in': files_ids}}, sort=[('files_id', ASCENDING), ('n', ASCENDING)]):
+            chunks[c['files_id']].append(bytes(c['data']))
+        for l, files_id in zip(gridfs_launches, files_ids):
+            l['action'] = json.loads(b''.join(chunks[files_id]).decode('utf-8'))
+
+    def _fw_from_db_dict(self, fw_dict):
+        """
+        Internal method to create a Firework from a firework dict with recreated launches.
+
+        Args:
+            fw_dict (dict): firework dict, e.g. from get_fw_dict_by_id
+
+        Returns:
+            Firework object
+        """
+        fw = Firework.from_dict(fw_dict)
+        # keep the stored form of the document so that updates can be sent as deltas
+        fw_dict['launches'] = [l['launch_id'] for l in fw_dict['launches']]
+        fw_dict['archived_launches'] = [l['launch_id'] for l in fw_dict['archived_launches']]
+        fw._db_dict = fw_dict
+        return fw
+
     def get_fw_by_id(self, fw_id):
         """
         Given a Firework id, give back a Firework object.
@@ -464,7 +887,7 @@ class LaunchPad(FWSerializable):
         Returns:
             Firework object
         """
-        return Firework.from_dict(self.get_fw_dict_by_id(fw_id))
+        return self._fw_from_db_dict(self.get_fw_dict_by_id(fw_id))
 
     def get_wf_by_fw_id(self, fw_id):
         """
@@ -479,16 +902,24 @@ class LaunchPad(FWSerializable):
         links_dict = self.workflows.find_one({'nodes': fw_id})
         if not links_dict:
             raise ValueError("Could not find a Workflow with fw_id: {}".format(fw_id))
-        fws = map(self.get_fw_by_id, links_dict["nodes"])
+        # load all the fireworks, then all their launches, at once
+        fw_dicts = {f['fw_id']: f for f in self.fireworks.find({'fw_id': {'$in': links_dict['nodes']}})}
+        for node in links_dict['nodes']:
+            if node not in fw_dicts:
+                raise ValueError('No Firework exists with id: {}'.format(node))
+        self._load_launches(*fw_dicts.values())
+        fws = [self._fw_from_db_dict(fw_dicts[node]) for node in links_dict['nodes']]
         return Workflow(fws, links_dict['links'], links_dict['name'],
                         links_dict['metadata'], links_dict['created_on'], links_dict['updated_on'])
 
-    def get_wf_by_fw_id_lzyfw(self, fw_id):
+    def get_wf_by_fw_id_lzyfw(self, fw_id, prefetch=None):
         """
         Given a FireWork id, give back the Workflow containing that FireWork.
 
         Args:
             fw_id (int)
+            prefetch ([int]): ids of Fireworks about to be refreshed; they are loaded at once with
+                their children and launches (see _prefetch_lazy_fws)
 
         Returns:
             A Workflow object
@@ -506,9 +937,55 @@ class LaunchPad(FWSerializable):
         else:
             fw_states = None
 
-        return Workflow(fws, links_dict['links'], links_dict['name'],
-                        links_dict['metadata'], links_dict['created_on'],
-                        links_dict['updated_on'], fw_states)
+        wf = Workflow(fws, links_dict['links'], links_dict['name'],
+                      links_dict['metadata'], links_dict['created_on'],
+                      links_dict['updated_on'], fw_states)
+        # the document is complete, so later updates can be written as deltas
+        if all(k in links_dict for k in ('fw_states', 'parent_links', 'nodes')):
+            wf._clear_changes()
+        if prefetch:
+            self._prefetch_lazy_fws(wf, prefetch)
+        return wf
+
+    def _prefetch_lazy_fws(self, wf, fw_ids):
+        """
+        Internal method to load the LazyFireworks that a refresh of fw_ids reads, i.e. these
+        Fireworks and their children, with one query for their partial documents and one for their
+        launches, instead of one query per Firework and launch field. The parents are left out:
+        the refresh takes their states from the fw_states of the workflow, and a fan-in child
+        would pull in its whole workflow.
+
+        Args:
+            wf (Workflow): workflow from get_wf_by_fw_id_lzyfw
+            fw_ids ([int])
+        """
+        ids = set()
+        for fw_id in fw_ids:
+            ids.add(fw_id)
+            ids.update(wf.links.get(fw_id, []))
+        lazy_fws = [wf.id_fw[i] for i in ids
+                    if isinstance(wf.id_fw.get(i), LazyFirework) and wf.id_fw[i]._fw is None]
+        if not lazy_fws:
+            return
+
+        fields = list(LazyFirework.db_fields) + list(LazyFirework.db_launch_fields)
+        docs = {d['fw_id']: d for d in self.fireworks.find(
+            {'fw_id': {'$in': [f.fw_id for f in lazy_fws]}}, projection=fields)}
+        lazy_fws = [f for f in lazy_fws if f.fw_id in docs]
+        for f in lazy_fws:
+            f._set_partial_fw(docs[f.fw_id])
+
+        launch_ids = [l_id for f in lazy_fws for name in LazyFirework.db_launch_fields
+                      for l_id in f._lids[name]]
+        launches = {}
+        if launch_ids:
+            for l in self.launches.find({'launch_id': {'$in': launch_ids}}):
+                launches[l['launch_id']] = l
+            self._load_gridfs_actions(launches.values())
+        for f in lazy_fws:
+            for name in LazyFirework.db_launch_fields:
+                f._set_launch_data(name, [launches[l_id] for l_id in f._lids[name]
+                                          if l_id in launches])
 
     def delete_wf(self, fw_id, delete_launch_dirs=False):
         """
@@ -551,6 +1028,9 @@ class LaunchPad(FWSerializable):
         self.offline_runs.delete_many({'launch_id': {"$in": launch_ids}})
         self.fireworks.delete_many({"fw_id": {"$in": fw_ids}})
         self.workflows.delete_one({'nodes': fw_id})
+        shared_ids = set(potential_launch_ids) - set(launch_ids)
+        if shared_ids:
+            self._deactivate_launches(shared_ids)
 
     def get_wf_summary_dict(self, fw_id, mode="more"):
         """
@@ -564,6 +1044,20 @@ class LaunchPad(FWSerializable):
         Returns:
             dict: information about Workflow.
         """
+        return self.get_wf_summary_dicts([fw_id], mode)[0]
+
+    def get_wf_summary_dicts(self, fw_ids, mode="more"):
+        """
+        Get the summary information of get_wf_summary_dict for many Workflows at once, with one
+        query for the workflows, one for their Fireworks and one for their launches.
+
+        Args:
+            fw_ids ([int]): Firework ids, one in each Workflow to summarize.
+            mode (str): Choose between "more", "less" and "all" in terms of quantity of information.
+
+        Returns:
+            [dict]: information about the Workflow of each Firework id, in the same order.
+        """
         wf_fields = ["state", "created_on", "name", "nodes"]
         fw_fields = ["state", "fw_id"]
         launch_fields = []
@@ -580,38 +1074,58 @@ class LaunchPad(FWSerializable):
         if mode == "all":
             wf_fields = None
 
-        wf = self.workflows.find_one({"nodes": fw_id}, projection=wf_fields)
-        fw_data = []
-        id_name_map = {}
-        launch_ids = []
-        for fw in self.fireworks.find({"fw_id": {"$in": wf["nodes"]}}, projection=fw_fields):
+        wf_by_fw_id = {}
+        for wf in self.workflows.find({"nodes": {"$in": list(fw_ids)}}, projection=wf_fields):
+            for i in wf["nodes"]:
+                wf_by_fw_id[i] = wf
+        missing = [i for i in fw_ids if i not in wf_by_fw_id]
+        if missing:
+            raise ValueError('No Workflow contains the Firework id: {}'.format(missing[0]))
+
+        wf_fws = defaultdict(list)
+        launches = {}
+        for fw in self.fireworks.find({"fw_id": {"$in": list(wf_by_fw_id)}}, projection=fw_fields):
+            wf_fws[wf_by_fw_id[fw["fw_id"]]["_id"]].append(fw)
             if launch_fields:
-                launch_ids.extend(fw["launches"])
-            fw_data.append(fw)
-            if mode != "less":
-                id_name_map[fw["fw_id"]] = "%s--%d" % (fw["name"], fw["fw_id"])
-
-        if launch_fields:
-            launch_info = defaultdict(list)
-            for l in self.launches.find({'launch_id': {"$in": launch_ids}}, projection=launch_fields):
-                for i, fw in enumerate(fw_data):
-                    if l["launch_id"] in fw["launches"]:
-                        launch_info[i].append(l)
-            for k, v in launch_info.items():
-                fw_data[k]["launches"] = v
-
-        wf["fw"] = fw_data
-
-        # Post process the summary dict so that it "looks" better.
+                launches.update((l_id, None) for l_id in fw["launches"])
+
+        if launches:
+            for l in self.launches.find({'launch_id': {"$in": list(launches)}},
+                                        projection=launch_fields):
+                launches[l["launch_id"]] = l
+
+        return [self._wf_summary_dict(dict(wf_by_fw_id[i]), wf_fws[wf_by_fw_id[i]["_id"]],
+                                      launches, mode) for i in fw_ids]
+
+    @staticmethod
+    def _wf_summary_dict(wf, fw_data, launches, mode):
+        """
+        Internal method to post process the summary dict of get_wf_summary_dicts so that it
+        "looks" better.
+
+        Args:
+            wf (dict): the workflow document, updated in place
+            fw_data ([dict]): the firework documents of the workflow
+            launches (dict): the launch documents of the fireworks, by launch id
+            mode (str): "more", "less", "all" or "reservations"
+
+        Returns:
+            dict: information about Workflow.
+        """
+        if mode != "less":
+            fw_data = [dict(fw, launches=[launches[l_id] for l_id in fw["launches"]
+                                          if launches.get(l_id)]) for fw in fw_data]
+            id_name_map = {fw["fw_id"]: "%s--%d" % (fw["name"], fw["fw_id"]) for fw in fw_data}
+
         if mode == "less":
             wf["states_list"] = "-".join([fw["state"][:3] if fw["state"].startswith("R")
-                                          else fw["state"][0] for fw in wf["fw"]])
+                                          else fw["state"][0] for fw in fw_data])
             del wf["nodes"]
 
         if mode == "more" or mode == "all":
             wf["states"] = OrderedDict()
             wf["launch_dirs"] = OrderedDict()
-            for fw in wf["fw"]:
+            for fw in fw_data:
                 k = "%s--%d" % (fw["name"], fw["fw_id"])
                 wf["states"][k] = fw["state"]
                 wf["launch_dirs"][k] = [l["launch_dir"] for l in fw["launches"]]
@@ -625,14 +1139,13 @@ class LaunchPad(FWSerializable):
         if mode == "reservations":
             wf["states"] = OrderedDict()
             wf["launches"] = OrderedDict()
-            for fw in wf["fw"]:
+            for fw in fw_data:
                 k = "%s--%d" % (fw["name"], fw["fw_id"])
                 wf["states"][k] = fw["state"]
                 wf["launches"][k] = fw["launches"]
             del wf["nodes"]
 
         del wf["_id"]
-        del wf["fw"]
 
         return wf
 
@@ -654,8 +1167,7 @@ class LaunchPad(FWSerializable):
         coll = "launches" if launches_mode else "fireworks"
         criteria = query if query else {}
         if launches_mode:
-            lids = self._get_active_launch_ids()
-            criteria["launch_id"] = {"$in": lids}
+            criteria["active"] = ACTIVE_LAUNCH
 
         if count_only:
             if limit:
@@ -666,6 +1178,52 @@ class LaunchPad(FWSerializable):
             fw_ids.append(fw["fw_id"])
         return fw_ids
 
+    def iter_fws(self, query=None, projection=None, sort=None, limit=0, batch_size=1000):
+        """
+        Iterate over the firework dicts that match a query, with their launches recreated from the
+        launch collection. The fireworks are read with a single cursor and the launches of every
+        batch of fireworks with one query, so that the memory used does not grow with the number
+        of results.
+
+        Args:
+            query (dict): representing a Mongo query
+            projection (dict or list): the fields to return, in Pymongo format. The launches
+                (archived launches) are only loaded if the "launches" ("archived_launches") field
+                is returned.
+            sort [(str,str)]: sort argument in Pymongo format
+            limit (int): limit the results
+            batch_size (int): number of fireworks joined with their launches at once
+
+        Returns:
+            generator of dict: firework dicts, as returned by get_fw_dict_by_id
+        """
+        cursor = self.fireworks.find(query if query else {}, projection, sort=sort)
+        for batch in _batches(cursor.limit(limit).batch_size(batch_size), batch_size):
+            self._load_launches(*batch)
+            for fw_dict in batch:
+                yield fw_dict
+
+    def iter_launches(self, query=None, projection=None, sort=None, limit=0, batch_size=1000):
+        """
+        Iterate over the launch dicts that match a query, with the actions stored in GridFS (see
+        complete_launch) loaded for every batch of launches at once.
+
+        Args:
+            query (dict): representing a Mongo query
+            projection (dict or list): the fields to return, in Pymongo format
+            sort [(str,str)]: sort argument in Pymongo format
+            limit (int): limit the results
+            batch_size (int): number of launches read at once
+
+        Returns:
+            generator of dict: launch dicts
+        """
+        cursor = self.launches.find(query if query else {}, projection, sort=sort)
+        for batch in _batches(cursor.limit(limit).batch_size(batch_size), batch_size):
+            self._load_gridfs_actions(batch)
+            for launch_dict in batch:
+                yield launch_dict
+
     def get_wf_ids(self, query=None, sort=None, limit=0, count_only=False):
         """
         Return one fw id for all workflows that match a query.
@@ -709,21 +1267,84 @@ class LaunchPad(FWSerializable):
             # check first to see if any are READY
             return True
         else:
-            # retrieve all [RUNNING/RESERVED] fireworks
-            q = fworker.query if fworker else {}
+            # join the [RUNNING/RESERVED] fireworks with their workflows on the server, with one
+            # result per workflow
+            q = dict(fworker.query) if fworker else {}
             q.update({'state': {'$in': ['RUNNING', 'RESERVED']}})
-            active = self.get_fw_ids(q)
+            pipeline = [{'$match': q},
+                        {'$project': {'fw_id': 1}},
+                        {'$lookup': {'from': self.workflows.name, 'localField': 'fw_id',
+                                     'foreignField': 'nodes', 'as': 'wf'}},
+                        {'$unwind': '$wf'},
+                        {'$group': {'_id': '$wf._id', 'fw_ids': {'$push': '$fw_id'},
+                                    'links': {'$first': '$wf.links'},
+                                    'fw_states': {'$first': '$wf.fw_states'}}}]
             # then check if they have WAITING children
-            for fw_id in active:
-                children = self.get_wf_by_fw_id_lzyfw(fw_id).links[fw_id]
-                if any(self.get_fw_dict_by_id(i)['state'] == 'WAITING'
-                       for i in children):
+            for wf in self.fireworks.aggregate(pipeline):
+                children = [i for fw_id in wf['fw_ids'] for i in wf['links'].get(str(fw_id), [])]
+                if not children:
+                    continue
+                if wf.get('fw_states') is not None:
+                    if any(wf['fw_states'].get(str(i)) == 'WAITING' for i in children):
+                        return True
+                # workflows written before fw_states existed
+                elif self.fireworks.find_one({'fw_id': {'$in': children}, 'state': 'WAITING'},
+                                             {'fw_id': 1}):
                     return True
 
             # if we loop over all active and none have WAITING children
             # there is no future work to do
             return False
 
+    def wait_for_ready(self, fworker=None, timeout=RAPIDFIRE_POLL_SECS):
+        """
+        Wait until the database contains a Firework that is ready to run, or until timeout.
+
+        If the MongoDB server supports change streams (i.e. it is a replica set, possibly of a
+        single node), the wait ends as soon as a Firework becomes READY. Otherwise, run_exists is
+        polled with exponentially increasing intervals, starting from RAPIDFIRE_POLL_SECS.
+
+        Args:
+            fworker (FWorker)
+            timeout (float): max number of seconds to wait
+
+        Returns:
+            bool: True if the database contains any FireWorks that are ready to run.
+        """
+        deadline = time.time() + timeout
+        if self._change_streams is not False:
+            pipeline = [{'$match': {'operationType': {'$in': ['insert', 'update', 'replace']},
+                                    'fullDocument.state': 'READY'}}]
+            try:
+                with self.fireworks.watch(pipeline, full_document='updateLookup',
+                                          max_await_time_ms=1000) as stream:
+                    self._change_streams = True
+                    # the stream only reports later changes, so check once after opening it
+                    if self.run_exists(fworker):
+                        return True
+                    while time.time() < deadline:
+                        # the changed Firework might not match fworker.query
+                        if stream.try_next() is not None and self.run_exists(fworker):
+                            return True
+                    return False
+            except (OperationFailure, NotImplementedError) as e:
+                if self._change_streams:
+                    self.m_logger.warning('Change stream failed ({}), polling for READY '
+                                          'FWs'.format(e))
+                else:
+                    self.m_logger.debug('Change streams are not supported, polling for READY FWs')
+                    self._change_streams = False
+
+        interval = RAPIDFIRE_POLL_SECS
+        while True:
+            if self.run_exists(fworker):
+                return True
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return False
+            time.sleep(min(interval, remaining))
+            interval *= 2
+
     def tuneup(self, bkground=True):
         """
         Database tuneup: build indexes
@@ -738,6 +1359,9 @@ class LaunchPad(FWSerializable):
         self.launches.create_index('launch_id', unique=True, background=bkground)
         self.launches.create_index('fw_id', background=bkground)
         self.launches.create_index('state_history.reservation_id', background=bkground)
+        # {'active': False} is rare, the queries on ACTIVE_LAUNCH use the indexes of their other fields
+        self.launches.create_index('active', name='active_false', background=bkground,
+                                   partialFilterExpression={'active': False})
 
         if GRIDFS_FALLBACK_COLLECTION is not None:
             files_collection = self.db["{}.files".format(GRIDFS_FALLBACK_COLLECTION)]
@@ -763,6 +1387,9 @@ class LaunchPad(FWSerializable):
                                      ("created_on", ASCENDING)], background=bkground)
         self.workflows.create_index([("state", DESCENDING), ("_id", DESCENDING)], background=bkground)
 
+        if self.ready_queue:
+            self._ensure_ready_queue_indices(bkground)
+
         if not bkground:
             self.m_logger.debug('Compacting database...')
             try:
@@ -911,6 +1538,8 @@ class LaunchPad(FWSerializable):
         self.fw_id_assigner.find_one_and_replace({'_id': -1},
                                                  {'next_fw_id': next_fw_id,
                                                   'next_launch_id': next_launch_id}, upsert=True)
+        self.fw_id_allocator.clear()
+        self.launch_id_allocator.clear()
         self.m_logger.debug(
             'RESTARTED fw_id, launch_id to ({}, {})'.format(next_fw_id, next_launch_id))
 
@@ -925,7 +1554,7 @@ class LaunchPad(FWSerializable):
         Returns:
             bool: True if the firework is unique
         """
-        if not self._steal_launches(m_fw):
+        if '_dupefinder' not in m_fw.spec or not self._steal_launches(m_fw):
             self.m_logger.debug('FW with id: {} is unique!'.format(m_fw.fw_id))
             return True
         self._upsert_fws([m_fw])  # update the DB with the new launches
@@ -959,33 +1588,190 @@ class LaunchPad(FWSerializable):
         if fw_id:
             m_query = {"fw_id": fw_id, "state": {'$in': ['READY', 'RESERVED']}}
 
+        queue_query = self._ready_queue_query(m_query) if checkout and not fw_id else None
+
         while True:
             # check out the matching firework, depending on the query set by the FWorker
-            if checkout:
+            if queue_query is not None:
+                m_fw = self._pop_ready_fw(queue_query, sortby)
+            elif checkout:
                 m_fw = self.fireworks.find_one_and_update(m_query,
                                                           {'$set': {'state': 'RESERVED',
                                                            'updated_on': datetime.datetime.utcnow()}},
-                                                          sort=sortby)
+                                                          sort=sortby,
+                                                          return_document=ReturnDocument.AFTER)
             else:
                 m_fw = self.fireworks.find_one(m_query, {'fw_id': 1, 'spec': 1}, sort=sortby)
 
             if not m_fw:
                 return None
-            m_fw = self.get_fw_by_id(m_fw['fw_id'])
+            if checkout:
+                # the reserved document is complete, only its launches need to be loaded
+                self._load_launches(m_fw)
+                m_fw = self._fw_from_db_dict(m_fw)
+            else:
+                m_fw = self.get_fw_by_id(m_fw['fw_id'])
             if self._check_fw_for_uniqueness(m_fw):
                 return m_fw
 
-    def _get_active_launch_ids(self):
+    def _ready_queue_query(self, query):
+        """
+        Internal method to translate a checkout query to the ready queue. The queue entries only
+        keep the fw_id, created_on and the _fworker, _category and _priority of the spec.
+
+        Args:
+            query (dict): query on the READY fireworks, e.g. from FWorker.query
+
+        Returns:
+            dict: the query on the ready queue, or None if the queue is not used or the query
+                involves other fields
+        """
+        if not self.ready_queue:
+            return None
+        self._ensure_ready_queue_indices()
+        m_query = dict(query)
+        m_query.pop('state', None)
+        to_check = [m_query]
+        while to_check:
+            q = to_check.pop()
+            for k, v in q.items():
+                if k in ('$or', '$and', '$nor'):
+                    to_check.extend(v)
+                elif k not in READY_QUEUE_FIELDS:
+                    return None
+        return m_query
+
+    def _ensure_ready_queue_indices(self, bkground=True):
+        """
+        Internal method to create the indexes of the ready queue, once per LaunchPad. The unique
+        fw_id index keeps concurrent syncs from queueing a firework twice, and the compound indexes
+        serve the checkout queries of FWorkers with or without a category or name.
+
+        Args:
+            bkground (bool): build the indexes in the background
+        """
+        if self._ready_queue_indexed:
+            return
+        self.ready_fws.create_index('fw_id', unique=True, background=bkground)
+        for order in (ASCENDING, DESCENDING):
+            self.ready_fws.create_index([("spec._priority", DESCENDING), ("created_on", order)],
+                                        background=bkground)
+            self.ready_fws.create_index([("spec._category", ASCENDING),
+                                         ("spec._fworker", ASCENDING),
+                                         ("spec._priority", DESCENDING), ("created_on", order)],
+                                        background=bkground)
+        self._ready_queue_indexed = True
+
+    def _pop_ready_fw(self, queue_query, sortby):
+        """
+        Internal method to reserve the first firework of the ready queue. Entries of fireworks
+        that are no longer READY (e.g. checked out by id or paused) are dropped on the way.
+
+        Args:
+            queue_query (dict): from _ready_queue_query
+            sortby (list): sort order of the checkout
+
+        Returns:
+            dict: the reserved firework document, or None if the queue is empty
+        """
+        while True:
+            entry = self.ready_fws.find_one_and_delete(queue_query, sort=sortby)
+            if not entry:
+                return None
+            m_fw = self.fireworks.find_one_and_update({'fw_id': entry['fw_id'], 'state': 'READY'},
+                                                      {'$set': {'state': 'RESERVED',
+                                                       'updated_on': datetime.datetime.utcnow()}},
+                                                      return_document=ReturnDocument.AFTER)
+            if m_fw:
+                return m_fw
+
+    def _sync_ready_queue(self, fw_ids):
         """
-        Get all the launch ids.
+        Internal method to add the READY fireworks among fw_ids to the ready queue, and remove the
+        others from it.
+
+        Args:
+            fw_ids ([int])
+        """
+        if not self.ready_queue or not fw_ids:
+            return
+        self._ensure_ready_queue_indices()
+        requests = []
+        ready = set()
+        for f in self.fireworks.find({'fw_id': {'$in': fw_ids}, 'state': 'READY'},
+                                     dict.fromkeys(READY_QUEUE_FIELDS, 1)):
+            f.pop('_id')
+            ready.add(f['fw_id'])
+            requests.append(ReplaceOne({'fw_id': f['fw_id']}, f, upsert=True))
+        gone = [fw_id for fw_id in fw_ids if fw_id not in ready]
+        if gone:
+            requests.append(DeleteMany({'fw_id': {'$in': gone}}))
+        try:
+            self.ready_fws.bulk_write(requests, ordered=False)
+        except BulkWriteError as e:
+            # a concurrent sync already queued the same firework (unique fw_id index)
+            if any(err['code'] != 11000 for err in e.details['writeErrors']) or \
+                    e.details.get('writeConcernErrors'):
+                raise
+
+    def rebuild_ready_queue(self):
+        """
+        Add the missing READY fireworks to the ready queue and remove the stale entries, e.g. after
+        enabling ready_queue on an existing database or changing the fireworks by hand.
 
         Returns:
-            list: all launch ids
+            (int, int): number of added and removed entries
+        """
+        self._ensure_ready_queue_indices()
+        ready = set(self.fireworks.distinct('fw_id', {'state': 'READY'}))
+        queued = set(self.ready_fws.distinct('fw_id'))
+        stale = list(queued - ready)
+        if stale:
+            self.ready_fws.delete_many({'fw_id': {'$in': stale}})
+        missing = list(ready - queued)
+        self._sync_ready_queue(missing)
+        return len(missing), len(stale)
+
+    def _deactivate_launches(self, launch_ids):
+        """
+        Internal method to mark the launches that are no longer in the launches of any firework
+        (e.g. archived by a rerun) as inactive, see ACTIVE_LAUNCH.
+
+        Args:
+            launch_ids ([int]): launch ids that may have been archived
+        """
+        launch_ids = list(set(launch_ids))
+        # a launch can still be active in a duplicate firework
+        active = set(self.fireworks.distinct('launches', {'launches': {'$in': launch_ids}}))
+        inactive = [l_id for l_id in launch_ids if l_id not in active]
+        if inactive:
+            self.launches.update_many({'launch_id': {'$in': inactive}, 'active': ACTIVE_LAUNCH},
+                                      {'$set': {'active': False}})
+
+    def mark_active_launches(self, batch_size=1000):
         """
-        all_launch_ids = []
-        for l in self.fireworks.find({}, {"launches": 1}):
-            all_launch_ids.extend(l['launches'])
-        return all_launch_ids
+        Set the active flag of all the launches (see ACTIVE_LAUNCH) from the launches and
+        archived launches of the fireworks. Needed once for databases created before the flag
+        existed, and safe to run again at any time.
+
+        Args:
+            batch_size (int): number of fireworks handled at once
+
+        Returns:
+            int: number of launches marked inactive
+        """
+        cursor = self.fireworks.find({}, {'launches': 1, 'archived_launches': 1})
+        for batch in _batches(cursor.batch_size(batch_size), batch_size):
+            active_ids = [l_id for fw in batch for l_id in fw.get('launches', [])]
+            if active_ids:
+                self.launches.update_many({'launch_id': {'$in': active_ids}, 'active': False},
+                                          {'$unset': {'active': ''}})
+            archived_ids = [l_id for fw in batch for l_id in fw.get('archived_launches', [])]
+            if archived_ids:
+                self._deactivate_launches(archived_ids)
+        n_inactive = self.launches.find({'active': False}, {}).count()
+        self.m_logger.info('{} launches are inactive'.format(n_inactive))
+        return n_inactive
 
     def reserve_fw(self, fworker, launch_dir, host=None, ip=None, fw_id=None):
         """
@@ -1046,43 +1832,72 @@ class LaunchPad(FWSerializable):
         """
         given the launch id, cancel the reservation and rerun the fireworks
         """
-        m_launch = self.get_launch_by_id(launch_id)
-        m_launch.state = 'READY'
-        self.launches.find_one_and_replace({'launch_id': m_launch.launch_id, "state": "RESERVED"},
-                                           m_launch.to_db_dict(), upsert=True)
+        self.cancel_reservations([launch_id])
 
-        for fw in self.fireworks.find({'launches': launch_id, 'state': 'RESERVED'}, {'fw_id': 1}):
-            self.rerun_fw(fw['fw_id'], rerun_duplicates=False)
+    def cancel_reservations(self, launch_ids):
+        """
+        Cancel the reservations of many launches and rerun their fireworks, locking and writing
+        each workflow only once.
 
-    def detect_unreserved(self, expiration_secs=RESERVATION_EXPIRATION_SECS, rerun=False):
+        Args:
+            launch_ids ([int]): launch ids
+        """
+        launch_dicts = {l['launch_id']: l for l in
+                        self.launches.find({'launch_id': {'$in': list(launch_ids)}})}
+        for launch_id in launch_ids:
+            if launch_id not in launch_dicts:
+                raise ValueError('No Launch exists with launch_id: {}'.format(launch_id))
+        self._load_gridfs_actions(launch_dicts.values())
+        requests = []
+        for launch_dict in launch_dicts.values():
+            m_launch = Launch.from_dict(launch_dict)
+            m_launch.state = 'READY'
+            requests.append(ReplaceOne({'launch_id': m_launch.launch_id, "state": "RESERVED"},
+                                       m_launch.to_db_dict()))
+        if requests:
+            self.launches.bulk_write(requests, ordered=False)
+
+        fw_ids = [fw['fw_id'] for fw in self.fireworks.find(
+            {'launches': {'$in': list(launch_ids)}, 'state': 'RESERVED'}, {'fw_id': 1})]
+        self.rerun_fws(fw_ids, rerun_duplicates=False)
+
+    def detect_unreserved(self, expiration_secs=RESERVATION_EXPIRATION_SECS, rerun=False,
+                          since=None):
         """
         Return the reserved launch ids that have not been updated for a while.
 
         Args:
             expiration_secs (seconds): time limit
             rerun (bool): if True, the expired reservations are cancelled and the fireworks rerun.
+            since (str): if set, only the reservations last updated after this time (in
+                isoformat) are examined, e.g. the cutoff time of a previous call.
 
         Returns:
             [int]: list of expired lacunh ids
         """
-        bad_launch_ids = []
         now_time = datetime.datetime.utcnow()
         cutoff_timestr = (now_time - datetime.timedelta(seconds=expiration_secs)).isoformat()
-        bad_launch_data = self.launches.find({'state': 'RESERVED',
-                                              'state_history':
-                                                  {'$elemMatch':
-                                                       {'state': 'RESERVED',
-                                                        'updated_on': {'$lte': cutoff_timestr}
-                                                        }
-                                                   }
-                                              },
-                                             {'launch_id': 1, 'fw_id': 1})
-        for ld in bad_launch_data:
-            if self.fireworks.find_one({'fw_id': ld['fw_id'], 'state': 'RESERVED'}, {'fw_id': 1}):
-                bad_launch_ids.append(ld['launch_id'])
-        if rerun:
-            for lid in bad_launch_ids:
-                self.cancel_reservation(lid)
+        updated_on = {'$lte': cutoff_timestr}
+        if since:
+            updated_on['$gt'] = since
+        # join the expired launches with their fireworks on the server
+        pipeline = [{'$match': {'state': 'RESERVED',
+                                'state_history':
+                                    {'$elemMatch':
+                                         {'state': 'RESERVED',
+                                          'updated_on': updated_on
+                                          }
+                                     }
+                                }},
+                    {'$project': {'launch_id': 1, 'fw_id': 1}},
+                    {'$lookup': {'from': self.fireworks.name, 'localField': 'fw_id',
+                                 'foreignField': 'fw_id', 'as': 'fw'}},
+                    {'$unwind': '$fw'},
+                    {'$match': {'fw.state': 'RESERVED'}},
+                    {'$project': {'_id': 0, 'launch_id': 1}}]
+        bad_launch_ids = [ld['launch_id'] for ld in self.launches.aggregate(pipeline)]
+        if rerun and bad_launch_ids:
+            self.cancel_reservations(bad_launch_ids)
         return bad_launch_ids
 
     def mark_fizzled(self, launch_id):
@@ -1117,17 +1932,44 @@ class LaunchPad(FWSerializable):
             ([int], [int], [int]): tuple of list of lost launch ids, lost firework ids and
                 inconsistent firework ids.
         """
+        lost_launch_ids, lost_fw_ids = self._detect_lost_launches(
+            expiration_secs, fizzle, rerun, max_runtime, min_runtime, query)
+        inconsistent_fw_ids = self._detect_inconsistent_fws(refresh, query)
+        return lost_launch_ids, lost_fw_ids, inconsistent_fw_ids
+
+    def _detect_lost_launches(self, expiration_secs=RUN_EXPIRATION_SECS, fizzle=False,
+                              rerun=False, max_runtime=None, min_runtime=None, query=None,
+                              since=None):
+        """
+        Internal method to detect the lost runs of detect_lostruns.
+
+        Args:
+            expiration_secs (seconds): expiration time in seconds
+            fizzle (bool): if True, mark the lost runs fizzed
+            rerun (bool): if True, mark the lost runs fizzed and rerun
+            max_runtime (seconds): maximum run time
+            min_runtime (seconds): minimum run time
+            query (dict): restrict search to FWs matching this query
+            since (str): if set, only the runs last pinged after this time (in isoformat) are
+                examined, e.g. the cutoff time of a previous call.
+
+        Returns:
+            ([int], [int]): tuple of list of lost launch ids and lost firework ids
+        """
         lost_launch_ids = []
         lost_fw_ids = []
-        potential_lost_fw_ids = []
+        potential_lost_fws = OrderedDict()
         now_time = datetime.datetime.utcnow()
         cutoff_timestr = (now_time - datetime.timedelta(seconds=expiration_secs)).isoformat()
 
+        updated_on = {'$lte': cutoff_timestr}
+        if since:
+            updated_on['$gt'] = since
         lostruns_query = {'state': 'RUNNING',
                           'state_history':
                               {'$elemMatch':
                                    {'state': 'RUNNING',
-                                    'updated_on': {'$lte': cutoff_timestr}
+                                    'updated_on': updated_on
                                     }
                                }
                           }
@@ -1137,59 +1979,113 @@ class LaunchPad(FWSerializable):
                                                               {"fw_id": 1})]
             lostruns_query["fw_id"] = {"$in": fw_ids}
 
-        bad_launch_data = self.launches.find(lostruns_query,
-                                             {'launch_id': 1, 'fw_id': 1})
-        for ld in bad_launch_data:
+        # join the expired launches with the state and launches of their fireworks on the server
+        launch_fields = {'launch_id': 1, 'fw_id': 1}
+        if max_runtime or min_runtime:
+            launch_fields['state_history'] = 1
+        pipeline = [{'$match': lostruns_query},
+                    {'$project': launch_fields},
+                    {'$lookup': {'from': self.fireworks.name, 'localField': 'fw_id',
+                                 'foreignField': 'fw_id', 'as': 'fw'}},
+                    {'$unwind': {'path': '$fw', 'preserveNullAndEmptyArrays': True}},
+                    {'$project': dict(launch_fields, **{'fw.state': 1, 'fw.launches': 1})}]
+        for ld in self.launches.aggregate(pipeline):
             bad_launch = True
             if max_runtime or min_runtime:
                 bad_launch = False
-                m_l = self.get_launch_by_id(ld['launch_id'])
-                utime = m_l._get_time('RUNNING', use_update_time=True)
-                ctime = m_l._get_time('RUNNING', use_update_time=False)
+                running = [h for h in ld['state_history'] if h['state'] == 'RUNNING'][0]
+                utime = reconstitute_dates(running['updated_on'])
+                ctime = reconstitute_dates(running['created_on'])
                 if (not max_runtime or (utime-ctime).seconds <= max_runtime) and \
                         (not min_runtime or (utime-ctime).seconds >= min_runtime):
                     bad_launch = True
             if bad_launch:
                 lost_launch_ids.append(ld['launch_id'])
-                potential_lost_fw_ids.append(ld['fw_id'])
-
-        for fw_id in potential_lost_fw_ids:  # tricky: figure out what's actually lost
-            f = self.fireworks.find_one({"fw_id": fw_id}, {"launches": 1, "state": 1})
-            # only RUNNING FireWorks can be "lost", i.e. not defused or archived
-            if f['state'] == "RUNNING":
-                l_ids = f["launches"]
-                not_lost = [x for x in l_ids if x not in lost_launch_ids]
-                if len(not_lost) == 0:  # all launches are lost - we are lost!
-                    lost_fw_ids.append(fw_id)
-                else:
-                    for l_id in not_lost:
-                        l_state = self.launches.find_one({"launch_id": l_id}, {"state": 1})['state']
-                        if Firework.STATE_RANKS[l_state] > Firework.STATE_RANKS['FIZZLED']:
-                            break
-                    else:
-                        lost_fw_ids.append(fw_id)  # all Launches not lost are anyway FIZZLED / ARCHIVED
-
-        if fizzle or rerun:
-            for lid in lost_launch_ids:
-                self.mark_fizzled(lid)
-                if rerun:
-                    fw_id = self.launches.find_one({"launch_id": lid}, {"fw_id": 1})['fw_id']
-                    if fw_id in lost_fw_ids:
-                        self.rerun_fw(fw_id)
-
-        inconsistent_fw_ids = []
-        inconsistent_query = query or {}
-        inconsistent_query['state'] = 'RUNNING'
-        running_fws = self.fireworks.find(inconsistent_query,
-                                          {'fw_id': 1, 'launches': 1})
-        for fw in running_fws:
-            if self.launches.find_one({'launch_id': {'$in': fw['launches']},
-                                       'state': {'$in': ['FIZZLED', 'COMPLETED']}}):
-                inconsistent_fw_ids.append(fw['fw_id'])
-                if refresh:
-                    self._refresh_wf(fw['fw_id'])
+                if ld.get('fw'):
+                    potential_lost_fws[ld['fw_id']] = ld['fw']
+
+        # tricky: figure out what's actually lost
+        # only RUNNING FireWorks can be "lost", i.e. not defused or archived
+        lost_launch_set = set(lost_launch_ids)
+        not_lost = {fw_id: [x for x in f["launches"] if x not in lost_launch_set]
+                    for fw_id, f in potential_lost_fws.items() if f['state'] == "RUNNING"}
+        not_lost_ids = [l_id for l_ids in not_lost.values() for l_id in l_ids]
+        l_states = {}
+        if not_lost_ids:
+            for l in self.launches.find({"launch_id": {"$in": not_lost_ids}},
+                                        {"launch_id": 1, "state": 1}):
+                l_states[l['launch_id']] = l['state']
+        for fw_id, l_ids in not_lost.items():
+            # lost if all the launches are lost, or if the others are FIZZLED / ARCHIVED anyway
+            if all(Firework.STATE_RANKS[l_states[l_id]] <= Firework.STATE_RANKS['FIZZLED']
+                   for l_id in l_ids if l_id in l_states):
+                lost_fw_ids.append(fw_id)
+
+        if (fizzle or rerun) and lost_launch_ids:
+            # one refresh per workflow for all the lost launches
+            self.complete_launches([(lid, None, 'FIZZLED') for lid in lost_launch_ids])
+            if rerun and lost_fw_ids:
+                self.rerun_fws(lost_fw_ids)
+
+        return lost_launch_ids, lost_fw_ids
+
+    def _detect_inconsistent_fws(self, refresh=False, query=None, since=None, until=None):
+        """
+        Internal method to detect the RUNNING fireworks with a FIZZLED or COMPLETED launch, for
+        detect_lostruns.
 
-        return lost_launch_ids, lost_fw_ids, inconsistent_fw_ids
+        Args:
+            refresh (bool): if True, refresh the workflow with inconsistent fireworks.
+            query (dict): restrict search to FWs matching this query
+            since (str): if set, only the fireworks with a launch that ended after this time (in
+                isoformat) are examined, e.g. the time of a previous call.
+            until (str): if set, ignore the launches that ended after this time (in isoformat),
+                e.g. while their workflow is being refreshed.
+
+        Returns:
+            [int]: inconsistent firework ids
+        """
+        if since or until:
+            # start from the recently ended launches and join their fireworks on the server
+            ended = ['FIZZLED', 'COMPLETED']
+            created_on = {}
+            if since:
+                created_on['$gt'] = since
+            if until:
+                created_on['$lte'] = until
+            launch_query = {'state': {'$in': ended},
+                            'state_history': {'$elemMatch': {'state': {'$in': ended},
+                                                             'created_on': created_on}}}
+            if query:
+                launch_query['fw_id'] = {"$in": [x["fw_id"] for x in
+                                                 self.fireworks.find(query, {"fw_id": 1})]}
+            pipeline = [{'$match': launch_query},
+                        {'$project': {'launch_id': 1, 'fw_id': 1}},
+                        {'$lookup': {'from': self.fireworks.name, 'localField': 'fw_id',
+                                     'foreignField': 'fw_id', 'as': 'fw'}},
+                        {'$unwind': '$fw'},
+                        {'$match': {'fw.state': 'RUNNING'}},
+                        {'$project': {'_id': 0, 'launch_id': 1, 'fw_id': 1, 'fw.launches': 1}}]
+            inconsistent_fw_ids = list(OrderedDict.fromkeys(
+                ld['fw_id'] for ld in self.launches.aggregate(pipeline)
+                if ld['launch_id'] in ld['fw']['launches']))
+        else:
+            # RUNNING fireworks with a FIZZLED or COMPLETED launch, joined on the server
+            inconsistent_query = query or {}
+            inconsistent_query['state'] = 'RUNNING'
+            pipeline = [{'$match': inconsistent_query},
+                        {'$project': {'fw_id': 1, 'launches': 1}},
+                        {'$unwind': '$launches'},
+                        {'$lookup': {'from': self.launches.name, 'localField': 'launches',
+                                     'foreignField': 'launch_id', 'as': 'launch'}},
+                        {'$unwind': '$launch'},
+                        {'$match': {'launch.state': {'$in': ['FIZZLED', 'COMPLETED']}}},
+                        {'$project': {'_id': 0, 'fw_id': 1}}]
+            inconsistent_fw_ids = list(OrderedDict.fromkeys(
+                fw['fw_id'] for fw in self.fireworks.aggregate(pipeline)))
+        if refresh and inconsistent_fw_ids:
+            self._refresh_wfs(inconsistent_fw_ids)
+        return inconsistent_fw_ids
 
     def set_reservation_id(self, launch_id, reservation_id):
         """
@@ -1201,7 +2097,8 @@ class LaunchPad(FWSerializable):
         """
         m_launch = self.get_launch_by_id(launch_id)
         m_launch.set_reservation_id(reservation_id)
-        self.launches.find_one_and_replace({'launch_id': launch_id}, m_launch.to_db_dict())
+        self.launches.update_one({'launch_id': launch_id},
+                                 {'$set': {'state_history': m_launch.to_db_dict()['state_history']}})
 
     def checkout_fw(self, fworker, launch_dir, fw_id=None, host=None, ip=None, state="RUNNING"):
         """
@@ -1222,56 +2119,206 @@ class LaunchPad(FWSerializable):
         m_fw = self._get_a_fw_to_run(fworker.query, fw_id=fw_id)
         if not m_fw:
             return None, None
+        launch_id = self._start_launches([m_fw], fworker, [launch_dir], host, ip, state)[0]
+        return m_fw, launch_id
 
-        # If this Launch was previously reserved, overwrite that reservation with this Launch
-        # note that adding a new Launch is problematic from a duplicate run standpoint
-        prev_reservations = [l for l in m_fw.launches if l.state == 'RESERVED']
-        reserved_launch = None if not prev_reservations else prev_reservations[0]
-        state_history = reserved_launch.state_history if reserved_launch else None
-
-        # get new launch
-        launch_id = reserved_launch.launch_id if reserved_launch else self.get_new_launch_id()
-        trackers = [Tracker.from_dict(f) for f in m_fw.spec['_trackers']] if '_trackers' in m_fw.spec else None
-        m_launch = Launch(state, launch_dir, fworker, host, ip, trackers=trackers,
-                          state_history=state_history, launch_id=launch_id, fw_id=m_fw.fw_id)
-
-        # insert the launch
-        self.launches.find_one_and_replace({'launch_id': m_launch.launch_id},
-                                           m_launch.to_db_dict(), upsert=True)
-
-        self.m_logger.debug('Created/updated Launch with launch_id: {}'.format(launch_id))
-
-        # update the firework's launches
-        if not reserved_launch:
-            # we're appending a new Firework
-            m_fw.launches.append(m_launch)
+    def checkout_fws(self, fworker, n, launch_dirs, host=None, ip=None, state="RUNNING"):
+        """
+        Checkout up to n ready fireworks at once, mark them with the given state (RESERVED or
+        RUNNING) and return them to the caller, who is responsible for running them. The fireworks
+        are reserved, and their launches created, with a handful of bulk operations.
+
+        Args:
+            fworker (FWorker): A FWorker instance
+            n (int): max number of fireworks to check out
+            launch_dirs ([str]): the dirs the FWs will be run in, at least n; the i-th checked
+                out firework gets the i-th dir
+            host (str): the host making the request (for creating the Launch objects)
+            ip (str): the ip making the request (for creating the Launch objects)
+            state (str): RESERVED or RUNNING, the fetched fireworks' state will be set to this value.
+
+        Returns:
+            [(Firework, int)]: fireworks and their new launch ids, possibly fewer than n
+        """
+        m_fws = self._get_fws_to_run(fworker.query, n)
+        if not m_fws:
+            return []
+        launch_ids = self._start_launches(m_fws, fworker, launch_dirs[:len(m_fws)], host, ip, state)
+        return list(zip(m_fws, launch_ids))
+
+    def _get_fws_to_run(self, query, n):
+        """
+        Reserve up to n ready fireworks: the candidates are found with one query and reserved with
+        one update, tagged with a token so that the fireworks that other processes reserved in
+        between are left out.
+
+        Args:
+            query (dict)
+            n (int)
+
+        Returns:
+            [Firework]: the reserved fireworks, in the checkout order of _get_a_fw_to_run
+        """
+        m_query = dict(query) if query else {}  # make a defensive copy
+        m_query['state'] = 'READY'
+        sortby = [("spec._priority", DESCENDING)]
+
+        if SORT_FWS.upper() == "FIFO":
+            sortby.append(("created_on", ASCENDING))
+        elif SORT_FWS.upper() == "FILO":
+            sortby.append(("created_on", DESCENDING))
+
+        # the candidates come from the ready queue if possible
+        queue_query = self._ready_queue_query(m_query)
+        if queue_query is not None:
+            coll, m_query = self.ready_fws, queue_query
         else:
-            # we're updating an existing launch
-            m_fw.launches = [m_launch if l.launch_id == m_launch.launch_id else l for l in m_fw.launches]
-
-        # insert the firework and refresh the workflow
-        m_fw.state = state
-        self._upsert_fws([m_fw])
-        self._refresh_wf(m_fw.fw_id)
-
-        # update any duplicated runs
-        if state == "RUNNING":
-            for fw in self.fireworks.find(
-                    {'launches': launch_id,
-                     'state': {'$in': ['WAITING', 'READY', 'RESERVED', 'FIZZLED']}}, {'fw_id': 1}):
-                fw_id = fw['fw_id']
-                fw = self.get_fw_by_id(fw_id)
-                fw.state = state
-                self._upsert_fws([fw])
-                self._refresh_wf(fw.fw_id)
+            coll = self.fireworks
 
-        # Store backup copies of the initial data for retrieval in case of failure
-        self.backup_launch_data[m_launch.launch_id] = m_launch.to_db_dict()
-        self.backup_fw_data[fw_id] = m_fw.to_db_dict()
+        m_fws = []
+        while len(m_fws) < n:
+            fw_ids = [f['fw_id'] for f in coll.find(m_query, {'fw_id': 1}, sort=sortby,
+                                                    limit=n - len(m_fws))]
+            if not fw_ids:
+                break
+            token = uuid.uuid4().hex
+            self.fireworks.update_many({'fw_id': {'$in': fw_ids}, 'state': 'READY'},
+                                       {'$set': {'state': 'RESERVED', '_checkout': token,
+                                                 'updated_on': datetime.datetime.utcnow()}})
+            if queue_query is not None:
+                # none of the candidates is READY anymore
+                self.ready_fws.delete_many({'fw_id': {'$in': fw_ids}})
+            fw_dicts = {f['fw_id']: f for f in self.fireworks.find({'_checkout': token},
+                                                                   {'_checkout': 0})}
+            if not fw_dicts:
+                continue
+            self.fireworks.update_many({'_checkout': token}, {'$unset': {'_checkout': ''}})
+
+            self._load_launches(*fw_dicts.values())
+            for fw_id in fw_ids:
+                if fw_id in fw_dicts:
+                    m_fw = self._fw_from_db_dict(fw_dicts[fw_id])
+                    if self._check_fw_for_uniqueness(m_fw):
+                        m_fws.append(m_fw)
+        return m_fws
 
-        self.m_logger.debug('{} FW with id: {}'.format(m_fw.state, m_fw.fw_id))
+    def _start_launches(self, m_fws, fworker, launch_dirs, host, ip, state):
+        """
+        Internal method to create the launches of checked out fireworks, and write the fireworks
+        and the state of their workflows.
 
-        return m_fw, launch_id
+        Args:
+            m_fws ([Firework]): fireworks reserved by _get_a_fw_to_run or _get_fws_to_run
+            fworker (FWorker)
+            launch_dirs ([str]): the dir of each firework's launch
+            host (str)
+            ip (str)
+            state (str): RESERVED or RUNNING
+
+        Returns:
+            [int]: the launch id of each firework
+        """
+        # If a Launch was previously reserved, overwrite that reservation with this Launch
+        # note that adding a new Launch is problematic from a duplicate run standpoint
+        reserved_launches = []
+        for m_fw in m_fws:
+            prev_reservations = [l for l in m_fw.launches if l.state == 'RESERVED']
+            reserved_launches.append(prev_reservations[0] if prev_reservations else None)
+
+        # get new launches, with one block of ids
+        n_new = reserved_launches.count(None)
+        first_new_id = self.get_new_launch_id(quantity=n_new) if n_new else None
+        m_launches, new_launch_dicts = [], []
+        for m_fw, launch_dir, reserved_launch in zip(m_fws, launch_dirs, reserved_launches):
+            state_history = reserved_launch.state_history if reserved_launch else None
+            if reserved_launch:
+                launch_id = reserved_launch.launch_id
+            else:
+                launch_id = first_new_id
+                first_new_id += 1
+            trackers = [Tracker.from_dict(f) for f in m_fw.spec['_trackers']] \
+                if '_trackers' in m_fw.spec else None
+            m_launch = Launch(state, launch_dir, fworker, host, ip, trackers=trackers,
+                              state_history=state_history, launch_id=launch_id,
+                              fw_id=m_fw.fw_id)
+            m_launches.append(m_launch)
+
+            # insert the launch
+            if reserved_launch:
+                self.launches.replace_one({'launch_id': m_launch.launch_id},
+                                          m_launch.to_db_dict(), upsert=True)
+            else:
+                new_launch_dicts.append(m_launch.to_db_dict())
+            self.m_logger.debug('Created/updated Launch with launch_id: {}'.format(launch_id))
+        if new_launch_dicts:
+            self.launches.insert_many(new_launch_dicts)
+
+        # update the fireworks' launches
+        prev_states = []
+        for m_fw, m_launch, reserved_launch in zip(m_fws, m_launches, reserved_launches):
+            if not reserved_launch:
+                # we're appending a new Firework
+                m_fw.launches.append(m_launch)
+            else:
+                # we're updating an existing launch
+                m_fw.launches = [m_launch if l.launch_id == m_launch.launch_id else l
+                                 for l in m_fw.launches]
+            prev_states.append(m_fw.state)
+            m_fw.state = state
+
+        # insert the fireworks and refresh the workflows
+        self._upsert_fws(list(m_fws))
+        for m_fw, prev_state in zip(m_fws, prev_states):
+            if not self._set_checkout_wf_state(m_fw.fw_id, prev_state, state):
+                self._refresh_wf(m_fw.fw_id)
+
+        for m_fw, m_launch, reserved_launch in zip(m_fws, m_launches, reserved_launches):
+            # update any duplicated runs (only a reused launch can have been stolen by duplicates)
+            if state == "RUNNING" and reserved_launch:
+                for fw in self.fireworks.find(
+                        {'launches': m_launch.launch_id,
+                         'state': {'$in': ['WAITING', 'READY', 'RESERVED', 'FIZZLED']}},
+                        {'fw_id': 1}):
+                    fw = self.get_fw_by_id(fw['fw_id'])
+                    fw.state = state
+                    self._upsert_fws([fw])
+                    self._refresh_wf(fw.fw_id)
+
+            # Store backup copies of the initial data for retrieval in case of failure
+            self.backup_launch_data[m_launch.launch_id] = m_launch.to_db_dict()
+            self.backup_fw_data[m_fw.fw_id] = m_fw.to_db_dict()
+
+            self.m_logger.debug('{} FW with id: {}'.format(m_fw.state, m_fw.fw_id))
+
+        return [l.launch_id for l in m_launches]
+
+    def _set_checkout_wf_state(self, fw_id, prev_state, state):
+        """
+        Internal method to update the workflow of a Firework that was checked out without a full
+        refresh. Moving a single Firework from READY or RESERVED to RESERVED or RUNNING does not
+        change any other Firework, and the new workflow state follows from the old one (see
+        CHECKOUT_WF_STATES), so a conditional update of the unlocked workflow document is enough.
+
+        Args:
+            fw_id (int): id of the checked out Firework
+            prev_state (str): state of the Firework before the checkout
+            state (str): new state of the Firework (RESERVED or RUNNING)
+
+        Returns:
+            bool: False if the workflow could not be updated this way and must be refreshed
+        """
+        if prev_state not in ('READY', 'RESERVED'):
+            return False
+        fw_state_key = 'fw_states.{}'.format(fw_id)
+        now = datetime.datetime.utcnow()
+        for wf_states, wf_state in CHECKOUT_WF_STATES.get(state, []):
+            result = self.workflows.update_one(
+                {'nodes': fw_id, 'locked': {'$exists': False}, 'state': {'$in': wf_states},
+                 fw_state_key: {'$in': ['READY', 'RESERVED']}},
+                {'$set': {fw_state_key: state, 'state': wf_state, 'updated_on': now}})
+            if result.matched_count:
+                return True
+        return False
 
     def change_launch_dir(self, launch_id, launch_dir):
         """
@@ -1281,9 +2328,10 @@ class LaunchPad(FWSerializable):
             launch_id (int)
             launch_dir (str): path to the new launch directory.
         """
-        m_launch = self.get_launch_by_id(launch_id)
-        m_launch.launch_dir = launch_dir
-        self.launches.find_one_and_replace({'launch_id': m_launch.launch_id}, m_launch.to_db_dict(), upsert=True)
+        result = self.launches.update_one({'launch_id': launch_id},
+                                          {'$set': {'launch_dir': launch_dir}})
+        if not result.matched_count:
+            raise ValueError('No Launch exists with launch_id: {}'.format(launch_id))
 
     def restore_backup_data(self, launch_id, fw_id):
         """
@@ -1306,12 +2354,75 @@ class LaunchPad(FWSerializable):
         Returns:
             dict: updated launch
         """
+        return self.complete_launches([(launch_id, action, state)])[0]
+
+    def complete_launches(self, launches):
+        """
+        Mark many Launches as completed at once: the launches are written with one bulk operation
+        and the workflow of each Firework is refreshed (or queued, see defer_refresh) once for all
+        of its completed Fireworks.
+
+        Args:
+            launches ([(int, FWAction, str)]): launch_id, action (can be None) and state (COMPLETED
+                or FIZZLED) of each Launch
+
+        Returns:
+            [dict]: updated launches
+        """
+        launch_ids = [launch_id for launch_id, _, _ in launches]
+        launch_dicts = {l['launch_id']: l
+                        for l in self.launches.find({'launch_id': {'$in': launch_ids}})}
+        self._load_gridfs_actions(launch_dicts.values())
+
         # update the launch data to COMPLETED, set end time, etc
-        m_launch = self.get_launch_by_id(launch_id)
-        m_launch.state = state
-        if action:
-            m_launch.action = action
+        m_launches = []
+        for launch_id, action, state in launches:
+            if launch_id not in launch_dicts:
+                raise ValueError('No Launch exists with launch_id: {}'.format(launch_id))
+            m_launch = Launch.from_dict(launch_dicts[launch_id])
+            m_launch.state = state
+            if action:
+                m_launch.action = action
+            m_launches.append(m_launch)
+
+        try:
+            self.launches.bulk_write([ReplaceOne({'launch_id': l.launch_id}, l.to_db_dict(),
+                                                 upsert=True) for l in m_launches], ordered=False)
+        except DocumentTooLarge:
+            for m_launch in m_launches:
+                self._replace_launch(m_launch)
+
+        # find all the fws that have these launches
+        fw_ids = []
+        now = datetime.datetime.utcnow()
+        events = []
+        for fw in self.fireworks.find({'launches': {'$in': launch_ids}},
+                                      {'fw_id': 1, 'launches': 1}):
+            fw_ids.append(fw['fw_id'])
+            events.extend({'fw_id': fw['fw_id'], 'launch_id': l_id, 'created_on': now}
+                          for l_id in launch_ids if l_id in fw['launches'])
+        # the launches archived while they ran lost their flag when they were replaced above
+        archived_ids = set(launch_ids) - set(e['launch_id'] for e in events)
+        if archived_ids:
+            self.launches.update_many({'launch_id': {'$in': list(archived_ids)}},
+                                      {'$set': {'active': False}})
+        if self.defer_refresh:
+            if events:
+                self.refresh_events.insert_many(events)
+        else:
+            self._refresh_wfs(fw_ids)
+
+        # change return type to dict to make return type serializable to support job packing
+        return [l.to_dict() for l in m_launches]
+
+    def _replace_launch(self, m_launch):
+        """
+        Internal method to write a launch, storing its action in GridFS if the launch document is
+        too large.
 
+        Args:
+            m_launch (Launch)
+        """
         try:
             self.launches.find_one_and_replace({'launch_id': m_launch.launch_id},
                                                m_launch.to_db_dict(), upsert=True)
@@ -1330,7 +2441,7 @@ class LaunchPad(FWSerializable):
 
             # encoding required for python2/3 compatibility.
             action_id = self.gridfs_fallback.put(json.dumps(action_dict), encoding="utf-8",
-                                                 metadata={"launch_id": launch_id})
+                                                 metadata={"launch_id": m_launch.launch_id})
             launch_db_dict["action"] = {"gridfs_id": str(action_id)}
             self.m_logger.warning("The size of the launch document was too large. Saving "
                                "the action in gridfs.")
@@ -1338,15 +2449,6 @@ class LaunchPad(FWSerializable):
             self.launches.find_one_and_replace({'launch_id': m_launch.launch_id},
                                                launch_db_dict, upsert=True)
 
-
-        # find all the fws that have this launch
-        for fw in self.fireworks.find({'launches': launch_id}, {'fw_id': 1}):
-            fw_id = fw['fw_id']
-            self._refresh_wf(fw_id)
-
-        # change return type to dict to make return type serializable to support job packing
-        return m_launch.to_dict()
-
     def ping_launch(self, launch_id, ptime=None, checkpoint=None):
         """
         Ping that a Launch is still alive: updates the 'update_on 'field of the state history of a
@@ -1356,13 +2458,38 @@ class LaunchPad(FWSerializable):
             launch_id (int)
             ptime (datetime)
         """
-        m_launch = self.get_launch_by_id(launch_id)
-        for tracker in m_launch.trackers:
-            tracker.track_file(m_launch.launch_dir)
-        m_launch.touch_history(ptime, checkpoint=checkpoint)
-        self.launches.update_one({'launch_id': launch_id, 'state': 'RUNNING'},
-                                 {'$set': {'state_history': m_launch.to_db_dict()['state_history'],
-                                           'trackers': [t.to_dict() for t in m_launch.trackers]}})
+        self.ping_launches([launch_id], ptime, checkpoint)
+
+    def ping_launches(self, launch_ids, ptime=None, checkpoint=None):
+        """
+        Ping that many RUNNING Launches are still alive. The 'updated_on' field of the RUNNING
+        entry of their state history is set with a single update, without reading the Launches.
+        Only the Launches with Trackers are read, and their Trackers are written if the content of
+        a tracked file changed.
+
+        Args:
+            launch_ids ([int])
+            ptime (datetime)
+            checkpoint (dict): checkpoint to store in the RUNNING entry of the state history
+        """
+        launch_ids = list(launch_ids)
+        if not launch_ids:
+            return
+        q = {'launch_id': {'$in': launch_ids}, 'state': 'RUNNING'}
+        touch = {'state_history.$.updated_on': ptime or datetime.datetime.utcnow()}
+        if checkpoint:
+            touch['state_history.$.checkpoint'] = checkpoint
+        requests = [UpdateMany(dict(q, **{'state_history.state': 'RUNNING'}),
+                               {'$set': recursive_dict(touch)})]
+        for l in self.launches.find(dict(q, **{'trackers.0': {'$exists': True}}),
+                                    {'launch_id': 1, 'launch_dir': 1, 'trackers': 1}):
+            trackers = [Tracker.from_dict(t) for t in l['trackers']]
+            contents = [t.content for t in trackers]
+            # only write the trackers whose content changed
+            if [t.track_file(l['launch_dir']) for t in trackers] != contents:
+                requests.append(UpdateOne({'launch_id': l['launch_id'], 'state': 'RUNNING'},
+                                          {'$set': {'trackers': [t.to_dict() for t in trackers]}}))
+        self.launches.bulk_write(requests, ordered=False)
 
     def get_new_fw_id(self, quantity=1):
         """
@@ -1373,17 +2500,21 @@ class LaunchPad(FWSerializable):
                             this then returns the *first* fw_id in that range
         """
         try:
-            return self.fw_id_assigner.find_one_and_update({}, {'$inc': {'next_fw_id': quantity}})['next_fw_id']
+            return self.fw_id_allocator.get(quantity)
         except:
             raise ValueError("Could not get next FW id! If you have not yet initialized the database,"
                              " please do so by performing a database reset (e.g., lpad reset)")
 
-    def get_new_launch_id(self):
+    def get_new_launch_id(self, quantity=1):
         """
         Checkout the next Launch id
+
+        Args:
+            quantity (int): optionally ask for many ids, otherwise defaults to 1
+                            this then returns the *first* launch_id in that range
         """
         try:
-            return self.fw_id_assigner.find_one_and_update({}, {'$inc': {'next_launch_id': 1}})['next_launch_id']
+            return self.launch_id_allocator.get(quantity)
         except:
             raise ValueError("Could not get next launch id! If you have not yet initialized the "
                              "database, please do so by performing a database reset (e.g., lpad reset)")
@@ -1417,16 +2548,36 @@ class LaunchPad(FWSerializable):
             # delete/add in bulk
             self.fireworks.delete_many({'fw_id': {'$in': used_ids}})
             self.fireworks.insert_many((fw.to_db_dict() for fw in fws))
+            self._sync_ready_queue([fw.fw_id for fw in fws if fw.state == 'READY'])
         else:
-            for fw in fws:
-                if fw.fw_id < 0:
-                    new_id = self.get_new_fw_id()
+            new_fws = [fw for fw in fws if fw.fw_id < 0]
+            if new_fws:
+                # request one block of fw_ids for all the new FWs
+                first_new_id = self.get_new_fw_id(quantity=len(new_fws))
+                for new_id, fw in enumerate(new_fws, start=first_new_id):
                     old_new[fw.fw_id] = new_id
                     fw.fw_id = new_id
 
-                self.fireworks.find_one_and_replace({'fw_id': fw.fw_id},
-                                                    fw.to_db_dict(),
-                                                    upsert=True)
+            # FWs loaded from the DB only send their changed fields, new FWs are written whole
+            requests = []
+            archived_ids = []
+            for fw in fws:
+                fw_update = fw.to_db_update()
+                if fw_update is None:
+                    m_dict = fw.to_db_dict()
+                    requests.append(ReplaceOne({'fw_id': fw.fw_id}, m_dict, upsert=True))
+                    fw._db_dict = m_dict
+                    archived_ids.extend(m_dict.get('archived_launches', []))
+                elif fw_update:
+                    requests.append(UpdateOne({'fw_id': fw.fw_id}, fw_update))
+                    archived_ids.extend(fw_update.get('$set', {}).get('archived_launches', []))
+            if requests:
+                self.fireworks.bulk_write(requests, ordered=False)
+            if archived_ids:
+                self._deactivate_launches(archived_ids)
+            # the checked out fireworks already left the ready queue
+            self._sync_ready_queue([fw.fw_id for fw in fws
+                                    if fw.state not in ('RESERVED', 'RUNNING')])
 
         return old_new
 
@@ -1501,6 +2652,69 @@ class LaunchPad(FWSerializable):
 
         return reruns
 
+    def rerun_fws(self, fw_ids, rerun_duplicates=True):
+        """
+        Rerun many fireworks, like rerun_fw without launch recovery. The fireworks are grouped
+        by workflow, so that each workflow is locked and written only once.
+
+        Args:
+            fw_ids ([int]): firework ids
+            rerun_duplicates (bool): flag for whether duplicates should be rerun
+
+        Returns:
+            [int]: list of firework ids that were rerun
+        """
+        fw_ids = list(OrderedDict.fromkeys(fw_ids))
+        m_fws = {f['fw_id']: f for f in self.fireworks.find(
+            {"fw_id": {"$in": fw_ids}}, {"fw_id": 1, "state": 1, "launches": 1,
+                                         "spec._dupefinder": 1})}
+        for fw_id in fw_ids:
+            if fw_id not in m_fws:
+                raise ValueError("FW with id: {} not found!".format(fw_id))
+
+        # detect FWs that share the same launch. Must do this before rerun
+        if rerun_duplicates:
+            dupe_launches = [l_id for f in m_fws.values() if "_dupefinder" in f.get("spec", {})
+                             for l_id in f["launches"]]
+            if dupe_launches:
+                for d in self.fireworks.find({"launches": {"$in": dupe_launches},
+                                              "fw_id": {"$nin": fw_ids}},
+                                             {"fw_id": 1, "state": 1}):
+                    self.m_logger.info("Also rerunning duplicate fw_id: {}".format(d['fw_id']))
+                    fw_ids.append(d['fw_id'])
+                    m_fws[d['fw_id']] = d
+
+        self.fireworks.update_many({"fw_id": {"$in": fw_ids}}, {"$unset": {"spec._recovery": ""}})
+
+        pending = OrderedDict()
+        for fw_id in fw_ids:
+            state = m_fws[fw_id]['state']
+            if state in ['ARCHIVED', 'DEFUSED']:
+                self.m_logger.info("Cannot rerun fw_id: {}: it is {}.".format(fw_id, state))
+            elif state == 'WAITING':
+                self.m_logger.debug("Skipping rerun fw_id: {}: it is already WAITING.".format(fw_id))
+            else:
+                pending[fw_id] = None
+
+        reruns = []
+        while pending:
+            fw_id = next(iter(pending))
+            with WFLock(self, fw_id):
+                wf = self.get_wf_by_fw_id_lzyfw(fw_id)
+                batch = [f for f in pending if f in wf.id_fw]
+                self._prefetch_lazy_fws(wf, batch)
+                updated_ids = set()
+                for f in batch:
+                    # a parent rerun earlier in the batch already reset its children
+                    if f in updated_ids and wf.id_fw[f].state == 'WAITING':
+                        continue
+                    updated_ids = wf.rerun_fw(f, updated_ids)
+                    reruns.append(f)
+                self._update_wf(wf, updated_ids)
+            for f in batch:
+                pending.pop(f)
+        return reruns
+
     def get_recovery(self, fw_id, launch_id='last'):
         """
         function to get recovery data for a given fw and launch
@@ -1530,7 +2744,7 @@ class LaunchPad(FWSerializable):
         # TODO: need a try-except here, high probability of failure if incorrect action supplied
         try:
             with WFLock(self, fw_id):
-                wf = self.get_wf_by_fw_id_lzyfw(fw_id)
+                wf = self.get_wf_by_fw_id_lzyfw(fw_id, prefetch=[fw_id])
                 updated_ids = wf.refresh(fw_id)
                 self._update_wf(wf, updated_ids)
         except LockedWorkflowError:
@@ -1548,6 +2762,108 @@ class LaunchPad(FWSerializable):
                 traceback.format_exc())
             raise RuntimeError(err_message)
 
+    def _refresh_wfs(self, fw_ids):
+        """
+        Internal method to refresh the workflows of many Fireworks. Each workflow is locked,
+        refreshed and written only once for all of its Fireworks.
+
+        Args:
+            fw_ids ([int]): the parent fw_ids - children will be refreshed
+
+        Returns:
+            [[int]]: the fw_ids refreshed together, per workflow. The Fireworks of workflows that
+                are locked by someone else are not refreshed.
+        """
+        pending = OrderedDict((fw_id, None) for fw_id in fw_ids)
+        batches = []
+        while pending:
+            fw_id = next(iter(pending))
+            try:
+                with WFLock(self, fw_id):
+                    wf = self.get_wf_by_fw_id_lzyfw(fw_id)
+                    batch = [f for f in pending if f in wf.id_fw]
+                    try:
+                        self._prefetch_lazy_fws(wf, batch)
+                        updated_ids = set()
+                        for f in batch:
+                            updated_ids = wf.refresh(f, updated_ids)
+                        self._update_wf(wf, updated_ids)
+                    except Exception:
+                        batch = None
+            except LockedWorkflowError:
+                self.m_logger.info("fw_id {} locked. Can't refresh!".format(fw_id))
+                pending.pop(fw_id)
+                continue
+            if batch is None:
+                # refresh the Fireworks one by one, so that the errors are handled as usual
+                self.m_logger.warning('Could not refresh the WF of fw_id {} in one pass, '
+                                      'refreshing its Fireworks one by one'.format(fw_id))
+                self._refresh_wf(fw_id)
+                batch = [fw_id]
+            for f in batch:
+                pending.pop(f)
+            batches.append(batch)
+        return batches
+
+    def refresh_queued_wfs(self, max_events=None):
+        """
+        Apply the completion events queued by complete_launch when defer_refresh is set. The events
+        are grouped by workflow, and each workflow is locked, refreshed and written only once for
+        all of its events. Events of workflows that are locked by someone else are kept for the
+        next call.
+
+        Args:
+            max_events (int): max number of events to apply, oldest first (default: all)
+
+        Returns:
+            dict: statistics of the call: number of 'events' and 'workflows' refreshed, the
+                'batch_sizes' (events per workflow) and the 'latencies' (seconds from completion
+                to refresh) of the events.
+        """
+        events = self.refresh_events.find({}, sort=[('_id', ASCENDING)], limit=max_events or 0)
+        pending = OrderedDict()  # fw_id -> events
+        for e in events:
+            pending.setdefault(e['fw_id'], []).append(e)
+
+        # the Fireworks of deleted workflows are gone too
+        existing = set(self.fireworks.distinct('fw_id', {'fw_id': {'$in': list(pending)}}))
+        for fw_id in [f for f in pending if f not in existing]:
+            self.m_logger.warning('Dropping queued refresh of deleted fw_id: {}'.format(fw_id))
+            dropped = [e['_id'] for e in pending.pop(fw_id)]
+            self.refresh_events.delete_many({'_id': {'$in': dropped}})
+
+        batch_sizes, latencies = [], []
+        for batch in self._refresh_wfs(list(pending)):
+            done = [e for f in batch for e in pending.pop(f)]
+            self.refresh_events.delete_many({'_id': {'$in': [e['_id'] for e in done]}})
+            now = datetime.datetime.utcnow()
+            latencies.extend((now - e['created_on']).total_seconds() for e in done)
+            batch_sizes.append(len(done))
+
+        if batch_sizes:
+            self.m_logger.info('Applied {} queued refreshes to {} workflows (max batch size: {}, '
+                               'max latency: {:.1f}s)'.format(len(latencies), len(batch_sizes),
+                                                              max(batch_sizes), max(latencies)))
+        return {'events': len(latencies), 'workflows': len(batch_sizes),
+                'batch_sizes': batch_sizes, 'latencies': latencies}
+
+    def run_refresher(self, infinite=True, refresh_interval=None):
+        """
+        Apply the queued workflow refreshes (see refresh_queued_wfs), e.g. in a dedicated process
+        or thread when the rockets use defer_refresh.
+
+        Args:
+            infinite (bool)
+            refresh_interval (seconds): sleep time when no events are queued
+        """
+        refresh_interval = refresh_interval if refresh_interval else REFRESHER_INTERVAL
+        while True:
+            stats = self.refresh_queued_wfs()
+            if not infinite:
+                break
+            if not stats['events']:
+                time.sleep(refresh_interval)
+
     def _update_wf(self, wf, updated_ids):
         """
         Update the workflow with the update firework ids.
@@ -1569,12 +2885,18 @@ class LaunchPad(FWSerializable):
                 break
 
         assert query_node is not None
-        if not self.workflows.find_one({'nodes': query_node}):
+        # only write the changed links and fw_states, unless the structure of the WF changed
+        wf_update = wf.to_db_update()
+        if wf_update is not None:
+            found = self.workflows.update_one({'nodes': query_node}, wf_update).matched_count
+        else:
+            # redo the links and fw_states, $set keeps the lock and the lock_stats
+            wf_dict = wf.to_db_dict()
+            found = self.workflows.update_one({'nodes': query_node},
+                                              {'$set': wf_dict}).matched_count
+        if not found:
             raise ValueError("BAD QUERY_NODE! {}".format(query_node))
-        # redo the links and fw_states
-        wf = wf.to_db_dict()
-        wf['locked'] = True  # preserve the lock!
-        self.workflows.find_one_and_replace({'nodes': query_node}, wf)
+        wf._clear_changes()
 
     def _steal_launches(self, thief_fw):
         """
@@ -1633,6 +2955,7 @@ class LaunchPad(FWSerializable):
             priority
         """
         self.fireworks.find_one_and_update({"fw_id": fw_id}, {'$set': {'spec._priority': priority}})
+        self._sync_ready_queue([fw_id])
 
     def get_logdir(self):
         """
@@ -1799,7 +3122,7 @@ class LazyFirework(object):
     """
 
     # Get these fields from DB when creating new FireWork object
-    db_fields = ('name', 'fw_id', 'spec', 'created_on', 'state')
+    db_fields = ('name', 'fw_id', 'spec', 'created_on', 'updated_on', 'state')
     db_launch_fields = ('launches', 'archived_launches')
 
     def __init__(self, fw_id, fw_coll, launch_coll, fallback_fs):
@@ -1841,6 +3164,20 @@ class LazyFirework(object):
     def to_db_dict(self):
         return self.full_fw.to_db_dict()
 
+    def to_db_update(self):
+        """
+        Like Firework.to_db_update, but without loading the launches if they were not accessed.
+        """
+        if self._fw is None:
+            return {}  # nothing was loaded, so nothing was changed
+        m_dict = self._fw.to_db_dict()
+        for name in self.db_launch_fields:
+            if not self._launches[name]:
+                m_dict[name] = self._lids[name]
+        m_update = get_db_update(self._fw._db_dict, m_dict)
+        self._fw._db_dict = m_dict
+        return m_update
+
     def __str__(self):
         return 'LazyFireWork object: (id: {})'.format(self.fw_id)
 
@@ -1923,15 +3260,25 @@ class LazyFirework(object):
     def partial_fw(self):
         if not self._fw:
             fields = list(self.db_fields) + list(self.db_launch_fields)
-            data = self._fwc.find_one({'fw_id': self.fw_id}, projection=fields)
-            launch_data = {}  # move some data to separate launch dict
-            for key in self.db_launch_fields:
-                launch_data[key] = data[key]
-                del data[key]
-            self._lids = launch_data
-            self._fw = Firework.from_dict(data)
+            self._set_partial_fw(self._fwc.find_one({'fw_id': self.fw_id}, projection=fields))
         return self._fw
 
+    def _set_partial_fw(self, data):
+        """
+        Create the partial FireWork object from its document (e.g. prefetched by the LaunchPad).
+
+        Args:
+            data (dict): firework document with the db_fields and db_launch_fields
+        """
+        db_dict = dict(data)
+        launch_data = {}  # move some data to separate launch dict
+        for key in self.db_launch_fields:
+            launch_data[key] = data[key]
+            del data[key]
+        self._lids = launch_data
+        self._fw = Firework.from_dict(data)
+        self._fw._db_dict = db_dict
+
     @property
     def full_fw(self):
         #map(self._get_launch_data, self.db_launch_fields)
@@ -1954,17 +3301,25 @@ class LazyFirework(object):
         fw = self.partial_fw  # assure stage 1
         if not self._launches[name]:
             launch_ids = self._lids[name]
-            result = []
+            launch_dicts = []
             if launch_ids:
-                data = self._lc.find({'launch_id': {"$in": launch_ids}})
-                for ld in data:
+                for ld in self._lc.find({'launch_id': {"$in": launch_ids}}):
                     ld["action"] = get_action_from_gridfs(ld.get("action"), self._ffs)
-                    result.append(Launch.from_dict(ld))
-
-            setattr(fw, name, result)  # put into real FireWork obj
-            self._launches[name] = True
+                    launch_dicts.append(ld)
+            self._set_launch_data(name, launch_dicts)
         return getattr(fw, name)
 
+    def _set_launch_data(self, name, launch_dicts):
+        """
+        Set the launches of a field from their documents (e.g. prefetched by the LaunchPad).
+
+        Args:
+            name (str): Name of field, e.g. 'archived_launches'.
+            launch_dicts ([dict]): launch documents, with their actions
+        """
+        setattr(self.partial_fw, name, [Launch.from_dict(ld) for ld in launch_dicts])
+        self._launches[name] = True
+
 
 def get_action_from_gridfs(action_dict, fallback_fs):
     """
@@ -1989,3 +3344,22 @@ def get_action_from_gridfs(action_dict, fallback_fs):
 
     action_data = fallback_fs.get(ObjectId(action_gridfs_id))
     return json.loads(action_data.read())
+
+
+def _batches(iterable, batch_size):
+    """
+    Helper function to split an iterable (e.g. a cursor) into lists of at most batch_size items.
+
+    Args:
+        iterable: the items to split
+        batch_size (int): the largest number of items per list
+
+    Returns:
+        generator of list
+    """
+    it = iter(iterable)
+    while True:
+        batch = list(islice(it, batch_size))
+        if not batch:
+            return
+        yield batch
@@ -27,7 +27,7 @@ from monty.serialization import loadfn, dumpfn
 from fireworks.core.firework import FWAction, Firework
 from fireworks.fw_config import FWData, PING_TIME_SECS, REMOVE_USELESS_DIRS, \
     PRINT_FW_JSON, \
-    PRINT_FW_YAML, STORE_PACKING_INFO, ROCKET_STREAM_LOGLEVEL
+    PRINT_FW_YAML, STORE_PACKING_INFO, ROCKET_STREAM_LOGLEVEL, CHECKPOINT_CONSISTENCY
 from fireworks.utilities.dict_mods import apply_mod
 from fireworks.core.launchpad import LockedWorkflowError, LaunchPad
 from fireworks.utilities.fw_utilities import get_fw_logger
@@ -40,21 +40,21 @@ __email__ = 'ajain@lbl.gov'
 __date__ = 'Feb 7, 2013'
 
 
-def do_ping(launchpad, launch_id):
+def do_ping(launchpad, launch_id, launch_dir=''):
     if launchpad:
-        launchpad.ping_launch(launch_id)
+        launchpad.ping_launches([launch_id])
     else:
-        with open('FW_ping.json', 'w') as f:
+        with open(os.path.join(launch_dir, 'FW_ping.json'), 'w') as f:
             f.write('{"ping_time": "%s"}' % datetime.utcnow().isoformat())
 
 
-def ping_launch(launchpad, launch_id, stop_event, master_thread):
+def ping_launch(launchpad, launch_id, stop_event, master_thread, launch_dir=''):
     while not stop_event.is_set() and master_thread.isAlive():
-        do_ping(launchpad, launch_id)
+        do_ping(launchpad, launch_id, launch_dir)
         stop_event.wait(PING_TIME_SECS)
 
 
-def start_ping_launch(launchpad, launch_id):
+def start_ping_launch(launchpad, launch_id, launch_dir=''):
     fd = FWData()
     if fd.MULTIPROCESSING:
         if not launch_id:
@@ -64,7 +64,8 @@ def start_ping_launch(launchpad, launch_id):
     else:
         ping_stop = threading.Event()
         ping_thread = threading.Thread(target=ping_launch,
-                                       args=(launchpad, launch_id, ping_stop, threading.currentThread()))
+                                       args=(launchpad, launch_id, ping_stop, threading.currentThread(),
+                                             launch_dir))
         ping_thread.start()
         return ping_stop
 
@@ -100,22 +101,113 @@ def start_background_task(btask, spec):
     return ping_stop
 
 
+class CheckpointWriter(object):
+    """
+    Writes the checkpoints of a running Firework, i.e. the task to restart from and the combined
+    results of the previous tasks (see Rocket.update_checkpoint).
+
+    With the 'sync' consistency, each checkpoint is written before its task runs. With the 'async'
+    consistency, the checkpoints are written by a background thread: a checkpoint submitted while
+    another one is being written replaces any checkpoint still waiting, so that only the latest
+    one is written. flush() then waits until the latest checkpoint is written. A recovered
+    Firework might thus rerun a few tasks that were already completed.
+    """
+
+    def __init__(self, launchpad, launch_dir, launch_id, consistency=None):
+        """
+        Args:
+            launchpad (LaunchPad): LaunchPad to ping with checkpoint data
+            launch_dir (str): directory in which FW_offline.json was created
+            launch_id (int): launch id to update
+            consistency (str): 'sync' or 'async', CHECKPOINT_CONSISTENCY by default
+        """
+        self.launchpad = launchpad
+        self.launch_dir = launch_dir
+        self.launch_id = launch_id
+        self.consistency = consistency or CHECKPOINT_CONSISTENCY
+        if self.consistency not in ('sync', 'async'):
+            raise ValueError("Invalid checkpoint consistency: {}".format(self.consistency))
+        self._cond = threading.Condition()
+        self._pending = None
+        self._closed = False
+        self._thread = None
+
+    def write(self, checkpoint):
+        """
+        Write a checkpoint, or queue it for the background thread.
+
+        Args:
+            checkpoint (dict): checkpoint data, which must not be modified afterwards
+        """
+        if self.consistency == 'sync':
+            Rocket.update_checkpoint(self.launchpad, self.launch_dir, self.launch_id, checkpoint)
+            return
+        with self._cond:
+            self._pending = checkpoint
+            self._closed = False
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._write_pending)
+                self._thread.daemon = True
+                self._thread.start()
+            self._cond.notify()
+
+    def flush(self):
+        """
+        Wait until the latest checkpoint is written, and stop the background thread.
+        """
+        with self._cond:
+            thread = self._thread
+            self._closed = True
+            self._cond.notify()
+        if thread:
+            thread.join()
+            self._thread = None
+
+    def _write_pending(self):
+        while True:
+            with self._cond:
+                while self._pending is None and not self._closed:
+                    self._cond.wait()
+                if self._pending is None:
+                    return
+                checkpoint, self._pending = self._pending, None
+            try:
+                Rocket.update_checkpoint(self.launchpad, self.launch_dir, self.launch_id,
+                                         checkpoint)
+            except Exception:
+                # a missed checkpoint only means that more tasks are rerun on recovery
+                traceback.print_exc()
+
+
 class Rocket:
     """
     The Rocket fetches a workflow step from the FireWorks database and executes it.
     """
 
-    def __init__(self, launchpad, fworker, fw_id):
+    def __init__(self, launchpad, fworker, fw_id, checkout=None, completions=None,
+                 launch_dir=None):
         """
         Args:
         launchpad (LaunchPad): A LaunchPad object for interacting with the FW database.
             If none, reads FireWorks from FW.json and writes to FWAction.json
         fworker (FWorker): A FWorker object describing the computing resource
         fw_id (int): id of a specific Firework to run (quit if it cannot be found)
+        checkout ((Firework, int)): a Firework already checked out in the current directory
+            (e.g. by LaunchPad.checkout_fws) and its launch id, to run instead of checking out one
+        completions (list): if set, the (launch_id, action, state) of the finished launch is
+            appended to this list instead of completing the launch, so that the caller can
+            complete many launches at once with LaunchPad.complete_launches
+        launch_dir (str): directory in which to run the Firework. If set, the Rocket never
+            changes the current directory, so that several Rockets can run at once in the
+            threads of one process. If None, the Rocket runs in the current directory (and
+            moves into the _launch_dir of the Firework, if any)
         """
         self.launchpad = launchpad
         self.fworker = fworker
         self.fw_id = fw_id
+        self.checkout = checkout
+        self.completions = completions
+        self.launch_dir = launch_dir
 
     def run(self, pdb_on_exception=False):
         """
@@ -130,19 +222,21 @@ class Rocket:
         all_mod_spec = []  # combined mod_spec for *all* the Tasks
 
         lp = self.launchpad
-        launch_dir = os.path.abspath(os.getcwd())
+        launch_dir = os.path.abspath(self.launch_dir or os.getcwd())
         logdir = lp.get_logdir() if lp else None
         l_logger = get_fw_logger('rocket.launcher', l_dir=logdir,
                                  stream_level=ROCKET_STREAM_LOGLEVEL)
 
         # check a FW job out of the launchpad
-        if lp:
+        if lp and self.checkout:
+            m_fw, launch_id = self.checkout
+        elif lp:
             m_fw, launch_id = lp.checkout_fw(self.fworker, launch_dir, self.fw_id)
         else:  # offline mode
-            m_fw = Firework.from_file(os.path.join(os.getcwd(), "FW.json"))
+            m_fw = Firework.from_file(os.path.join(launch_dir, "FW.json"))
 
             # set the run start time
-            fpath = zpath("FW_offline.json")
+            fpath = zpath(os.path.join(launch_dir, "FW_offline.json"))
             with zopen(fpath) as f_in:
                 d = json.loads(f_in.read())
                 d['started_on'] = datetime.utcnow().isoformat()
@@ -158,20 +252,22 @@ class Rocket:
         final_state = None
         ping_stop = None
         btask_stops = []
+        checkpoints = None
 
         try:
             if '_launch_dir' in m_fw.spec and lp:
                 prev_dir = launch_dir
                 launch_dir = os.path.expandvars(m_fw.spec['_launch_dir'])
-                if not os.path.abspath(launch_dir):
-                    launch_dir = os.path.normpath(os.path.join(os.getcwd(), launch_dir))
+                if not os.path.isabs(launch_dir):
+                    launch_dir = os.path.normpath(os.path.join(prev_dir, launch_dir))
                 # thread-safe "mkdir -p"
                 try:
                     os.makedirs(launch_dir)
                 except OSError as exception:
                     if exception.errno != errno.EEXIST:
                         raise
-                os.chdir(launch_dir)
+                if not self.launch_dir:
+                    os.chdir(launch_dir)
 
                 if not os.path.samefile(launch_dir, prev_dir):
                     lp.change_launch_dir(launch_id, launch_dir)
@@ -211,42 +307,48 @@ class Rocket:
                     # We use zopen for the file objects for transparent handling
                     # of zipped files. shutil.copyfileobj does the actual copy
                     # in chunks that avoid memory issues.
-                    with zopen(prev_files[f], "rb") as fin, zopen(files_in[f], "wb") as fout:
+                    with zopen(prev_files[f], "rb") as fin, \
+                            zopen(os.path.join(launch_dir, files_in[f]), "wb") as fout:
                         shutil.copyfileobj(fin, fout)
 
             if lp:
                 message = 'RUNNING fw_id: {} in directory: {}'.\
-                    format(m_fw.fw_id, os.getcwd())
+                    format(m_fw.fw_id, launch_dir)
                 l_logger.log(logging.INFO, message)
 
             # write FW.json and/or FW.yaml to the directory
             if PRINT_FW_JSON:
-                m_fw.to_file('FW.json', indent=4)
+                m_fw.to_file(os.path.join(launch_dir, 'FW.json'), indent=4)
             if PRINT_FW_YAML:
-                m_fw.to_file('FW.yaml')
+                m_fw.to_file(os.path.join(launch_dir, 'FW.yaml'))
 
             my_spec = dict(m_fw.spec)  # make a copy of spec, don't override original
             my_spec["_fw_env"] = self.fworker.env
 
             # set up heartbeat (pinging the server that we're still alive)
-            ping_stop = start_ping_launch(lp, launch_id)
+            ping_stop = start_ping_launch(lp, launch_id, launch_dir)
 
             # start background tasks
             if '_background_tasks' in my_spec:
                 for bt in my_spec['_background_tasks']:
+                    for task in bt.tasks:
+                        task.launch_dir = launch_dir
                     btask_stops.append(start_background_task(bt, m_fw.spec))
 
             # execute the Firetasks!
+            checkpoints = CheckpointWriter(lp, launch_dir, launch_id)
             for t_counter, t in enumerate(m_fw.tasks[starting_task:], start=starting_task):
+                # copies, as the checkpoint might be written after the next task
                 checkpoint = {'_task_n': t_counter,
-                              '_all_stored_data': all_stored_data,
-                              '_all_update_spec': all_update_spec,
-                              '_all_mod_spec': all_mod_spec}
-                Rocket.update_checkpoint(lp, launch_dir, launch_id, checkpoint)
+                              '_all_stored_data': dict(all_stored_data),
+                              '_all_update_spec': dict(all_update_spec),
+                              '_all_mod_spec': list(all_mod_spec)}
+                checkpoints.write(checkpoint)
  
                 if lp:
                    l_logger.log(logging.INFO, "Task started: %s." % t.fw_name)
 
+                t.launch_dir = launch_dir
                 if my_spec.get("_add_launchpad_and_fw_id"):
                     t.fw_id = m_fw.fw_id
                     if FWData().MULTIPROCESSING:
@@ -263,8 +365,9 @@ class Rocket:
                 except BaseException as e:
                     traceback.print_exc()
                     tb = traceback.format_exc()
+                    checkpoints.flush()
                     stop_backgrounds(ping_stop, btask_stops)
-                    do_ping(lp, launch_id)  # one last ping, esp if there is a monitor
+                    do_ping(lp, launch_id, launch_dir)  # one last ping, esp if there is a monitor
                     # If the exception is serializable, save its details
                     if pdb_on_exception:
                         pdb.post_mortem()
@@ -292,9 +395,9 @@ class Rocket:
 
                     if lp:
                         final_state = 'FIZZLED'
-                        lp.complete_launch(launch_id, m_action, final_state)
+                        self._complete_launch(launch_id, m_action, final_state)
                     else:
-                        fpath = zpath("FW_offline.json")
+                        fpath = zpath(os.path.join(launch_dir, "FW_offline.json"))
                         with zopen(fpath) as f_in:
                             d = json.loads(f_in.read())
                             d['fwaction'] = m_action.to_dict()
@@ -307,10 +410,11 @@ class Rocket:
 
                 # read in a FWAction from a file, in case the task is not Python and cannot return
                 # it explicitly
-                if os.path.exists('FWAction.json'):
-                    m_action = FWAction.from_file('FWAction.json')
-                elif os.path.exists('FWAction.yaml'):
-                    m_action = FWAction.from_file('FWAction.yaml')
+                action_file = os.path.join(launch_dir, 'FWAction.json')
+                if not os.path.exists(action_file):
+                    action_file = os.path.join(launch_dir, 'FWAction.yaml')
+                if os.path.exists(action_file):
+                    m_action = FWAction.from_file(action_file)
 
                 if not m_action:
                     m_action = FWAction()
@@ -335,10 +439,11 @@ class Rocket:
                 all_stored_data['multiprocess_name'] = multiprocessing.current_process().name
 
             # perform finishing operation
+            checkpoints.flush()
             stop_backgrounds(ping_stop, btask_stops)
             for b in btask_stops:
                 b.set()
-            do_ping(lp, launch_id)  # one last ping, esp if there is a monitor
+            do_ping(lp, launch_id, launch_dir)  # one last ping, esp if there is a monitor
             # last background monitors
             if '_background_tasks' in my_spec:
                 for bt in my_spec['_background_tasks']:
@@ -354,10 +459,10 @@ class Rocket:
 
             if lp:
                 final_state = 'COMPLETED'
-                lp.complete_launch(launch_id, m_action, final_state)
+                self._complete_launch(launch_id, m_action, final_state)
             else:
 
-                fpath = zpath("FW_offline.json")
+                fpath = zpath(os.path.join(launch_dir, "FW_offline.json"))
                 with zopen(fpath) as f_in:
                     d = json.loads(f_in.read())
                     d['fwaction'] = m_action.to_dict()
@@ -380,12 +485,14 @@ class Rocket:
         except:
             # problems while processing the results. high probability of malformed data.
             traceback.print_exc()
+            if checkpoints:
+                checkpoints.flush()
             stop_backgrounds(ping_stop, btask_stops)
             # restore initial state to prevent the raise of further exceptions
             if lp:
                 lp.restore_backup_data(launch_id, m_fw.fw_id)
 
-            do_ping(lp, launch_id)  # one last ping, esp if there is a monitor
+            do_ping(lp, launch_id, launch_dir)  # one last ping, esp if there is a monitor
             # the action produced by the task is discarded
             m_action = FWAction(stored_data={'_message': 'runtime error during task', '_task': None,
                                              '_exception': {'_stacktrace': traceback.format_exc(),
@@ -399,7 +506,7 @@ class Rocket:
 
             if lp:
                 try:
-                    lp.complete_launch(launch_id, m_action, 'FIZZLED')
+                    self._complete_launch(launch_id, m_action, 'FIZZLED')
                 except LockedWorkflowError as e:
                     l_logger.log(logging.DEBUG, traceback.format_exc())
                     l_logger.log(logging.WARNING,
@@ -409,7 +516,7 @@ class Rocket:
                                        self.fw_id, final_state, e, self.fw_id))
                     return True
             else:
-                fpath = zpath("FW_offline.json")
+                fpath = zpath(os.path.join(launch_dir, "FW_offline.json"))
                 with zopen(fpath) as f_in:
                     d = json.loads(f_in.read())
                     d['fwaction'] = m_action.to_dict()
@@ -420,6 +527,15 @@ class Rocket:
 
             return True
 
+    def _complete_launch(self, launch_id, action, state):
+        """
+        Complete the launch, or hand it to the caller (see completions).
+        """
+        if self.completions is None:
+            self.launchpad.complete_launch(launch_id, action, state)
+        else:
+            self.completions.append((launch_id, action, state))
+
     @staticmethod
     def update_checkpoint(launchpad, launch_dir, launch_id, checkpoint):
         """
@@ -434,7 +550,7 @@ class Rocket:
         if launchpad:
             launchpad.ping_launch(launch_id, checkpoint=checkpoint)
         else:
-            fpath = zpath("FW_offline.json")
+            fpath = zpath(os.path.join(launch_dir, "FW_offline.json"))
             with zopen(fpath) as f_in:
                 d = json.loads(f_in.read())
                 d['checkpoint'] = checkpoint
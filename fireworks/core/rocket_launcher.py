@@ -7,9 +7,14 @@ This module contains methods for launching Rockets, both singly and in rapid-fir
 """
 
 import os
+import sys
+import threading
 import time
+import traceback
 from datetime import datetime
 
+import six
+
 from fireworks.fw_config import RAPIDFIRE_SLEEP_SECS, FWORKER_LOC
 from fireworks.core.fworker import FWorker
 from fireworks.core.rocket import Rocket
@@ -34,7 +39,7 @@ def get_fworker(fworker):
 
 
 def launch_rocket(launchpad, fworker=None, fw_id=None, strm_lvl='INFO',
-                  pdb_on_exception=False):
+                  pdb_on_exception=False, launch_dir=None):
     """
     Run a single rocket in the current directory.
 
@@ -45,6 +50,8 @@ def launch_rocket(launchpad, fworker=None, fw_id=None, strm_lvl='INFO',
         strm_lvl (str): level at which to output logs to stdout
         pdb_on_exception (bool): if set to True, python will start
             the debugger on a firework exception
+        launch_dir (str): if set, run the rocket in this directory instead, without changing
+            the current directory
 
     Returns:
         bool
@@ -54,14 +61,131 @@ def launch_rocket(launchpad, fworker=None, fw_id=None, strm_lvl='INFO',
     l_logger = get_fw_logger('rocket.launcher', l_dir=l_dir, stream_level=strm_lvl)
 
     log_multi(l_logger, 'Launching Rocket')
-    rocket = Rocket(launchpad, fworker, fw_id)
+    rocket = Rocket(launchpad, fworker, fw_id, launch_dir=launch_dir)
     rocket_ran = rocket.run(pdb_on_exception=pdb_on_exception)
     log_multi(l_logger, 'Rocket finished')
     return rocket_ran
 
 
+def launch_rockets_batch(launchpad, fworker, m_dir, n, strm_lvl='INFO', local_redirect=False,
+                         pdb_on_exception=False):
+    """
+    Check out up to n Fireworks at once, run them one after the other in new launcher
+    directories of m_dir and complete all their launches at once.
+
+    Args:
+        launchpad (LaunchPad)
+        fworker (FWorker)
+        m_dir (str): the directory in which to create the launcher directories
+        n (int): max number of Fireworks to run
+        strm_lvl (str): level at which to output logs to stdout
+        local_redirect (bool): redirect standard input and output to local file
+        pdb_on_exception (bool): if set to True, python will start
+            the debugger on a firework exception
+
+    Returns:
+        int: number of Fireworks that were run
+    """
+    l_logger = get_fw_logger('rocket.launcher', l_dir=launchpad.get_logdir(), stream_level=strm_lvl)
+    launcher_dirs = [create_datestamp_dir(m_dir, l_logger, prefix='launcher_') for _ in range(n)]
+    checked_out = launchpad.checkout_fws(fworker, n, launcher_dirs)
+    for launcher_dir in launcher_dirs[len(checked_out):]:
+        # remove the empty shell of a directory
+        os.rmdir(launcher_dir)
+
+    completions = []
+    for (m_fw, launch_id), launcher_dir in zip(checked_out, launcher_dirs):
+        log_multi(l_logger, 'Launching Rocket')
+        os.chdir(launcher_dir)
+        rocket = Rocket(launchpad, fworker, m_fw.fw_id, checkout=(m_fw, launch_id),
+                        completions=completions)
+        if local_redirect:
+            with redirect_local():
+                rocket.run(pdb_on_exception=pdb_on_exception)
+        else:
+            rocket.run(pdb_on_exception=pdb_on_exception)
+        log_multi(l_logger, 'Rocket finished')
+    os.chdir(m_dir)
+
+    if completions:
+        try:
+            launchpad.complete_launches(completions)
+        except Exception:
+            # complete the launches one by one, so that the errors are handled as usual
+            l_logger.warning('Could not complete the batch of launches, completing them one by '
+                             'one:\n{}'.format(traceback.format_exc()))
+            for launch_id, action, state in completions:
+                try:
+                    launchpad.complete_launch(launch_id, action, state)
+                except Exception:
+                    l_logger.error('Could not complete launch_id {}:\n{}'.format(
+                        launch_id, traceback.format_exc()))
+    return len(checked_out)
+
+
+def launch_rockets_threads(launchpad, fworker, m_dir, nthreads, nlaunches=0, strm_lvl='INFO',
+                           pdb_on_exception=False, timeout=None):
+    """
+    Run Rockets in nthreads threads at once, each Rocket in a new launcher directory of m_dir,
+    until no Firework is ready to run. The Rockets never change the current directory, so the
+    Firetasks must not depend on it (see FiretaskBase.launch_dir).
+
+    Args:
+        launchpad (LaunchPad)
+        fworker (FWorker)
+        m_dir (str): the directory in which to create the launcher directories
+        nthreads (int): number of Rockets to run at once
+        nlaunches (int): max number of Rockets to run (0 means no limit)
+        strm_lvl (str): level at which to output logs to stdout
+        pdb_on_exception (bool): if set to True, python will start
+            the debugger on a firework exception
+        timeout (float): number of seconds after which no new Rocket is started
+
+    Returns:
+        int: number of Rockets that ran a Firework
+    """
+    l_logger = get_fw_logger('rocket.launcher', l_dir=launchpad.get_logdir(), stream_level=strm_lvl)
+    start_time = datetime.now()
+    lock = threading.Lock()
+    num_launched = [0]  # includes the Rockets being started
+    errors = []
+
+    def run_rockets():
+        try:
+            while timeout is None or (datetime.now() - start_time).total_seconds() < timeout:
+                with lock:
+                    if errors or 0 < nlaunches <= num_launched[0]:
+                        return
+                    num_launched[0] += 1
+                launcher_dir = create_datestamp_dir(m_dir, l_logger, prefix='launcher_')
+                rocket_ran = launch_rocket(launchpad, fworker, strm_lvl=strm_lvl,
+                                           pdb_on_exception=pdb_on_exception,
+                                           launch_dir=launcher_dir)
+                if not rocket_ran:
+                    with lock:
+                        num_launched[0] -= 1
+                    if not os.listdir(launcher_dir):
+                        # remove the empty shell of a directory
+                        os.rmdir(launcher_dir)
+                    return
+        except Exception:
+            with lock:
+                num_launched[0] -= 1
+                errors.append(sys.exc_info())
+
+    threads = [threading.Thread(target=run_rockets) for _ in range(nthreads)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    if errors:
+        six.reraise(*errors[0])
+    return num_launched[0]
+
+
 def rapidfire(launchpad, fworker=None, m_dir=None, nlaunches=0, max_loops=-1, sleep_time=None,
-              strm_lvl='INFO', timeout=None, local_redirect=False, pdb_on_exception=False):
+              strm_lvl='INFO', timeout=None, local_redirect=False, pdb_on_exception=False,
+              batch_size=1, nthreads=1):
     """
     Keeps running Rockets in m_dir until we reach an error. Automatically creates subdirectories
     for each Rocket. Usually stops when we run out of FireWorks from the LaunchPad.
@@ -76,7 +200,13 @@ def rapidfire(launchpad, fworker=None, m_dir=None, nlaunches=0, max_loops=-1, sl
         strm_lvl (str): level at which to output logs to stdout
         timeout (int): of seconds after which to stop the rapidfire process
         local_redirect (bool): redirect standard input and output to local file
+        batch_size (int): if larger than 1, check out and complete up to this many Fireworks at
+            once (see launch_rockets_batch)
+        nthreads (int): if larger than 1, run this many Rockets at once in threads of this
+            process (see launch_rockets_threads)
     """
+    if nthreads > 1 and (batch_size > 1 or local_redirect):
+        raise ValueError("Running Rockets in threads does not support batches or local_redirect!")
 
     sleep_time = sleep_time if sleep_time else RAPIDFIRE_SLEEP_SECS
     curdir = m_dir if m_dir else os.getcwd()
@@ -96,7 +226,33 @@ def rapidfire(launchpad, fworker=None, m_dir=None, nlaunches=0, max_loops=-1, sl
     while num_loops != max_loops and time_ok():
         skip_check = False  # this is used to speed operation
         while (skip_check or launchpad.run_exists(fworker)) and time_ok():
+            if nthreads > 1:
+                n = 0 if nlaunches <= 0 else nlaunches - num_launched
+                remaining = None if timeout is None else \
+                    timeout - (datetime.now() - start_time).total_seconds()
+                num_launched += launch_rockets_threads(launchpad, fworker, curdir, nthreads, n,
+                                                       strm_lvl=strm_lvl,
+                                                       pdb_on_exception=pdb_on_exception,
+                                                       timeout=remaining)
+                if nlaunches > 0 and num_launched == nlaunches:
+                    break
+                # the threads stop when no FW is ready, give the DB time to refresh
+                time.sleep(0.15)
+                continue
             os.chdir(curdir)
+            if batch_size > 1:
+                n = batch_size if nlaunches <= 0 else min(batch_size, nlaunches - num_launched)
+                num_ran = launch_rockets_batch(launchpad, fworker, curdir, n, strm_lvl=strm_lvl,
+                                               local_redirect=local_redirect,
+                                               pdb_on_exception=pdb_on_exception)
+                num_launched += num_ran
+                if nlaunches > 0 and num_launched == nlaunches:
+                    break
+                # a full batch means that more FWs are probably waiting, don't ask the DB
+                skip_check = num_ran == n
+                if not skip_check:
+                    time.sleep(0.15)
+                continue
             launcher_dir = create_datestamp_dir(curdir, l_logger, prefix='launcher_')
             os.chdir(launcher_dir)
             if local_redirect:
@@ -126,8 +282,10 @@ def rapidfire(launchpad, fworker=None, m_dir=None, nlaunches=0, max_loops=-1, sl
                 break
         elif num_launched == nlaunches:
             break
-        log_multi(l_logger, 'Sleeping for {} secs'.format(sleep_time))
-        time.sleep(sleep_time)
+        log_multi(l_logger, 'Sleeping for up to {} secs'.format(sleep_time))
+        # wakes up early when a FW becomes READY
+        launchpad.wait_for_ready(fworker, sleep_time)
         num_loops += 1
         log_multi(l_logger, 'Checking for FWs to run...')
-    os.chdir(curdir)
+    if nthreads <= 1:
+        os.chdir(curdir)
@@ -16,7 +16,7 @@ __date__ = "2/26/14"
 
 import unittest
 
-from fireworks.core.firework import Firework, Workflow, FiretaskBase, FWAction
+from fireworks.core.firework import Firework, Workflow, FiretaskBase, FWAction, Launch
 from fireworks.user_objects.firetasks.script_task import PyTask
 from fireworks.utilities.fw_utilities import explicit_serialize
 
@@ -84,6 +84,30 @@ class Task2(FiretaskBase):
         return FWAction(stored_data={"color": "yellow"})
 
 
+class FireworkTest(unittest.TestCase):
+
+    def test_to_db_update(self):
+        fw = Firework(Task1(), spec={'a': 1, 'b': [1, 2]})
+        self.assertIsNone(fw.to_db_update())
+
+        fw._db_dict = fw.to_db_dict()
+        self.assertEqual(fw.to_db_update(), {})
+
+        fw.spec['a'] = 2
+        del fw.spec['b']
+        fw.launches = [Launch('COMPLETED', '', launch_id=5, fw_id=fw.fw_id)]
+        update = fw.to_db_update()
+        self.assertEqual(update['$set'], {'spec.a': 2, 'launches': [5]})
+        self.assertEqual(update['$unset'], {'spec.b': ''})
+
+        # only changes made since the last update are returned
+        self.assertEqual(fw.to_db_update(), {})
+        fw.state = 'COMPLETED'
+        update = fw.to_db_update()
+        self.assertEqual(set(update['$set']), {'state', 'updated_on'})
+        self.assertNotIn('$unset', update)
+
+
 class WorkflowTest(unittest.TestCase):
 
     def setUp(self):
@@ -155,6 +179,117 @@ class WorkflowTest(unittest.TestCase):
         wflow.remove_fws(wflow.root_fw_ids)
         self.assertEqual(sorted(wflow.root_fw_ids), sorted(children))
 
+    def test_links_index(self):
+        def check(links):
+            parent_links = {}
+            for parent, children in links.items():
+                for child in children:
+                    parent_links.setdefault(child, []).append(parent)
+            nodes = set(links.keys()).union(parent_links.keys())
+            self.assertEqual({k: sorted(v) for k, v in links.parent_links.items()},
+                             {k: sorted(v) for k, v in parent_links.items()})
+            self.assertEqual(set(links.nodes), nodes)
+            self.assertEqual(set(links.root_ids), nodes.difference(parent_links))
+            self.assertEqual(set(links.leaf_ids), set(k for k, v in links.items() if not v))
+
+        fw4 = Firework(Task1(), parents=[self.fw2, self.fw3])
+        wflow = Workflow([self.fw1, self.fw2, self.fw3, fw4])
+        check(wflow.links)
+
+        new_fw = Firework(Task2())
+        wflow.append_wf(Workflow([new_fw]), [self.fw2.fw_id])
+        check(wflow.links)
+        self.assertEqual(wflow.links.parent_links[new_fw.fw_id], [self.fw2.fw_id])
+
+        old_new = {new_fw.fw_id: 100, self.fw2.fw_id: 101}
+        new_fw.fw_id, self.fw2.fw_id = 100, 101
+        wflow._reassign_ids(old_new)
+        check(wflow.links)
+        self.assertEqual(sorted(wflow.links.parent_links[fw4.fw_id]), sorted([101, self.fw3.fw_id]))
+        self.assertIn(100, wflow.leaf_fw_ids)
+
+        wflow.remove_fws([100])
+        check(wflow.links)
+
+        wflow.links.remove_link(self.fw1.fw_id, self.fw3.fw_id)
+        check(wflow.links)
+        self.assertIn(self.fw3.fw_id, wflow.root_fw_ids)
+        del wflow.links[self.fw3.fw_id]
+        check(wflow.links)
+
+    @staticmethod
+    def _completed_launch(fw_id):
+        return Launch('COMPLETED', '.', host='localhost', ip='127.0.0.1', action=FWAction(),
+                      fw_id=fw_id)
+
+    def test_refresh_deep(self):
+        # deeper than the recursion limit; every fw already has a COMPLETED launch
+        fws = [Firework(Task1(), fw_id=1, state='RUNNING')]
+        for i in range(2, 5001):
+            fws.append(Firework(Task1(), fw_id=i, parents=fws[-1]))
+        for fw in fws:
+            fw.launches = [self._completed_launch(fw.fw_id)]
+        wflow = Workflow(fws)
+        updated_ids = wflow.refresh(1)
+        self.assertEqual(updated_ids, set(range(1, 5001)))
+        self.assertEqual(set(wflow.fw_states.values()), {'COMPLETED'})
+
+        updated_ids = wflow.rerun_fw(1)
+        self.assertEqual(updated_ids, set(range(1, 5001)))
+        self.assertEqual(wflow.fw_states[1], 'READY')
+        self.assertEqual(set(wflow.fw_states[i] for i in range(2, 5001)), {'WAITING'})
+
+    def test_refresh_visits_once(self):
+        # diamond: the join is refreshed only once, after both of its parents completed
+        root = Firework(Task1(), fw_id=1, state='RUNNING')
+        left = Firework(Task1(), fw_id=2, parents=root, state='RUNNING')
+        right = Firework(Task1(), fw_id=3, parents=root, state='RUNNING')
+        join = Firework(Task1(), fw_id=4, parents=[left, right])
+        for fw in [root, left, right]:
+            fw.launches = [self._completed_launch(fw.fw_id)]
+        wflow = Workflow([root, left, right, join])
+
+        visits = []
+        refresh_fw = wflow._refresh_fw
+
+        def counting_refresh_fw(fw_id, updated_ids):
+            visits.append(fw_id)
+            return refresh_fw(fw_id, updated_ids)
+
+        wflow._refresh_fw = counting_refresh_fw
+        self.assertEqual(wflow.refresh(1), {1, 2, 3, 4})
+        self.assertEqual(sorted(visits), [1, 2, 3, 4])
+        self.assertEqual(visits[-1], 4)
+        self.assertEqual(wflow.fw_states, {1: 'COMPLETED', 2: 'COMPLETED', 3: 'COMPLETED',
+                                           4: 'READY'})
+
+    def test_to_db_update(self):
+        self.fw1.state = 'RUNNING'
+        self.fw1.launches = [self._completed_launch(self.fw1.fw_id)]
+        wflow = Workflow([self.fw1, self.fw2, self.fw3])
+        self.assertIsNone(wflow.to_db_update())
+        wflow._clear_changes()
+
+        wflow.refresh(self.fw1.fw_id)
+        update = wflow.to_db_update()
+        self.assertEqual(update['$set'].pop('state'), 'RUNNING')
+        self.assertEqual(update['$set'].pop('updated_on'), wflow.updated_on)
+        self.assertEqual(update, {'$set': {'fw_states.{}'.format(self.fw1.fw_id): 'COMPLETED',
+                                           'fw_states.{}'.format(self.fw2.fw_id): 'READY',
+                                           'fw_states.{}'.format(self.fw3.fw_id): 'READY'}})
+        wflow._clear_changes()
+
+        wflow.links.remove_link(self.fw1.fw_id, self.fw3.fw_id)
+        update = wflow.to_db_update()
+        self.assertEqual(update['$set']['links.{}'.format(self.fw1.fw_id)], [self.fw2.fw_id])
+        self.assertEqual(update['$unset'], {'parent_links.{}'.format(self.fw3.fw_id): ''})
+        self.assertNotIn('fw_states.{}'.format(self.fw1.fw_id), update['$set'])
+        wflow._clear_changes()
+
+        # structural changes require the whole document
+        wflow.append_wf(Workflow([Firework(Task1())]), [self.fw2.fw_id])
+        self.assertIsNone(wflow.to_db_update())
+
 
 if __name__ == '__main__':
     unittest.main()
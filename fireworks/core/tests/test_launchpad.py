@@ -15,18 +15,27 @@ import os
 import glob
 import shutil
 import datetime
+import json
+import threading
 from multiprocessing import Process
 import filecmp
 
-from pymongo import MongoClient
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from pymongo import ASCENDING, DESCENDING, MongoClient, UpdateOne
 from pymongo.errors import OperationFailure
 
-from fireworks import Firework, Workflow, LaunchPad, FWorker
+from fireworks import Firework, Workflow, LaunchPad, FWorker, FWAction, Tracker
+from fireworks.core.launchpad import ACTIVE_LAUNCH, WFLock, LockedWorkflowError
 from fireworks.core.rocket_launcher import rapidfire, launch_rocket
 from fireworks.queue.queue_launcher import setup_offline_job
 from fireworks.user_objects.firetasks.script_task import ScriptTask, PyTask
 from fireworks.core.tests.tasks import ExceptionTestTask, ExecutionCounterTask, SlowAdditionTask, WaitWFLockTask
 from fireworks.core.tests.tasks import DetoursTask
+from fireworks.fw_config import MAINTAIN_OVERLAP_SECS, RUN_EXPIRATION_SECS
 import fireworks.fw_config
 from monty.os import cd
 
@@ -174,6 +183,729 @@ class LaunchPadTest(unittest.TestCase):
         num_wfs_in_db = len(self.lp.get_wf_ids({"name": "lorem wf"}))
         self.assertEqual(num_wfs_in_db, len(wfs))
 
+    def test_upsert_fws(self):
+        fw = Firework(ScriptTask.from_str('echo "hello"'), spec={'a': 1, 'b': 2}, name="hello")
+        self.lp.add_wf(fw)
+        loaded_fw = self.lp.get_fw_by_id(1)
+        loaded_fw.spec['a'] = 3
+        del loaded_fw.spec['b']
+        loaded_fw.state = 'DEFUSED'
+        new_fws = [Firework(ScriptTask.from_str('echo "new"'), name="new") for _ in range(3)]
+        old_ids = sorted(f.fw_id for f in new_fws)
+
+        get_new_fw_id = self.lp.get_new_fw_id
+        bulk_write = self.lp.fireworks.bulk_write
+        with mock.patch.object(self.lp, 'get_new_fw_id', wraps=get_new_fw_id) as m_id, \
+                mock.patch.object(self.lp.fireworks, 'bulk_write', wraps=bulk_write) as m_write:
+            old_new = self.lp._upsert_fws(new_fws + [loaded_fw], reassign_all=False)
+
+        # the new FWs get one contiguous block of ids, in the order of their old ids
+        m_id.assert_called_once_with(quantity=3)
+        self.assertEqual([old_new[i] for i in old_ids], [2, 3, 4])
+        self.assertEqual(self.lp.fireworks.count({'name': 'new'}), 3)
+
+        # the loaded FW is only patched, all FWs are written in one bulk_write
+        m_write.assert_called_once()
+        requests = m_write.call_args[0][0]
+        self.assertEqual(len(requests), 4)
+        patch = [r for r in requests if isinstance(r, UpdateOne)]
+        self.assertEqual(len(patch), 1)
+        self.assertEqual(patch[0]._filter, {'fw_id': 1})
+        self.assertEqual(set(patch[0]._doc['$set']), {'spec.a', 'state', 'updated_on'})
+        self.assertEqual(patch[0]._doc['$unset'], {'spec.b': ''})
+
+        fw_dict = self.lp.fireworks.find_one({'fw_id': 1})
+        self.assertEqual(fw_dict['spec']['a'], 3)
+        self.assertNotIn('b', fw_dict['spec'])
+        self.assertEqual(fw_dict['state'], 'DEFUSED')
+        self.assertEqual(fw_dict['name'], 'hello')
+
+        # nothing is written when nothing changed
+        with mock.patch.object(self.lp.fireworks, 'bulk_write') as m_write:
+            self.lp._upsert_fws([loaded_fw])
+        m_write.assert_not_called()
+
+    def test_update_wf(self):
+        def assert_wf_doc(wf_dict, wf):
+            # the datetimes lose their microseconds in the database
+            wf_dict.pop('_id')
+            wf_dict.pop('lock_stats')
+            expected = wf.to_db_dict()
+            for k in ('created_on', 'updated_on'):
+                self.assertLess(abs(wf_dict.pop(k) - expected.pop(k)),
+                                datetime.timedelta(milliseconds=1))
+            self.assertEqual(sorted(wf_dict.pop('nodes')), sorted(expected.pop('nodes')))
+            self.assertEqual(wf_dict, expected)
+
+        fw1 = Firework(ScriptTask.from_str('echo "1"'), fw_id=1)
+        fw2 = Firework(ScriptTask.from_str('echo "2"'), fw_id=2)
+        fw3 = Firework(ScriptTask.from_str('echo "3"'), fw_id=3)
+        self.lp.add_wf(Workflow([fw1, fw2, fw3], {fw1: [fw2, fw3]}))
+
+        # complete fw 1 without refreshing the WF
+        with mock.patch.object(self.lp, '_refresh_wfs'):
+            _, launch_id = self.lp.checkout_fw(self.fworker, MODULE_DIR, fw_id=1)
+            self.lp.complete_launch(launch_id, FWAction())
+
+        update_one = self.lp.workflows.update_one
+        with fireworks.core.launchpad.WFLock(self.lp, 1):
+            wf = self.lp.get_wf_by_fw_id_lzyfw(1)
+            updated_ids = wf.refresh(1)
+            with mock.patch.object(self.lp.workflows, 'update_one', wraps=update_one) as m_update:
+                self.lp._update_wf(wf, updated_ids)
+
+            # only the changed fw_states are written
+            m_update.assert_called_once()
+            wf_update = m_update.call_args[0][1]
+            self.assertEqual(set(wf_update['$set']),
+                             {'fw_states.1', 'fw_states.2', 'fw_states.3', 'state', 'updated_on'})
+
+            # the lock is kept
+            wf_dict = self.lp.workflows.find_one({'nodes': 1})
+            self.assertTrue(wf_dict.pop('locked'))
+            assert_wf_doc(wf_dict, wf)
+            self.assertEqual(wf_dict['fw_states'], {'1': 'COMPLETED', '2': 'READY', '3': 'READY'})
+            self.assertEqual(wf_dict['parent_links'], {'2': [1], '3': [1]})
+        self.assertNotIn('locked', self.lp.workflows.find_one({'nodes': 1}))
+
+        # appending a WF still rewrites the whole document
+        fw4 = Firework(ScriptTask.from_str('echo "4"'))
+        with mock.patch.object(self.lp.workflows, 'update_one', wraps=update_one) as m_update:
+            self.lp.append_wf(Workflow([fw4]), [2])
+        wf_updates = [c[0][1] for c in m_update.call_args_list if '$set' in c[0][1]]
+        self.assertEqual(len(wf_updates), 1)
+        self.assertTrue({'links', 'parent_links', 'nodes', 'fw_states'} <= set(wf_updates[0]['$set']))
+
+        wf = self.lp.get_wf_by_fw_id(1)
+        wf_dict = self.lp.workflows.find_one({'nodes': 1})
+        self.assertNotIn('locked', wf_dict)
+        assert_wf_doc(wf_dict, wf)
+        self.assertEqual(wf_dict['links']['2'], [4])
+        self.assertEqual(wf_dict['parent_links']['4'], [2])
+
+    def test_checkout_fw(self):
+        fw1 = Firework(ScriptTask.from_str('echo "1"'), fw_id=1)
+        fw2 = Firework(ScriptTask.from_str('echo "2"'), fw_id=2, parents=[fw1])
+        fw3 = Firework(ScriptTask.from_str('echo "3"'), fw_id=3)
+        fw4 = Firework(ScriptTask.from_str('echo "4"'), fw_id=4)
+        self.lp.add_wf(Workflow([fw1, fw2, fw3, fw4]))
+
+        def assert_wf_state(fw_states, state):
+            wf_dict = self.lp.workflows.find_one({'nodes': 1})
+            self.assertEqual(wf_dict['fw_states'], fw_states)
+            self.assertEqual(wf_dict['state'], state)
+            self.assertEqual(self.lp.get_wf_by_fw_id(1).state, state)
+
+        # checking out a single Firework updates the WF without a refresh
+        with mock.patch.object(self.lp, '_refresh_wf') as m_refresh:
+            m_fw, launch_id = self.lp.checkout_fw(self.fworker, MODULE_DIR, fw_id=3,
+                                                  state='RESERVED')
+            self.assertEqual(m_fw.state, 'RESERVED')
+            assert_wf_state({'1': 'READY', '2': 'WAITING', '3': 'RESERVED', '4': 'READY'},
+                            'RESERVED')
+
+            m_fw, launch_id = self.lp.checkout_fw(self.fworker, MODULE_DIR, fw_id=1)
+            self.assertEqual(m_fw.state, 'RUNNING')
+            self.assertEqual(m_fw.launches[0].launch_id, launch_id)
+            assert_wf_state({'1': 'RUNNING', '2': 'WAITING', '3': 'RESERVED', '4': 'READY'},
+                            'RUNNING')
+
+            # the reserved launch is reused
+            m_fw, launch_id_3 = self.lp.checkout_fw(self.fworker, MODULE_DIR, fw_id=3)
+            self.assertEqual([l.launch_id for l in m_fw.launches], [launch_id - 1])
+            self.assertEqual(launch_id_3, launch_id - 1)
+            assert_wf_state({'1': 'RUNNING', '2': 'WAITING', '3': 'RUNNING', '4': 'READY'},
+                            'RUNNING')
+        m_refresh.assert_not_called()
+        self.assertEqual(self.lp.get_fw_by_id(3).launches[0].state, 'RUNNING')
+
+        # a locked WF is refreshed as usual
+        self.lp.workflows.update_one({'nodes': 1}, {'$set': {'locked': True}})
+        with mock.patch.object(self.lp, '_refresh_wf') as m_refresh:
+            self.lp.checkout_fw(self.fworker, MODULE_DIR, fw_id=4)
+        m_refresh.assert_called_once_with(4)
+
+    def test_defer_refresh(self):
+        lp_dict = self.lp.to_dict()
+        lp_dict['defer_refresh'] = True
+        deferred_lp = LaunchPad.from_dict(lp_dict)
+        self.assertTrue(deferred_lp.to_dict()['defer_refresh'])
+
+        parents = [Firework(ScriptTask.from_str('echo "parent"'), fw_id=i) for i in range(1, 6)]
+        child = Firework(ScriptTask.from_str('echo "child"'), fw_id=6)
+        self.lp.add_wf(Workflow(parents + [child], {p: [child] for p in parents}))
+        self.lp.add_wf(Firework(ScriptTask.from_str('echo "single"'), fw_id=7))
+
+        # the completions are queued instead of refreshing the WFs
+        for fw_id in [1, 2, 3, 4, 5, 7]:
+            _, launch_id = deferred_lp.checkout_fw(self.fworker, MODULE_DIR, fw_id=fw_id)
+            deferred_lp.complete_launch(launch_id, FWAction())
+        self.assertEqual(self.lp.refresh_events.count(), 6)
+        self.assertEqual(self.lp.get_fw_by_id(1).state, 'RUNNING')
+        self.assertEqual(self.lp.get_fw_by_id(6).state, 'WAITING')
+
+        # each WF is refreshed and written once for all of its events
+        with mock.patch.object(self.lp, '_update_wf', wraps=self.lp._update_wf) as m_update:
+            stats = self.lp.refresh_queued_wfs(max_events=5)
+            self.assertEqual(stats['events'], 5)
+            self.assertEqual(stats['batch_sizes'], [5])
+            self.assertEqual(m_update.call_count, 1)
+            self.assertEqual(self.lp.get_fw_by_id(7).state, 'RUNNING')
+
+            stats = self.lp.refresh_queued_wfs()
+            self.assertEqual(stats['batch_sizes'], [1])
+            self.assertEqual(m_update.call_count, 2)
+        self.assertEqual(len(stats['latencies']), 1)
+        self.assertGreaterEqual(stats['latencies'][0], 0)
+
+        self.assertEqual(self.lp.refresh_events.count(), 0)
+        for fw_id in [1, 2, 3, 4, 5, 7]:
+            self.assertEqual(self.lp.get_fw_by_id(fw_id).state, 'COMPLETED')
+        self.assertEqual(self.lp.get_fw_by_id(6).state, 'READY')
+        self.assertEqual(self.lp.refresh_queued_wfs()['events'], 0)
+
+    def test_checkout_fws(self):
+        parents = [Firework(ScriptTask.from_str('echo "parent"'), fw_id=i) for i in range(1, 5)]
+        child = Firework(ScriptTask.from_str('echo "child"'), fw_id=5)
+        self.lp.add_wf(Workflow(parents + [child], {p: [child] for p in parents}))
+        self.lp.add_wf(Firework(ScriptTask.from_str('echo "urgent"'), fw_id=6,
+                                spec={'_priority': 10}))
+
+        launch_dirs = [os.path.join(MODULE_DIR, str(i)) for i in range(3)]
+        checked_out = self.lp.checkout_fws(self.fworker, 3, launch_dirs)
+        self.assertEqual(len(checked_out), 3)
+        self.assertEqual(checked_out[0][0].fw_id, 6)
+        launch_ids = [launch_id for _, launch_id in checked_out]
+        self.assertEqual(launch_ids, list(range(launch_ids[0], launch_ids[0] + 3)))
+        for (m_fw, launch_id), launch_dir in zip(checked_out, launch_dirs):
+            self.assertEqual(m_fw.state, 'RUNNING')
+            self.assertEqual(m_fw.launches[-1].launch_id, launch_id)
+            self.assertEqual(self.lp.get_launch_by_id(launch_id).launch_dir, launch_dir)
+            self.assertEqual(self.lp.get_fw_by_id(m_fw.fw_id).state, 'RUNNING')
+        self.assertEqual(self.lp.fireworks.count({'_checkout': {'$exists': True}}), 0)
+
+        # only the remaining READY FWs are checked out
+        more = self.lp.checkout_fws(self.fworker, 5, launch_dirs * 2)
+        self.assertEqual(len(more), 2)
+        self.assertEqual(self.lp.checkout_fws(self.fworker, 5, launch_dirs * 2), [])
+        checked_out += more
+
+        # the launches are completed together, and each WF is refreshed once
+        with mock.patch.object(self.lp, '_update_wf', wraps=self.lp._update_wf) as m_update:
+            launches = self.lp.complete_launches([(launch_id, FWAction(), 'COMPLETED')
+                                                  for _, launch_id in checked_out])
+        self.assertEqual(m_update.call_count, 2)
+        self.assertEqual([l['state'] for l in launches], ['COMPLETED'] * 5)
+        for fw_id in range(1, 7):
+            if fw_id != 5:
+                self.assertEqual(self.lp.get_fw_by_id(fw_id).state, 'COMPLETED')
+        self.assertEqual(self.lp.get_fw_by_id(5).state, 'READY')
+
+        self.assertRaises(ValueError, self.lp.complete_launches, [(1000, None, 'COMPLETED')])
+
+    def test_ready_queue(self):
+        lp_dict = self.lp.to_dict()
+        lp_dict['ready_queue'] = True
+        queued_lp = LaunchPad.from_dict(lp_dict)
+        self.assertTrue(queued_lp.to_dict()['ready_queue'])
+
+        def queued_ids():
+            return sorted(e['fw_id'] for e in queued_lp.ready_fws.find())
+
+        fw1 = Firework(ScriptTask.from_str('echo "1"'), fw_id=1, spec={'_priority': 2})
+        fw2 = Firework(ScriptTask.from_str('echo "2"'), fw_id=2, parents=[fw1])
+        fw3 = Firework(ScriptTask.from_str('echo "3"'), fw_id=3, spec={'_fworker': 'other'})
+        fw4 = Firework(ScriptTask.from_str('echo "4"'), fw_id=4)
+        queued_lp.add_wf(Workflow([fw1, fw2, fw3, fw4]))
+        self.assertEqual(queued_ids(), [1, 3, 4])
+        self.assertEqual(queued_lp.ready_fws.find_one({'fw_id': 1})['spec'], {'_priority': 2})
+
+        # the checkout pops the queue and only reserves the popped firework
+        fireworks = queued_lp.fireworks
+        with mock.patch.object(fireworks, 'find_one_and_update',
+                               wraps=fireworks.find_one_and_update) as m_reserve:
+            m_fw, launch_id = queued_lp.checkout_fw(self.fworker, MODULE_DIR)
+        self.assertEqual(m_fw.fw_id, 1)
+        self.assertEqual(m_reserve.call_args[0][0], {'fw_id': 1, 'state': 'READY'})
+        self.assertEqual(queued_ids(), [3, 4])
+
+        # the children become READY when the firework is completed
+        queued_lp.complete_launch(launch_id, FWAction())
+        self.assertEqual(queued_ids(), [2, 3, 4])
+
+        # stale entries are skipped
+        queued_lp.pause_fw(2)
+        self.assertEqual(queued_lp.checkout_fw(self.fworker, MODULE_DIR)[0].fw_id, 4)
+        self.assertEqual(queued_lp.checkout_fw(self.fworker, MODULE_DIR), (None, None))
+        self.assertEqual(queued_ids(), [3])
+
+        # queries on other fields use the fireworks collection
+        self.assertIsNone(queued_lp._ready_queue_query(FWorker(query={'spec.x': 1}).query))
+        self.assertIsNotNone(queued_lp._ready_queue_query(FWorker(category='c').query))
+
+        # missing and stale entries are fixed by a rebuild
+        queued_lp.fireworks.update_one({'fw_id': 2}, {'$set': {'state': 'READY'}})
+        queued_lp.fireworks.update_one({'fw_id': 3}, {'$set': {'state': 'DEFUSED'}})
+        self.assertEqual(queued_lp.rebuild_ready_queue(), (1, 1))
+        self.assertEqual(queued_ids(), [2])
+        checked_out = queued_lp.checkout_fws(self.fworker, 3, [MODULE_DIR] * 3)
+        self.assertEqual([m_fw.fw_id for m_fw, _ in checked_out], [2])
+        self.assertEqual(queued_ids(), [])
+
+        # the indexes are created on first use, e.g. when enabling the queue on an existing DB
+        queued_lp.db.drop_collection('ready_fws')
+        queued_lp = LaunchPad.from_dict(lp_dict)
+        queued_lp.rebuild_ready_queue()
+        indexes = queued_lp.ready_fws.index_information().values()
+        self.assertTrue(any(idx['key'] == [('fw_id', 1)] and idx.get('unique') for idx in indexes))
+        self.assertIn([('spec._category', 1), ('spec._fworker', 1), ('spec._priority', -1),
+                       ('created_on', 1)], [idx['key'] for idx in indexes])
+
+    def test_id_blocks(self):
+        with mock.patch('fireworks.core.launchpad.ID_BLOCK_SIZE', 10):
+            lp1 = LaunchPad.from_dict(self.lp.to_dict())
+            lp2 = LaunchPad.from_dict(self.lp.to_dict())
+
+        assigner = lp1.fw_id_assigner
+        with mock.patch.object(assigner, 'find_one_and_update',
+                               wraps=assigner.find_one_and_update) as m_lease:
+            self.assertEqual([lp1.get_new_fw_id() for _ in range(10)], list(range(1, 11)))
+            self.assertEqual(m_lease.call_count, 1)
+        self.assertEqual(lp2.get_new_fw_id(), 11)
+        self.assertEqual(lp1.get_new_fw_id(quantity=3), 21)
+        # large ranges are leased on their own
+        self.assertEqual(lp1.get_new_fw_id(quantity=25), 31)
+        self.assertEqual(lp1.get_new_fw_id(), 24)
+        # the launch ids have their own blocks
+        self.assertEqual(lp2.get_new_launch_id(), 1)
+        self.assertEqual(lp1.get_new_launch_id(), 11)
+
+        lp1._restart_ids(1, 1)
+        self.assertEqual(lp1.get_new_fw_id(), 1)
+        self.assertEqual(lp1.get_new_launch_id(), 1)
+
+    def test_id_blocks_concurrent(self):
+        with mock.patch('fireworks.core.launchpad.ID_BLOCK_SIZE', 7):
+            lps = [LaunchPad.from_dict(self.lp.to_dict()) for _ in range(4)]
+        errors = []
+
+        def rocket(lp):
+            try:
+                for i in range(5):
+                    fws = [Firework(ScriptTask.from_str('echo "{}"'.format(i))) for _ in range(3)]
+                    lp.add_wf(Workflow(fws, {fws[0]: fws[1:]}), reassign_all=False)
+                    m_fw, launch_id = lp.checkout_fw(self.fworker, MODULE_DIR)
+                    if m_fw:
+                        lp.complete_launch(launch_id, FWAction())
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=rocket, args=(lp,)) for lp in lps]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(errors, [])
+
+        while self.lp.run_exists(self.fworker):
+            m_fw, launch_id = lps[0].checkout_fw(self.fworker, MODULE_DIR)
+            lps[0].complete_launch(launch_id, FWAction())
+
+        fw_ids = [f['fw_id'] for f in self.lp.fireworks.find()]
+        launch_ids = [l['launch_id'] for l in self.lp.launches.find()]
+        self.assertEqual(len(fw_ids), 60)
+        self.assertEqual(len(set(fw_ids)), 60)
+        self.assertEqual(len(launch_ids), 60)
+        self.assertEqual(len(set(launch_ids)), 60)
+        self.assertEqual(self.lp.get_fw_ids({'state': 'COMPLETED'}, count_only=True), 60)
+        for wf in self.lp.workflows.find():
+            self.assertEqual(sorted(wf['nodes']), sorted(int(k) for k in wf['fw_states']))
+
+    def test_get_wf_by_fw_id_bulk(self):
+        fws = [Firework(ScriptTask.from_str('echo "{}"'.format(i)), fw_id=i) for i in range(1, 6)]
+        self.lp.add_wf(Workflow(fws, {fws[0]: fws[1:]}))
+        launch_ids = []
+        for _ in range(3):
+            _, launch_id = self.lp.checkout_fw(self.fworker, MODULE_DIR)
+            self.lp.complete_launch(launch_id, FWAction(stored_data={'n': launch_id}))
+            launch_ids.append(launch_id)
+
+        # one query for the fireworks and one for all the launches
+        with mock.patch.object(self.lp.fireworks, 'find', wraps=self.lp.fireworks.find) as m_fws, \
+                mock.patch.object(self.lp.launches, 'find', wraps=self.lp.launches.find) as m_ls:
+            wf = self.lp.get_wf_by_fw_id(3)
+        self.assertEqual(m_fws.call_count, 1)
+        self.assertEqual(m_ls.call_count, 1)
+
+        expected = Workflow([self.lp.get_fw_by_id(i) for i in range(1, 6)], wf.links)
+        self.assertEqual([fw.to_dict() for fw in wf.fws], [fw.to_dict() for fw in expected.fws])
+        self.assertEqual(wf.fw_states, expected.fw_states)
+        self.assertEqual(wf.state, expected.state)
+
+        # actions stored in GridFS are resolved
+        if self.lp.gridfs_fallback is not None:
+            action = FWAction(stored_data={'big': 'data'}).to_dict()
+            gridfs_id = self.lp.gridfs_fallback.put(json.dumps(action), encoding="utf-8")
+            self.lp.launches.update_one({'launch_id': launch_ids[1]},
+                                        {'$set': {'action': {'gridfs_id': str(gridfs_id)}}})
+            fw = [f for f in self.lp.get_wf_by_fw_id(1).fws if f.launches and
+                  f.launches[0].launch_id == launch_ids[1]][0]
+            self.assertEqual(fw.launches[0].action.stored_data, {'big': 'data'})
+
+        self.lp.fireworks.delete_one({'fw_id': 5})
+        self.assertRaises(ValueError, self.lp.get_wf_by_fw_id, 1)
+
+    def test_lazy_prefetch(self):
+        fw1 = Firework(ScriptTask.from_str('echo "1"'), fw_id=1)
+        fw2 = Firework(ScriptTask.from_str('echo "2"'), fw_id=2, parents=[fw1])
+        fw3 = Firework(ScriptTask.from_str('echo "3"'), fw_id=3, parents=[fw1])
+        fw4 = Firework(ScriptTask.from_str('echo "4"'), fw_id=4, parents=[fw2, fw3])
+        self.lp.add_wf(Workflow([fw1, fw2, fw3, fw4]))
+        with mock.patch.object(self.lp, '_refresh_wfs'):
+            _, launch_id = self.lp.checkout_fw(self.fworker, MODULE_DIR)
+            self.lp.complete_launch(launch_id, FWAction(update_spec={'x': 1}))
+
+        fireworks, launches = self.lp.fireworks, self.lp.launches
+        with mock.patch.object(fireworks, 'find', wraps=fireworks.find) as m_fws, \
+                mock.patch.object(launches, 'find', wraps=launches.find) as m_ls:
+            wf = self.lp.get_wf_by_fw_id_lzyfw(1, prefetch=[1])
+        self.assertEqual(m_fws.call_count, 1)
+        self.assertEqual(m_ls.call_count, 1)
+        self.assertEqual(sorted(f.fw_id for f in wf.fws if f._fw is not None), [1, 2, 3])
+
+        # the refresh is served from the prefetched fireworks
+        with mock.patch.object(fireworks, 'find_one', wraps=fireworks.find_one) as m_fw, \
+                mock.patch.object(launches, 'find', wraps=launches.find) as m_ls:
+            updated_ids = wf.refresh(1)
+        m_fw.assert_not_called()
+        m_ls.assert_not_called()
+        self.assertEqual(updated_ids, {1, 2, 3})
+        self.assertEqual(wf.id_fw[1].launches[0].launch_id, launch_id)
+        self.assertEqual(wf.id_fw[2].spec['x'], 1)
+        self.assertEqual(wf.fw_states, {1: 'COMPLETED', 2: 'READY', 3: 'READY', 4: 'WAITING'})
+
+        # and written as usual
+        with WFLock(self.lp, 1):
+            self.lp._update_wf(wf, updated_ids)
+        self.assertEqual(self.lp.get_fw_by_id(2).state, 'READY')
+        self.assertEqual(self.lp.get_fw_by_id(2).spec['x'], 1)
+        self.assertEqual(self.lp.get_fw_by_id(1).launches[0].launch_id, launch_id)
+
+    def test_iter_fws(self):
+        fws = [Firework(ScriptTask.from_str('echo "{}"'.format(i)), fw_id=i) for i in range(1, 6)]
+        self.lp.add_wf(Workflow(fws))
+        launch_ids = []
+        for _ in range(3):
+            _, launch_id = self.lp.checkout_fw(self.fworker, MODULE_DIR)
+            self.lp.complete_launch(launch_id, FWAction(stored_data={'n': launch_id}))
+            launch_ids.append(launch_id)
+
+        # the launches are joined with one query per batch of fireworks
+        with mock.patch.object(self.lp.launches, 'find', wraps=self.lp.launches.find) as m_ls:
+            fw_dicts = list(self.lp.iter_fws(sort=[('fw_id', ASCENDING)], batch_size=2))
+        self.assertEqual(m_ls.call_count, 2)
+        self.assertEqual([d['fw_id'] for d in fw_dicts], [1, 2, 3, 4, 5])
+        for d in fw_dicts:
+            self.assertEqual(d, self.lp.get_fw_dict_by_id(d['fw_id']))
+
+        # fields left out by the projection are not loaded
+        with mock.patch.object(self.lp.launches, 'find', wraps=self.lp.launches.find) as m_ls:
+            fw_dicts = list(self.lp.iter_fws({'state': 'COMPLETED'}, {'launches': False},
+                                             limit=2))
+        m_ls.assert_not_called()
+        self.assertEqual(len(fw_dicts), 2)
+        self.assertTrue(all('launches' not in d and 'spec' in d for d in fw_dicts))
+
+        launch_dicts = list(self.lp.iter_launches({'state': 'COMPLETED'},
+                                                  sort=[('launch_id', DESCENDING)],
+                                                  batch_size=2))
+        self.assertEqual([l['launch_id'] for l in launch_dicts], launch_ids[::-1])
+        self.assertEqual([l['action']['stored_data']['n'] for l in launch_dicts],
+                         launch_ids[::-1])
+
+    def test_get_wf_summary_dicts(self):
+        fw1 = Firework(ScriptTask.from_str('echo "1"'), name='a', fw_id=1)
+        fw2 = Firework(ScriptTask.from_str('echo "2"'), name='b', fw_id=2, parents=[fw1])
+        fw3 = Firework(ScriptTask.from_str('echo "3"'), name='c', fw_id=3)
+        self.lp.add_wf(Workflow([fw1, fw2], name='wf1'))
+        self.lp.add_wf(Workflow([fw3], name='wf2'))
+        _, launch_id = self.lp.checkout_fw(self.fworker, MODULE_DIR, fw_id=1)
+        self.lp.complete_launch(launch_id, FWAction())
+
+        for mode in ('less', 'more', 'all', 'reservations'):
+            with mock.patch.object(self.lp.fireworks, 'find',
+                                   wraps=self.lp.fireworks.find) as m_fws, \
+                    mock.patch.object(self.lp.workflows, 'find',
+                                      wraps=self.lp.workflows.find) as m_wfs:
+                summaries = self.lp.get_wf_summary_dicts([3, 2], mode)
+            self.assertEqual(m_wfs.call_count, 1)
+            self.assertEqual(m_fws.call_count, 1)
+            self.assertEqual(summaries, [self.lp.get_wf_summary_dict(3, mode),
+                                         self.lp.get_wf_summary_dict(1, mode)])
+            self.assertEqual([d['name'] for d in summaries], ['wf2', 'wf1'])
+
+        summary = self.lp.get_wf_summary_dict(2, 'all')
+        self.assertEqual(summary['states'], {'a--1': 'COMPLETED', 'b--2': 'READY'})
+        self.assertEqual(summary['launch_dirs'], {'a--1': [MODULE_DIR], 'b--2': []})
+        self.assertEqual(summary['links'], {'a--1': ['b--2'], 'b--2': []})
+        self.assertEqual(self.lp.get_wf_summary_dict(1, 'less')['states_list'], 'C-REA')
+        self.assertRaises(ValueError, self.lp.get_wf_summary_dicts, [1, 4])
+
+    def _expire_launch(self, launch_id, secs=3600):
+        # move the last update of the launch back in time
+        l = self.lp.launches.find_one({'launch_id': launch_id})
+        for h in l['state_history']:
+            h['updated_on'] = (datetime.datetime.utcnow() -
+                               datetime.timedelta(seconds=secs)).isoformat()
+        self.lp.launches.replace_one({'launch_id': launch_id}, l)
+
+    def test_detect_lostruns_bulk(self):
+        fw1 = Firework(ScriptTask.from_str('echo "1"'), fw_id=1)
+        fw2 = Firework(ScriptTask.from_str('echo "2"'), fw_id=2)
+        fw3 = Firework(ScriptTask.from_str('echo "3"'), fw_id=3, parents=[fw1, fw2])
+        fw4 = Firework(ScriptTask.from_str('echo "4"'), fw_id=4)
+        fw5 = Firework(ScriptTask.from_str('echo "5"'), fw_id=5)
+        self.lp.add_wf(Workflow([fw1, fw2, fw3]))
+        self.lp.add_wf(Workflow([fw4]))
+        self.lp.add_wf(Workflow([fw5]))
+        launch_ids = {}
+        for fw_id in (1, 2, 4, 5):
+            _, launch_ids[fw_id] = self.lp.checkout_fw(self.fworker, MODULE_DIR, fw_id=fw_id)
+        for fw_id in (1, 2, 4):
+            self._expire_launch(launch_ids[fw_id])
+        # a RUNNING firework with a COMPLETED launch is inconsistent
+        self.lp.launches.update_one({'launch_id': launch_ids[5]},
+                                    {'$set': {'state': 'COMPLETED', 'action': FWAction().to_dict()}})
+
+        with mock.patch.object(self.lp.launches, 'find_one') as m_find_one:
+            lost = self.lp.detect_lostruns(expiration_secs=60)
+        m_find_one.assert_not_called()
+        self.assertEqual(lost, ([launch_ids[1], launch_ids[2], launch_ids[4]], [1, 2, 4], [5]))
+        self.assertEqual(self.lp.detect_lostruns(expiration_secs=60, query={'fw_id': 4}),
+                         ([launch_ids[4]], [4], []))
+
+        # each workflow is refreshed and rerun in a single pass
+        with mock.patch.object(self.lp, 'get_wf_by_fw_id_lzyfw',
+                               wraps=self.lp.get_wf_by_fw_id_lzyfw) as m_load:
+            self.lp.detect_lostruns(expiration_secs=60, rerun=True, refresh=True)
+        self.assertEqual(m_load.call_count, 5)
+        self.assertEqual([self.lp.get_fw_by_id(i).state for i in range(1, 6)],
+                         ['READY', 'READY', 'WAITING', 'READY', 'COMPLETED'])
+        self.assertEqual(self.lp.get_launch_by_id(launch_ids[1]).state, 'FIZZLED')
+        self.assertEqual(self.lp.detect_lostruns(expiration_secs=60), ([], [], []))
+
+    def test_detect_unreserved_bulk(self):
+        self.lp.add_wf(Workflow([Firework(ScriptTask.from_str('echo "{}"'.format(i)), fw_id=i)
+                                 for i in range(1, 4)]))
+        launch_ids = [self.lp.reserve_fw(self.fworker, MODULE_DIR)[1] for _ in range(3)]
+        self._expire_launch(launch_ids[0])
+        self._expire_launch(launch_ids[1])
+
+        with mock.patch.object(self.lp.fireworks, 'find_one') as m_find_one:
+            self.assertEqual(self.lp.detect_unreserved(expiration_secs=60), launch_ids[:2])
+        m_find_one.assert_not_called()
+
+        with mock.patch.object(self.lp, 'get_wf_by_fw_id_lzyfw',
+                               wraps=self.lp.get_wf_by_fw_id_lzyfw) as m_load:
+            self.assertEqual(self.lp.detect_unreserved(expiration_secs=60, rerun=True),
+                             launch_ids[:2])
+        self.assertEqual(m_load.call_count, 1)
+        self.assertEqual(self.lp.get_fw_ids({'state': 'READY'}), [1, 2])
+        self.assertEqual(self.lp.get_launch_by_id(launch_ids[0]).state, 'READY')
+        self.assertEqual(self.lp.detect_unreserved(expiration_secs=60), [])
+
+    def test_maintain_incremental(self):
+        self.lp.add_wf(Workflow([Firework(ScriptTask.from_str('echo "{}"'.format(i)), fw_id=i)
+                                 for i in range(1, 4)]))
+        launch_ids = [self.lp.checkout_fw(self.fworker, MODULE_DIR)[1] for _ in range(3)]
+        self._expire_launch(launch_ids[0], RUN_EXPIRATION_SECS + 3600)
+
+        # the first pass examines everything
+        metrics = self.lp.maintain_incremental()
+        self.assertFalse(metrics['incremental'])
+        self.assertEqual(metrics['lostruns']['launches'], 1)
+        self.assertEqual(self.lp.get_fw_by_id(1).state, 'FIZZLED')
+
+        # later passes only examine the launches that expired in between
+        self._expire_launch(launch_ids[1], RUN_EXPIRATION_SECS + 10 * MAINTAIN_OVERLAP_SECS)
+        self._expire_launch(launch_ids[2], RUN_EXPIRATION_SECS + 60)
+        metrics = self.lp.maintain_incremental()
+        self.assertTrue(metrics['incremental'])
+        self.assertEqual(metrics['lostruns']['launches'], 1)
+        self.assertEqual([self.lp.get_fw_by_id(i).state for i in range(1, 4)],
+                         ['FIZZLED', 'RUNNING', 'FIZZLED'])
+        self.assertEqual(metrics['inconsistent']['fws'], 0)
+        self.assertEqual(metrics['unreserved']['launches'], 0)
+
+        # a failed check is done again at the next pass
+        self.lp.maintenance.update_one({'_id': 'watermarks'},
+                                       {'$set': {'lostruns': '2000-01-01T00:00:00'}})
+        with mock.patch.object(self.lp, 'complete_launches', side_effect=ValueError):
+            metrics = self.lp.maintain_incremental()
+        self.assertIn('error', metrics['lostruns'])
+        self.assertEqual(self.lp.maintenance.find_one()['lostruns'], '2000-01-01T00:00:00')
+        self.lp.maintain(infinite=False, incremental=True)
+        self.assertEqual(self.lp.get_fw_by_id(2).state, 'FIZZLED')
+        self.assertEqual(self.lp.maintenance_metrics.find().count(), 4)
+
+    def test_active_launches(self):
+        self.lp.add_wf(Workflow([Firework(ScriptTask.from_str('echo "{}"'.format(i)), fw_id=i)
+                                 for i in range(1, 3)]))
+        _, launch_id1 = self.lp.checkout_fw(self.fworker, MODULE_DIR, fw_id=1)
+        self.lp.complete_launch(launch_id1, FWAction())
+        self.lp.rerun_fw(1)
+        _, launch_id2 = self.lp.checkout_fw(self.fworker, MODULE_DIR, fw_id=1)
+        self.lp.complete_launch(launch_id2, FWAction())
+
+        def active_ids():
+            return sorted(l['launch_id'] for l in self.lp.launches.find({'active': ACTIVE_LAUNCH}))
+
+        self.assertEqual(active_ids(), [launch_id2])
+        self.assertEqual(self.lp.get_fw_ids({'state': 'COMPLETED'}, launches_mode=True), [1])
+        self.assertEqual(self.lp.get_fw_ids({'launch_id': launch_id1}, launches_mode=True), [])
+
+        # a launch archived while it runs is flagged when it completes
+        _, launch_id3 = self.lp.checkout_fw(self.fworker, MODULE_DIR, fw_id=2)
+        self.lp.rerun_fw(2)
+        self.lp.complete_launch(launch_id3, FWAction())
+        self.assertEqual(active_ids(), [launch_id2])
+
+        # the flags of older databases are set by the migration
+        self.lp.launches.update_many({}, {'$unset': {'active': ''}})
+        self.assertEqual(self.lp.mark_active_launches(), 2)
+        self.assertEqual(active_ids(), [launch_id2])
+
+        # a launch that is still active in another firework stays active
+        self.lp.fireworks.update_one({'fw_id': 2}, {'$push': {'launches': launch_id1}})
+        self.assertEqual(self.lp.mark_active_launches(), 1)
+        self.assertEqual(active_ids(), [launch_id1, launch_id2])
+
+        # writing an archived launch keeps it archived
+        self.lp.change_launch_dir(launch_id3, MODULE_DIR)
+        self.lp.set_reservation_id(launch_id3, 1234)
+        m_launch = self.lp.get_launch_by_id(launch_id3)
+        self.assertFalse(m_launch.active)
+        self.lp.launches.replace_one({'launch_id': launch_id3}, m_launch.to_db_dict())
+        self.assertEqual(active_ids(), [launch_id1, launch_id2])
+        self.assertNotIn('active', self.lp.get_launch_by_id(launch_id2).to_db_dict())
+
+    def test_future_run_exists(self):
+        fw1 = Firework(ScriptTask.from_str('echo "1"'), fw_id=1)
+        fw2 = Firework(ScriptTask.from_str('echo "2"'), fw_id=2, parents=[fw1])
+        self.lp.add_wf(Workflow([fw1, fw2]))
+        self.lp.add_wf(Firework(ScriptTask.from_str('echo "3"'), fw_id=3))
+        self.lp.checkout_fw(self.fworker, MODULE_DIR, fw_id=3)
+        _, launch_id = self.lp.checkout_fw(self.fworker, MODULE_DIR, fw_id=1)
+
+        # the WAITING children are found without loading any firework
+        with mock.patch.object(self.lp, 'get_fw_dict_by_id') as m_get:
+            self.assertTrue(self.lp.future_run_exists(self.fworker))
+        m_get.assert_not_called()
+        self.assertFalse(self.lp.future_run_exists(FWorker(category='other')))
+
+        # workflows without fw_states
+        self.lp.workflows.update_many({}, {'$unset': {'fw_states': ''}})
+        self.assertTrue(self.lp.future_run_exists(self.fworker))
+
+        self.lp.complete_launch(launch_id, FWAction())
+        self.assertTrue(self.lp.future_run_exists(self.fworker))
+        self.lp.checkout_fw(self.fworker, MODULE_DIR, fw_id=2)
+        self.assertFalse(self.lp.future_run_exists(self.fworker))
+
+    def test_wait_for_ready(self):
+        t0 = time.time()
+        self.assertFalse(self.lp.wait_for_ready(self.fworker, 0.5))
+        self.assertGreaterEqual(time.time() - t0, 0.5)
+
+        # wakes up when a FW becomes READY, long before the timeout
+        fw = Firework(ScriptTask.from_str('echo "1"'))
+        timer = threading.Timer(0.5, self.lp.add_wf, [fw])
+        timer.start()
+        t0 = time.time()
+        self.assertTrue(self.lp.wait_for_ready(self.fworker, 60))
+        self.assertLess(time.time() - t0, 10)
+        timer.join()
+        self.assertFalse(self.lp.wait_for_ready(FWorker(category='other'), 0.1))
+
+    def test_shared_mongo_client(self):
+        lp = LaunchPad.from_dict(self.lp.to_dict())
+        self.assertIs(lp.connection, self.lp.connection)
+        lp = LaunchPad(name=TESTDB_NAME, strm_lvl='ERROR', mongoclient_kwargs={'maxPoolSize': 5})
+        self.assertIsNot(lp.connection, self.lp.connection)
+        self.assertEqual(LaunchPad.from_dict(lp.to_dict()).mongoclient_kwargs, {'maxPoolSize': 5})
+
+        # a forked process gets its own client
+        with mock.patch('os.getpid', return_value=os.getpid() + 1):
+            lp = LaunchPad.from_dict(self.lp.to_dict())
+        self.assertIsNot(lp.connection, self.lp.connection)
+        self.assertEqual(lp.get_fw_ids(), [])
+
+    def test_ping_launches(self):
+        tracker = Tracker('ping_tracker.txt', nlines=2)
+        self.lp.add_wf(Firework(ScriptTask.from_str('echo "1"'), fw_id=1,
+                                spec={'_trackers': [tracker]}))
+        self.lp.add_wf(Firework(ScriptTask.from_str('echo "2"'), fw_id=2))
+        self.lp.add_wf(Firework(ScriptTask.from_str('echo "3"'), fw_id=3))
+        _, lid1 = self.lp.checkout_fw(self.fworker, MODULE_DIR, fw_id=1)
+        _, lid2 = self.lp.checkout_fw(self.fworker, MODULE_DIR, fw_id=2)
+        _, lid3 = self.lp.checkout_fw(self.fworker, MODULE_DIR, fw_id=3)
+        self.lp.complete_launch(lid3, FWAction())
+        with open(os.path.join(MODULE_DIR, 'ping_tracker.txt'), 'w') as f:
+            f.write('a\nb\nc')
+
+        ptime = datetime.datetime(2030, 1, 1)
+        try:
+            with mock.patch.object(self.lp, 'get_launch_by_id') as m_get:
+                self.lp.ping_launches([lid1, lid2, lid3], ptime, checkpoint={'step': 3})
+            tracker.track_file(MODULE_DIR)
+        finally:
+            os.remove(os.path.join(MODULE_DIR, 'ping_tracker.txt'))
+        m_get.assert_not_called()
+        for lid in (lid1, lid2):
+            running = self.lp.launches.find_one({'launch_id': lid})['state_history'][-1]
+            self.assertEqual(running['state'], 'RUNNING')
+            self.assertEqual(running['updated_on'], ptime.isoformat())
+            self.assertEqual(running['checkpoint'], {'step': 3})
+        self.assertIn('c', tracker.content)
+        self.assertEqual(self.lp.get_launch_by_id(lid1).trackers[0].content, tracker.content)
+        completed = self.lp.launches.find_one({'launch_id': lid3})['state_history']
+        self.assertNotEqual(completed[-2]['updated_on'], ptime.isoformat())
+        self.assertNotIn('checkpoint', completed[-2])
+
+    def test_rapidfire_batch(self):
+        fws = [Firework(ScriptTask.from_str('echo "{}"'.format(i))) for i in range(5)]
+        child = Firework(ScriptTask.from_str('echo "child"'), parents=fws)
+        self.lp.add_wf(Workflow(fws + [child]))
+
+        with mock.patch.object(self.lp, 'complete_launch') as m_complete:
+            rapidfire(self.lp, self.fworker, m_dir=MODULE_DIR, batch_size=3)
+        m_complete.assert_not_called()
+        self.assertEqual(self.lp.get_fw_ids({'state': 'COMPLETED'}, count_only=True), 6)
+        self.assertEqual(len(glob.glob(os.path.join(MODULE_DIR, "launcher_*"))), 6)
+        for ldir in glob.glob(os.path.join(MODULE_DIR, "launcher_*")):
+            shutil.rmtree(ldir)
+
+    def test_rapidfire_threads(self):
+        fws = [Firework(ScriptTask.from_str('pwd', {'stdout_file': 'pwd.txt'})) for i in range(4)]
+        child = Firework(ScriptTask.from_str('pwd', {'stdout_file': 'pwd.txt'}), parents=fws)
+        self.lp.add_wf(Workflow(fws + [child]))
+
+        cwd = os.getcwd()
+        rapidfire(self.lp, self.fworker, m_dir=MODULE_DIR, nthreads=3)
+        self.assertEqual(os.getcwd(), cwd)
+        self.assertEqual(self.lp.get_fw_ids({'state': 'COMPLETED'}, count_only=True), 5)
+        ldirs = glob.glob(os.path.join(MODULE_DIR, "launcher_*"))
+        self.assertEqual(len(ldirs), 5)
+        for ldir in ldirs:
+            # the scripts and files of each Rocket are in its own launcher directory
+            with open(os.path.join(ldir, 'pwd.txt')) as f:
+                self.assertEqual(os.path.realpath(f.read().strip()), os.path.realpath(ldir))
+            self.assertTrue(os.path.exists(os.path.join(ldir, 'FW.json')))
+            shutil.rmtree(ldir)
+
+        self.assertRaises(ValueError, rapidfire, self.lp, self.fworker, m_dir=MODULE_DIR,
+                          nthreads=2, batch_size=2)
+
 
 class LaunchPadDefuseReigniteRerunArchiveDeleteTest(unittest.TestCase):
 
@@ -1165,6 +1897,113 @@ class WFLockTest(unittest.TestCase):
 
         self.assertEqual(fast_fw.state, 'FIZZLED')
 
+    def test_lease(self):
+        with WFLock(self.lp, 1) as lock:
+            locked = self.lp.workflows.find_one({'nodes': 1})['locked']
+            self.assertEqual(locked['owner'], lock.owner)
+            self.assertGreater(locked['expires'], datetime.datetime.utcnow())
+            self.assertFalse(lock.takeover)
+        # the renewal is over before the release
+        self.assertFalse(lock._renewal.is_alive())
+        wf_dict = self.lp.workflows.find_one({'nodes': 1})
+        self.assertNotIn('locked', wf_dict)
+        self.assertEqual(wf_dict['lock_stats']['acquisitions'], 1)
+
+    def test_lease_renewal(self):
+        lock = WFLock(self.lp, 1)
+        lock.lease_secs = 0.3
+        with lock:
+            expires = self.lp.workflows.find_one({'nodes': 1})['locked']['expires']
+            time.sleep(0.5)
+            # the lease was renewed, so it can't be taken over
+            self.assertGreater(self.lp.workflows.find_one({'nodes': 1})['locked']['expires'],
+                               expires)
+            self.assertRaises(LockedWorkflowError, WFLock(self.lp, 1, 0.2).__enter__)
+
+    def test_lease_takeover(self):
+        expired = datetime.datetime.utcnow() - datetime.timedelta(seconds=1)
+        self.lp.workflows.update_one({'nodes': 1}, {'$set': {'locked': {'owner': 'crashed',
+                                                                         'expires': expired}}})
+        with WFLock(self.lp, 1) as lock:
+            self.assertTrue(lock.takeover)
+            self.assertEqual(lock.retries, 0)
+        wf_dict = self.lp.workflows.find_one({'nodes': 1})
+        self.assertNotIn('locked', wf_dict)
+        self.assertEqual(wf_dict['lock_stats']['takeovers'], 1)
+
+        # a lock without a lease (e.g. written by an older version) is not taken over
+        self.lp.workflows.update_one({'nodes': 1}, {'$set': {'locked': True}})
+        self.assertRaises(LockedWorkflowError, WFLock(self.lp, 1, 0.2).__enter__)
+        with WFLock(self.lp, 1, 0, kill=True) as lock:
+            self.assertTrue(lock.takeover)
+        self.assertNotIn('locked', self.lp.workflows.find_one({'nodes': 1}))
+
+    def test_wakeup(self):
+        # a waiter in the same process gets the lock as soon as it is released
+        acquired = []
+
+        def wait_for_lock():
+            with WFLock(self.lp, 1) as lock:
+                acquired.append((time.time(), lock.retries))
+
+        with WFLock(self.lp, 1):
+            waiter = threading.Thread(target=wait_for_lock)
+            waiter.start()
+            time.sleep(1)
+            released = time.time()
+        waiter.join()
+
+        acquired_time, retries = acquired[0]
+        self.assertGreater(retries, 0)
+        self.assertLess(acquired_time - released, 0.5)
+        lock_stats = self.lp.workflows.find_one({'nodes': 1})['lock_stats']
+        self.assertEqual(lock_stats['acquisitions'], 2)
+        self.assertEqual(lock_stats['retries'], retries)
+        self.assertGreater(lock_stats['wait_secs'], 0.9)
+
+    def test_wakeup_change_stream(self):
+        # a waiter watching the workflow gets the lock as soon as any process releases it
+        workflows = self.lp.workflows
+
+        class ReleaseStream(object):
+            closed = False
+
+            def try_next(self):
+                if 'locked' in workflows.find_one({'nodes': 1}):
+                    time.sleep(0.01)
+                    return None
+                return {'operationType': 'update'}
+
+            def close(self):
+                self.closed = True
+
+        stream = ReleaseStream()
+        acquired = []
+
+        def wait_for_lock():
+            with WFLock(self.lp, 1) as lock:
+                acquired.append(time.time())
+
+        change_streams = self.lp._change_streams
+        self.lp._change_streams = None
+        try:
+            with mock.patch.object(workflows, 'watch', return_value=stream) as m_watch, \
+                    mock.patch('fireworks.core.launchpad.WFLOCK_POLL_MAX_SECS', 10):
+                with WFLock(self.lp, 1):
+                    waiter = threading.Thread(target=wait_for_lock)
+                    waiter.start()
+                    time.sleep(2)
+                    # the releases of other processes do not notify this process
+                    with mock.patch.object(WFLock, '_released'):
+                        released = time.time()
+                waiter.join()
+        finally:
+            self.lp._change_streams = change_streams
+
+        m_watch.assert_called_once()
+        self.assertTrue(stream.closed)
+        self.assertLess(acquired[0] - released, 0.5)
+
 
 class LaunchPadOfflineTest(unittest.TestCase):
 
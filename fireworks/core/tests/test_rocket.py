@@ -2,9 +2,17 @@ from __future__ import unicode_literals, division
 
 import unittest
 import os
+import time
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
 
 from fireworks import Firework, LaunchPad, FWorker
+from fireworks.core.rocket import CheckpointWriter
 from fireworks.core.rocket_launcher import launch_rocket
+from fireworks.user_objects.firetasks.script_task import PyTask
 from fireworks.core.tests.tasks import ExceptionTestTask, MalformedAdditionTask
 
 
@@ -58,5 +66,31 @@ class RocketTest(unittest.TestCase):
         self.assertEqual(fw.state, 'FIZZLED')
 
 
+    def test_checkpoint_writer(self):
+        lp = mock.Mock()
+        lp.ping_launch.side_effect = lambda *args, **kwargs: time.sleep(0.2)
+        writer = CheckpointWriter(lp, '.', 1, consistency='async')
+        for i in range(10):
+            writer.write({'_task_n': i})
+        writer.flush()
+        # the checkpoints written during the first write are coalesced into the latest one
+        self.assertLessEqual(lp.ping_launch.call_count, 2)
+        lp.ping_launch.assert_called_with(1, checkpoint={'_task_n': 9})
+
+        writer = CheckpointWriter(lp, '.', 1, consistency='sync')
+        writer.write({'_task_n': 0})
+        lp.ping_launch.assert_called_with(1, checkpoint={'_task_n': 0})
+
+    def test_async_checkpoints(self):
+        fw = Firework([PyTask(func='time.sleep', args=[0]) for _ in range(3)])
+        self.lp.add_wf(fw)
+        with mock.patch('fireworks.core.rocket.CHECKPOINT_CONSISTENCY', 'async'):
+            launch_rocket(self.lp, self.fworker)
+        launch = self.lp.get_fw_by_id(1).launches[0]
+        self.assertEqual(launch.state, 'COMPLETED')
+        # the last checkpoint was written before the launch was completed
+        self.assertEqual(launch.state_history[-2]['checkpoint']['_task_n'], 2)
+
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
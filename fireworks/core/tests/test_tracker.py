@@ -21,6 +21,11 @@ import shutil
 import sys
 import argparse
 
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
 from fireworks.core.firework import Firework, Tracker, FWorker, Workflow
 from fireworks.core.launchpad import LaunchPad
 from fireworks.core.rocket_launcher import launch_rocket
@@ -92,6 +97,41 @@ class TrackerTest(unittest.TestCase):
         finally:
             self._teardown([self.dest1])
 
+    def test_track_file_incremental(self):
+        """
+        Only the end of the file is read, and nothing if it did not change
+        """
+        self._teardown([self.dest1])
+        try:
+            with open(self.dest1, 'w') as f:
+                f.write(''.join('{}\n'.format(i) for i in range(5000)))
+            with mock.patch.object(Tracker, '_read_tail', autospec=True,
+                                   side_effect=Tracker._read_tail) as m_read:
+                self.assertEqual('4998\n4999', self.tracker1.track_file())
+                self.assertLess(self.tracker1.size - m_read.call_args[0][0].offset, 20)
+
+                with open(self.dest1, 'a') as f:
+                    f.write('5000\n50')
+                # the tracker is stored in the launch between two pings
+                tracker = Tracker.from_dict(self.tracker1.to_dict())
+                self.assertEqual('5000\n50', tracker.track_file())
+                self.assertEqual(m_read.call_args[0][2], self.tracker1.offset)
+                with open(self.dest1, 'a') as f:
+                    f.write('01\n')
+                self.assertEqual('5000\n5001', tracker.track_file())
+
+                m_read.reset_mock()
+                self.assertEqual('5000\n5001', tracker.track_file())
+                m_read.assert_not_called()
+
+            # a new file is read from the start
+            os.remove(self.dest1)
+            with open(self.dest1, 'w') as f:
+                f.write('a\nb\n')
+            self.assertEqual('a\nb', tracker.track_file())
+        finally:
+            self._teardown([self.dest1])
+
     def test_tracker_failed_fw(self):
         """
         Add a bad firetask to workflow and test the tracking
@@ -4,6 +4,8 @@ from collections import defaultdict
 from pymongo import DESCENDING
 from tabulate import tabulate
 
+from fireworks.core.launchpad import ACTIVE_LAUNCH
+
 __author__ = 'Anubhav Jain <ajain@lbl.gov>'
 
 separator_str = ":%%:"
@@ -122,8 +124,7 @@ class Introspector:
 
         q = {"state": "FIZZLED"}
         if coll == "launches":
-            all_launch_ids = self.lpad._get_active_launch_ids()
-            q["launch_id"] = {"$in": all_launch_ids}
+            q["active"] = ACTIVE_LAUNCH
 
         for doc in self.db[coll].find(q, {state_key: 1}, sort=sort_key).limit(limit):
             nsamples_fizzled += 1
@@ -6,12 +6,13 @@ from __future__ import unicode_literals
 This module contains methods for launching several Rockets in a parallel environment
 """
 
-from multiprocessing import Process, Manager
+from multiprocessing import Process, Lock, RawArray
 import os
 import threading
 import time
 
 from fireworks.fw_config import FWData, PING_TIME_SECS, DS_PASSWORD, RAPIDFIRE_SLEEP_SECS
+from fireworks.core.launchpad import LaunchPad
 from fireworks.core.rocket_launcher import rapidfire
 from fireworks.utilities.fw_utilities import DataServer, get_fw_logger, log_multi, get_my_host
 
@@ -23,33 +24,78 @@ __email__ = 'xqu@lbl.gov'
 __date__ = 'Aug 19, 2013'
 
 
-def ping_multilaunch(port, stop_event):
+class RunningIDs(object):
+    """
+    The launch id run by each sub job, by process id, in shared memory. It replaces a
+    Manager().dict(), which needs its own server process, and supports the few dict operations
+    used by the sub jobs and the ping thread. A process id can be added as long as fewer than size
+    process ids are recorded. A launch id of None means that the process is not running a launch.
+    """
+
+    def __init__(self, size):
+        """
+        Args:
+            size (int): max number of processes, i.e. the number of sub jobs
+        """
+        self._lock = Lock()
+        self._pids = RawArray('l', size)
+        self._launch_ids = RawArray('l', size)
+
+    def __setitem__(self, pid, launch_id):
+        with self._lock:
+            pids = list(self._pids)
+            if pid in pids:
+                i = pids.index(pid)
+            elif 0 in pids:
+                i = pids.index(0)
+                self._pids[i] = pid
+            else:
+                raise ValueError("No room left for process {}".format(pid))
+            self._launch_ids[i] = launch_id or 0
+
+    def __getitem__(self, pid):
+        return dict(self.items())[pid]
+
+    def items(self):
+        with self._lock:
+            return [(pid, lid or None) for pid, lid in zip(self._pids, self._launch_ids) if pid]
+
+    def values(self):
+        return [lid for _, lid in self.items()]
+
+
+def ping_multilaunch(port, stop_event, launchpad=None):
     """
     A single manager to ping all launches during multiprocess launches
 
     Args:
         port (int): Listening port number of the DataServer
         stop_event (Thread.Event): stop event
+        launchpad (LaunchPad): if set, ping through this LaunchPad instead of the DataServer
     """
-    ds = DataServer(address=('127.0.0.1', port), authkey=DS_PASSWORD)
-    ds.connect()
     fd = FWData()
-
-    lp = ds.LaunchPad()
+    if launchpad:
+        lp = launchpad
+    else:
+        ds = DataServer(address=('127.0.0.1', port), authkey=DS_PASSWORD)
+        ds.connect()
+        lp = ds.LaunchPad()
     while not stop_event.is_set():
+        live_ids = []
         for pid, lid in fd.Running_IDs.items():
             if lid:
                 try:
                     os.kill(pid, 0)  # throws OSError if the process is dead
-                    lp.ping_launch(lid)
+                    live_ids.append(lid)
                 except OSError:  # means this process is dead!
                     fd.Running_IDs[pid] = None
+        lp.ping_launches(live_ids)
 
         stop_event.wait(PING_TIME_SECS)
 
 
 def rapidfire_process(fworker, nlaunches, sleep, loglvl, port, node_list, sub_nproc, timeout,
-                      running_ids_dict, local_redirect):
+                      running_ids_dict, local_redirect, batch_size=1, lp_dict=None):
     """
     Initializes shared data with multiprocessing parameters and starts a rapidfire.
 
@@ -64,11 +110,17 @@ def rapidfire_process(fworker, nlaunches, sleep, loglvl, port, node_list, sub_np
         sub_nproc (int): number of processors of the sub job
         timeout (int): # of seconds after which to stop the rapidfire process
         local_redirect (bool): redirect standard input and output to local file
+        batch_size (int): number of FireWorks to check out and complete at once
+        lp_dict (dict): if set, the sub job connects to the database with its own LaunchPad
+            made from this dict, instead of using the LaunchPad of the DataServer
     """
-    ds = DataServer(address=('127.0.0.1', port), authkey=DS_PASSWORD)
-    ds.connect()
-    launchpad = ds.LaunchPad()
-    FWData().DATASERVER = ds
+    if lp_dict:
+        launchpad = LaunchPad.from_dict(lp_dict)
+    else:
+        ds = DataServer(address=('127.0.0.1', port), authkey=DS_PASSWORD)
+        ds.connect()
+        launchpad = ds.LaunchPad()
+        FWData().DATASERVER = ds
     FWData().MULTIPROCESSING = True
     FWData().NODE_LIST = node_list
     FWData().SUB_NPROCS = sub_nproc
@@ -78,7 +130,7 @@ def rapidfire_process(fworker, nlaunches, sleep, loglvl, port, node_list, sub_np
     l_logger = get_fw_logger('rocket.launcher', l_dir=l_dir, stream_level=loglvl)
     rapidfire(launchpad, fworker=fworker, m_dir=None, nlaunches=nlaunches,
               max_loops=-1, sleep_time=sleep, strm_lvl=loglvl, timeout=timeout,
-              local_redirect=local_redirect)
+              local_redirect=local_redirect, batch_size=batch_size)
     while nlaunches == 0:
         time.sleep(1.5) # wait for LaunchPad to be initialized
         launch_ids = FWData().Running_IDs.values()
@@ -90,14 +142,14 @@ def rapidfire_process(fworker, nlaunches, sleep, loglvl, port, node_list, sub_np
             log_multi(l_logger, 'Resubmit sub job')
             rapidfire(launchpad, fworker=fworker, m_dir=None, nlaunches=nlaunches,
                       max_loops=-1, sleep_time=sleep, strm_lvl=loglvl, timeout=timeout,
-                      local_redirect=local_redirect)
+                      local_redirect=local_redirect, batch_size=batch_size)
         else:
             break
     log_multi(l_logger, 'Sub job finished')
 
 
 def start_rockets(fworker, nlaunches, sleep, loglvl, port, node_lists, sub_nproc_list, timeout=None,
-                  running_ids_dict=None, local_redirect=False):
+                  running_ids_dict=None, local_redirect=False, batch_size=1, lp_dict=None):
     """
     Create each sub job and start a rocket launch in each one
 
@@ -112,12 +164,14 @@ def start_rockets(fworker, nlaunches, sleep, loglvl, port, node_lists, sub_nproc
         timeout (int): # of seconds after which to stop the rapidfire process
         running_ids_dict (dict): Shared dict between process to record IDs
         local_redirect (bool): redirect standard input and output to local file
+        batch_size (int): number of FireWorks to check out and complete at once
+        lp_dict (dict): if set, each sub job connects with its own LaunchPad made from this dict
     Returns:
         ([multiprocessing.Process]) all the created processes
     """
     processes = [Process(target=rapidfire_process,
                          args=(fworker, nlaunches, sleep, loglvl, port, nl, sub_nproc, timeout,
-                               running_ids_dict, local_redirect))
+                               running_ids_dict, local_redirect, batch_size, lp_dict))
                  for nl, sub_nproc in zip(node_lists, sub_nproc_list)]
     for p in processes:
         p.start()
@@ -155,7 +209,7 @@ def split_node_lists(num_jobs, total_node_list=None, ppn=24):
 # TODO: why is loglvl a required parameter??? Also nlaunches and sleep_time could have a sensible default??
 def launch_multiprocess(launchpad, fworker, loglvl, nlaunches, num_jobs, sleep_time,
                         total_node_list=None, ppn=1, timeout=None, exclude_current_node=False,
-                        local_redirect=False):
+                        local_redirect=False, batch_size=1, lp_per_process=False):
     """
     Launch the jobs in the job packing mode.
 
@@ -171,6 +225,9 @@ def launch_multiprocess(launchpad, fworker, loglvl, nlaunches, num_jobs, sleep_t
         timeout (int): # of seconds after which to stop the rapidfire process
         exclude_current_node: Don't use the script launching node as a compute node
         local_redirect (bool): redirect standard input and output to local file
+        batch_size (int): number of FireWorks to check out and complete at once
+        lp_per_process (bool): give each sub job its own LaunchPad (and database connection)
+            instead of sharing the LaunchPad through a single DataServer process
     """
     # parse node file contents
     if exclude_current_node:
@@ -184,21 +241,25 @@ def launch_multiprocess(launchpad, fworker, loglvl, nlaunches, num_jobs, sleep_t
             log_multi(l_logger, "The current node is not in the node list, keep the node list as is")
     node_lists, sub_nproc_list = split_node_lists(num_jobs, total_node_list, ppn)
 
-    # create shared dataserver
-    ds = DataServer.setup(launchpad)
-    port = ds.address[1]
+    if lp_per_process:
+        ds, port, lp_dict = None, None, launchpad.to_dict()
+    else:
+        # create shared dataserver
+        ds = DataServer.setup(launchpad)
+        port, lp_dict = ds.address[1], None
 
-    manager = Manager()
-    running_ids_dict = manager.dict()
+    running_ids_dict = RunningIDs(len(node_lists))
     # launch rapidfire processes
     processes = start_rockets(fworker, nlaunches, sleep_time, loglvl, port, node_lists,
                               sub_nproc_list, timeout=timeout, running_ids_dict=running_ids_dict,
-                              local_redirect=local_redirect)
+                              local_redirect=local_redirect, batch_size=batch_size,
+                              lp_dict=lp_dict)
     FWData().Running_IDs = running_ids_dict
 
     # start pinging service
     ping_stop = threading.Event()
-    ping_thread = threading.Thread(target=ping_multilaunch, args=(port, ping_stop))
+    ping_thread = threading.Thread(target=ping_multilaunch,
+                                   args=(port, ping_stop, launchpad if lp_per_process else None))
     ping_thread.start()
 
     # wait for completion
@@ -206,4 +267,5 @@ def launch_multiprocess(launchpad, fworker, loglvl, nlaunches, num_jobs, sleep_t
         p.join()
     ping_stop.set()
     ping_thread.join()
-    ds.shutdown()
+    if ds:
+        ds.shutdown()
@@ -82,6 +82,14 @@ def _addq_WF(q):
     return {
         "$and": [q, app.BASE_Q_WF, session.get('wf_filt', {}), filt_from_fw]}
 
+@app.before_request
+def reconnect_after_fork():
+    """Give each forked server process (e.g. gunicorn worker) its own MongoClient"""
+    if getattr(app, "lp", None) is not None and getattr(app, "lp_pid", None) != os.getpid():
+        app.lp = LaunchPad.from_dict(app.lp.to_dict())
+        app.lp_pid = os.getpid()
+
+
 @app.template_filter('datetime')
 def datetime(value):
     import datetime as dt
@@ -45,17 +45,30 @@ PRINT_FW_JSON = True
 PRINT_FW_YAML = False
 
 PING_TIME_SECS = 3600  # while Running a job, how often to ping back the server that we're still alive
+CHECKPOINT_CONSISTENCY = 'sync'  # 'sync' to write the checkpoint of a Firework before each task,
+# 'async' to write the latest one in the background
 RUN_EXPIRATION_SECS = PING_TIME_SECS * 4  # mark job as FIZZLED if not pinged in this time
 
 MAINTAIN_INTERVAL = 120  # seconds between maintenance intervals when running infinite maintenance
+MAINTAIN_OVERLAP_SECS = 600  # incremental maintenance also re-examines this many seconds before
+# the previous pass, to allow for clock differences between hosts
+MAINTAIN_METRICS_MAX = 10000  # number of incremental maintenance passes kept in maintenance_metrics
+
+REFRESHER_INTERVAL = 1  # seconds to sleep when no refreshes are queued for lpad admin refresher
 
 RESERVATION_EXPIRATION_SECS = 60 * 60 * 24 * 14  # a job can stay in a queue this long before we
 # cancel its reservation
 
 WFLOCK_EXPIRATION_SECS = 60 * 5  # wait this long for a WFLock before expiring
 WFLOCK_EXPIRATION_KILL = False  # kill WFLock on expiration (or give a warning)
+WFLOCK_LEASE_SECS = 60  # a WFLock not renewed for this long can be taken over
+WFLOCK_POLL_MAX_SECS = 2  # max seconds between attempts to acquire a WFLock
+
+ID_BLOCK_SIZE = 1  # number of fw_ids / launch_ids a LaunchPad leases at once from the database
 
 RAPIDFIRE_SLEEP_SECS = 60  # seconds to sleep between rapidfire loops
+RAPIDFIRE_POLL_SECS = 1  # first interval (seconds) between checks for READY FWs while sleeping, if
+# the database does not support change streams; the interval doubles after each check
 
 LAUNCHPAD_LOC = None  # where to find the my_launchpad.yaml file
 FWORKER_LOC = None  # where to find the my_fworker.yaml file
@@ -253,8 +253,14 @@ def rapidfire(launchpad, fworker, qadapter, launch_dir='.', nlaunches=0, njobs_q
                      >= timeout) or (nlaunches == 0 and not launchpad.future_run_exists(fworker)):
                 break
 
-            l_logger.info('Finished a round of launches, sleeping for {} secs'.format(sleep_time))
-            time.sleep(sleep_time)
+            if fill_mode or (njobs_queue and jobs_in_queue >= njobs_queue):
+                l_logger.info('Finished a round of launches, sleeping for {} secs'.format(sleep_time))
+                time.sleep(sleep_time)
+            else:
+                # nothing left to submit, wake up early when a FW becomes READY
+                l_logger.info('Finished a round of launches, sleeping for up to {} '
+                              'secs'.format(sleep_time))
+                launchpad.wait_for_ready(fworker, sleep_time)
             l_logger.info('Checking for Rockets to run...')
 
     except:
@@ -22,7 +22,7 @@ from pymongo import DESCENDING, ASCENDING
 import ruamel.yaml as yaml
 
 from fireworks.fw_config import RESERVATION_EXPIRATION_SECS, \
-    RUN_EXPIRATION_SECS, PW_CHECK_NUM, MAINTAIN_INTERVAL, CONFIG_FILE_DIR, \
+    RUN_EXPIRATION_SECS, PW_CHECK_NUM, MAINTAIN_INTERVAL, REFRESHER_INTERVAL, CONFIG_FILE_DIR, \
     LAUNCHPAD_LOC, FWORKER_LOC, WEBSERVER_PORT, WEBSERVER_HOST
 from fireworks.features.fw_report import FWReport
 from fireworks.features.introspect import Introspector
@@ -244,37 +244,90 @@ def get_fws(args):
     else:
         sort = None
 
-    if args.qid:
-        ids = lp.get_fw_ids_from_reservation_id(args.qid)
-        if query:
-            query['fw_id'] = {"$in": ids}
-            ids = lp.get_fw_ids(query, sort, args.max, launches_mode=args.launches_mode)
-
-    else:
-        ids = lp.get_fw_ids(query, sort, args.max, count_only=args.display_format == 'count',
-                            launches_mode=args.launches_mode)
-    fws = []
-    if args.display_format == 'ids':
-        fws = ids
-    elif args.display_format == 'count':
-        fws = [ids]
+    if args.display_format in ('ids', 'count'):
+        if args.qid:
+            ids = lp.get_fw_ids_from_reservation_id(args.qid)
+            if query:
+                query['fw_id'] = {"$in": ids}
+                ids = lp.get_fw_ids(query, sort, args.max, launches_mode=args.launches_mode)
+        else:
+            ids = lp.get_fw_ids(query, sort, args.max,
+                                count_only=args.display_format == 'count',
+                                launches_mode=args.launches_mode)
+        fws = ids if args.display_format == 'ids' else [ids]
     else:
-        for id in ids:
-            fw = lp.get_fw_by_id(id)
-            d = fw.to_dict()
-            d['state'] = d.get('state', 'WAITING')
-            if args.display_format == 'more' or args.display_format == 'less':
-                if 'archived_launches' in d:
-                    del d['archived_launches']
-                del d['spec']
-            if args.display_format == 'less':
-                if 'launches' in d:
-                    del d['launches']
-            fws.append(d)
-    if len(fws) == 1:
-        fws = fws[0]
-
-    print(args.output(fws))
+        # do not read the fields that are not displayed
+        projection = {'_id': False}
+        if args.display_format in ('more', 'less'):
+            projection['archived_launches'] = False
+        if args.display_format == 'less':
+            projection['launches'] = False
+
+        if args.qid or args.launches_mode:
+            if args.qid:
+                ids = lp.get_fw_ids_from_reservation_id(args.qid)
+                if query:
+                    query['fw_id'] = {"$in": ids}
+                    ids = lp.get_fw_ids(query, sort, args.max,
+                                        launches_mode=args.launches_mode)
+            else:
+                ids = lp.get_fw_ids(query, sort, args.max, launches_mode=args.launches_mode)
+            fw_dicts = _iter_fw_dicts_by_ids(lp, ids, projection)
+        else:
+            fw_dicts = lp.iter_fws(query, projection, sort=sort, limit=args.max)
+
+        def fw_display_dicts():
+            for fw_dict in fw_dicts:
+                d = Firework.from_dict(fw_dict).to_dict()
+                d['state'] = d.get('state', 'WAITING')
+                if args.display_format == 'more' or args.display_format == 'less':
+                    del d['spec']
+                yield d
+
+        fws = fw_display_dicts()
+    _print_docs(args, fws)
+
+
+def _iter_fw_dicts_by_ids(lp, ids, projection, batch_size=1000):
+    """
+    Iterate over the firework dicts of a list of ids, in the order of the list.
+
+    Args:
+        lp (LaunchPad)
+        ids ([int]): firework ids
+        projection (dict): the fields to return, in Pymongo format
+        batch_size (int): number of fireworks read at once
+
+    Returns:
+        generator of dict
+    """
+    for i in range(0, len(ids), batch_size):
+        batch = ids[i:i + batch_size]
+        fw_dicts = {d['fw_id']: d for d in lp.iter_fws({'fw_id': {'$in': batch}},
+                                                       projection)}
+        for fw_id in batch:
+            if fw_id in fw_dicts:
+                yield fw_dicts[fw_id]
+
+
+def _print_docs(args, docs):
+    """
+    Print the documents found by a get_* command. With the jsonl output, every document is
+    printed as soon as it is read, one per line. Otherwise, the documents are printed together
+    as a list, or alone if there is only one.
+
+    Args:
+        args (Namespace): the command line arguments
+        docs (iterable): the documents to print
+    """
+    if args.output_format == 'jsonl':
+        for d in docs:
+            print(args.output(d))
+        return
+    docs = list(docs)
+    if len(docs) == 1:
+        docs = docs[0]
+    print(args.output(docs))
 
 
 def update_fws(args):
@@ -315,16 +368,17 @@ def get_wfs(args):
     elif args.display_format == 'count':
         wfs = [ids]
     else:
-        wfs = []
-        for i in ids:
-            d = lp.get_wf_summary_dict(i, args.display_format)
-            d["name"] += "--%d" % i
-            wfs.append(d)
+        def wf_summary_dicts(batch_size=1000):
+            for n in range(0, len(ids), batch_size):
+                batch = ids[n:n + batch_size]
+                for i, d in zip(batch, lp.get_wf_summary_dicts(batch, args.display_format)):
+                    d["name"] += "--%d" % i
+                    yield d
 
-    if len(wfs) == 1:
-        wfs = wfs[0]
+        wfs = wf_summary_dicts()
 
     if args.table:
+        wfs = list(wfs)
         headers = list(wfs[0].keys())
         from prettytable import PrettyTable
         t = PrettyTable(headers)
@@ -332,7 +386,7 @@ def get_wfs(args):
             t.add_row([d.get(k) for k in headers])
         print(t)
     else:
-        print(args.output(wfs))
+        _print_docs(args, wfs)
 
 
 def delete_wfs(args):
@@ -382,6 +436,11 @@ def tuneup(args):
     lp.tuneup(bkground=not args.full)
 
 
+def mark_active_launches(args):
+    lp = get_lp(args)
+    lp.mark_active_launches()
+
+
 def defuse_wfs(args):
     lp = get_lp(args)
     fw_ids = parse_helper(lp, args, wf_mode=True)
@@ -673,12 +732,19 @@ def version(args):
 
 def maintain(args):
     lp = get_lp(args)
-    lp.maintain(args.infinite, args.maintain_interval)
+    lp.maintain(args.infinite, args.maintain_interval, args.incremental)
+
+
+def refresher(args):
+    lp = get_lp(args)
+    lp.run_refresher(args.infinite, args.refresh_interval)
 
 
 def get_output_func(format):
     if format == "json":
         return lambda x: json.dumps(x, default=DATETIME_HANDLER, indent=4)
+    elif format == "jsonl":
+        return lambda x: json.dumps(x, default=DATETIME_HANDLER)
     else:
         return lambda x: yaml.safe_dump(recursive_dict(x, preserve_unicode=False),
                                    default_flow_style=False)
@@ -700,10 +766,12 @@ def lpad():
 
     parser = ArgumentParser(description=m_description)
     parent_parser = ArgumentParser(add_help=False)
-    parser.add_argument("-o", "--output", choices=["json", "yaml"],
+    parser.add_argument("-o", "--output", choices=["json", "jsonl", "yaml"],
                         default="json", type=lambda s: s.lower(),
-                        help="Set output display format to either json or YAML. "
-                             "YAML is easier to read for long documents. JSON is the default.")
+                        help="Set output display format to either json, jsonl or YAML. "
+                             "YAML is easier to read for long documents. JSON is the default. "
+                             "With jsonl, get_fws and get_wfs print one document per line as it "
+                             "is read, which keeps the memory use constant for large results.")
 
     subparsers = parser.add_subparsers(help='command', dest='command')
 
@@ -1091,8 +1159,20 @@ def lpad():
     maintain_parser.add_argument('--infinite', help='loop infinitely', action='store_true')
     maintain_parser.add_argument('--maintain_interval', help='sleep time between maintenance loops (infinite mode)',
                                  default=MAINTAIN_INTERVAL, type=int)
+    maintain_parser.add_argument('--incremental', help='only examine the launches that expired '
+                                 'since the previous pass, and record the time of each pass',
+                                 action='store_true')
     maintain_parser.set_defaults(func=maintain)
 
+    refresher_parser = admin_subparser.add_parser('refresher',
+                                                  help='Apply the workflow refreshes queued by '
+                                                       'rockets using defer_refresh')
+    refresher_parser.add_argument('--infinite', help='loop infinitely', action='store_true')
+    refresher_parser.add_argument('--refresh_interval',
+                                  help='sleep time when no refreshes are queued (infinite mode)',
+                                  default=REFRESHER_INTERVAL, type=float)
+    refresher_parser.set_defaults(func=refresher)
+
     tuneup_parser = admin_subparser.add_parser('tuneup',
                                           help='Tune-up the database (should be performed during '
                                                'scheduled downtime)')
@@ -1100,6 +1180,13 @@ def lpad():
                                               'DB downtime only)', action='store_true')
     tuneup_parser.set_defaults(func=tuneup)
 
+    active_parser = admin_subparser.add_parser('mark_active_launches',
+                                               help='Flag the archived launches, so that the '
+                                                    'launches mode of get_fws and introspect can '
+                                                    'skip them (needed once for databases created '
+                                                    'with older FireWorks versions)')
+    active_parser.set_defaults(func=mark_active_launches)
+
     refresh_parser = admin_subparser.add_parser('refresh', help='manually force a workflow refresh '
                                                                 '(not usually needed)')
     refresh_parser.add_argument(*fw_id_args, **fw_id_kwargs)
@@ -1157,6 +1244,7 @@ def lpad():
 
     args = parser.parse_args()
 
+    args.output_format = args.output
     args.output = get_output_func(args.output)
 
     if args.command is None:
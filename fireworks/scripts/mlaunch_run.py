@@ -54,6 +54,11 @@ def mlaunch():
                         default=1, type=int)
     parser.add_argument('--exclude_current_node', help="Don't use the script launching node as compute node",
                         action="store_true")
+    parser.add_argument('--batch', help='number of FireWorks to check out and complete at once per '
+                                        'parallel job (default 1)', default=1, type=int)
+    parser.add_argument('--lp_per_process', help='give each parallel job its own database '
+                                                 'connection instead of sharing one through a '
+                                                 'server process', action="store_true")
 
     try:
         import argcomplete
@@ -93,7 +98,8 @@ def mlaunch():
 
     launch_multiprocess(launchpad, fworker, args.loglvl, args.nlaunches, args.num_jobs,
                         args.sleep, total_node_list, args.ppn, timeout=args.timeout,
-                        exclude_current_node=args.exclude_current_node)
+                        exclude_current_node=args.exclude_current_node, batch_size=args.batch,
+                        lp_per_process=args.lp_per_process)
 
 
 if __name__ == "__main__":
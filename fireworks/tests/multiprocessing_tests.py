@@ -11,7 +11,7 @@ from unittest import TestCase
 
 from fireworks import LaunchPad, Firework, FWorker
 from fireworks.core.firework import Workflow
-from fireworks.features.multi_launcher import launch_multiprocess
+from fireworks.features.multi_launcher import launch_multiprocess, RunningIDs
 from fireworks.user_objects.firetasks.script_task import ScriptTask
 
 
@@ -29,6 +29,19 @@ class TestLinks(TestCase):
         self.assertEqual(str(links1), str(links2))
 
 
+class TestRunningIDs(TestCase):
+    def test_running_ids(self):
+        ids = RunningIDs(2)
+        self.assertEqual(ids.items(), [])
+        ids[101] = 5
+        ids[102] = None
+        ids[101] = 6
+        self.assertEqual(ids.items(), [(101, 6), (102, None)])
+        self.assertEqual(ids.values(), [6, None])
+        self.assertEqual(ids[101], 6)
+        self.assertRaises(ValueError, ids.__setitem__, 103, 7)
+
+
 class TestCheckoutFW(TestCase):
     lp = None
 
@@ -79,6 +92,19 @@ class TestCheckoutFW(TestCase):
         with open(os.path.join(fw2.launches[0].launch_dir, "task.out")) as f:
             self.assertEqual(f.readlines(), ['hello 2\n'])
 
+    def test_checkout_fw_lp_per_process(self):
+        os.chdir(MODULE_DIR)
+        for fw_id in range(1, 5):
+            self.lp.add_wf(Firework(ScriptTask.from_str(
+                shell_cmd='echo "hello {}"'.format(fw_id),
+                parameters={"stdout_file": "task.out"}), fw_id=fw_id))
+        launch_multiprocess(self.lp, FWorker(), 'DEBUG', 0, 2, 10, lp_per_process=True)
+        for fw_id in range(1, 5):
+            fw = self.lp.get_fw_by_id(fw_id)
+            self.assertEqual(fw.state, "COMPLETED")
+            with open(os.path.join(fw.launches[0].launch_dir, "task.out")) as f:
+                self.assertEqual(f.readlines(), ['hello {}\n'.format(fw_id)])
+
 
 class TestEarlyExit(TestCase):
     lp = None
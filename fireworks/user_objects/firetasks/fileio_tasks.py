@@ -35,7 +35,7 @@ class FileWriteTask(FiretaskBase):
     required_params = ["files_to_write"]
 
     def run_task(self, fw_spec):
-        pth = self.get("dest", os.getcwd())
+        pth = os.path.join(self.launch_dir or os.getcwd(), self.get("dest", ""))
         for d in self["files_to_write"]:
             with open(os.path.join(pth, d["filename"]), "w") as f:
                 f.write(d["contents"])
@@ -57,7 +57,7 @@ class FileDeleteTask(FiretaskBase):
 
 
     def run_task(self, fw_spec):
-        pth = self.get("dest", os.getcwd())
+        pth = os.path.join(self.launch_dir or os.getcwd(), self.get("dest", ""))
         ignore_errors = self.get('ignore_errors', True)
         for f in self["files_to_delete"]:
             try:
@@ -104,6 +104,8 @@ class FileTransferTask(FiretaskBase):
         max_retry = self.get('max_retry', 0)
         retry_delay = self.get('retry_delay', 10)
         mode = self.get('mode', 'move')
+        # relative paths are relative to the launch directory, not the current directory
+        launch_dir = self.launch_dir or os.getcwd()
 
         if mode == 'rtransfer':
             # remote transfers
@@ -117,9 +119,10 @@ class FileTransferTask(FiretaskBase):
         for f in self["files"]:
             try:
                 if 'src' in f:
-                    src = os.path.abspath(expanduser(expandvars(f['src']))) if shell_interpret else f['src']
+                    src = expanduser(expandvars(f['src'])) if shell_interpret else f['src']
                 else:
-                    src = abspath(expanduser(expandvars(f))) if shell_interpret else f
+                    src = expanduser(expandvars(f)) if shell_interpret else f
+                src = abspath(os.path.join(launch_dir, src))
 
                 if mode == 'rtransfer':
                     dest = self['dest']
@@ -138,9 +141,10 @@ class FileTransferTask(FiretaskBase):
 
                 else:
                     if 'dest' in f:
-                        dest = abspath(expanduser(expandvars(f['dest']))) if shell_interpret else f['dest']
+                        dest = expanduser(expandvars(f['dest'])) if shell_interpret else f['dest']
                     else:
-                        dest = abspath(expanduser(expandvars(self['dest']))) if shell_interpret else self['dest']
+                        dest = expanduser(expandvars(self['dest'])) if shell_interpret else self['dest']
+                    dest = abspath(os.path.join(launch_dir, dest))
                     FileTransferTask.fn_list[mode](src, dest)
 
             except:
@@ -191,7 +195,7 @@ class CompressDirTask(FiretaskBase):
 
     def run_task(self, fw_spec):
         ignore_errors = self.get('ignore_errors', False)
-        dest = self.get("dest", os.getcwd())
+        dest = os.path.join(self.launch_dir or os.getcwd(), self.get("dest", ""))
         compression = self.get("compression", "gz")
         try:
             compress_dir(dest, compression=compression)
@@ -216,7 +220,7 @@ class DecompressDirTask(FiretaskBase):
 
     def run_task(self, fw_spec):
         ignore_errors = self.get('ignore_errors', False)
-        dest = self.get("dest", os.getcwd())
+        dest = os.path.join(self.launch_dir or os.getcwd(), self.get("dest", ""))
         try:
             decompress_dir(dest)
         except:
@@ -240,4 +244,6 @@ class ArchiveDirTask(FiretaskBase):
     optional_params = ["format"]
 
     def run_task(self, fw_spec):
-        shutil.make_archive(self["base_name"], format=self.get("format", "gztar"), root_dir=".")
+        launch_dir = self.launch_dir or os.getcwd()
+        shutil.make_archive(os.path.join(launch_dir, self["base_name"]),
+                            format=self.get("format", "gztar"), root_dir=launch_dir)
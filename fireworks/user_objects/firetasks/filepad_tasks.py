@@ -72,7 +72,7 @@ class GetFilesTask(FiretaskBase):
 
     def run_task(self, fw_spec):
         fpad = get_fpad(self.get("filepad_file", None))
-        dest_dir = self.get("dest_dir", os.path.abspath("."))
+        dest_dir = os.path.join(self.launch_dir or os.getcwd(), self.get("dest_dir", ""))
         new_file_names = self.get("new_file_names", [])
         for i, l in enumerate(self["identifiers"]):
             file_contents, doc = fpad.get_file(identifier=l)
@@ -1,5 +1,6 @@
 """ This module includes tasks to integrate scripts and python functions """
 
+import os
 import shlex
 import subprocess
 import sys
@@ -29,7 +30,7 @@ class ScriptTask(FiretaskBase):
 
         # get the standard in and run task internally
         if self.stdin_file:
-            with open(self.stdin_file) as stdin_f:
+            with open(self._launch_path(self.stdin_file)) as stdin_f:
                 return self._run_task_internal(fw_spec, stdin_f)
         stdin = subprocess.PIPE if self.stdin_key else None
         return self._run_task_internal(fw_spec, stdin)
@@ -43,7 +44,7 @@ class ScriptTask(FiretaskBase):
             p = subprocess.Popen(
                 s, executable=self.shell_exe, stdin=stdin,
                 stdout=stdout, stderr=stderr,
-                shell=self.use_shell)
+                shell=self.use_shell, cwd=self.launch_dir)
 
             # communicate in the standard in and get back the standard out and returncode
             if self.stdin_key:
@@ -62,11 +63,11 @@ class ScriptTask(FiretaskBase):
         stderr = stderr.decode('utf-8') if isinstance(stderr, bytes) else stderr
 
         if self.stdout_file:
-            with open(self.stdout_file, 'a+') as f:
+            with open(self._launch_path(self.stdout_file), 'a+') as f:
                 f.write(stdout)
 
         if self.stderr_file:
-            with open(self.stderr_file, 'a+') as f:
+            with open(self._launch_path(self.stderr_file), 'a+') as f:
                 f.write(stderr)
 
         # write the output keys
@@ -89,6 +90,10 @@ class ScriptTask(FiretaskBase):
 
         return FWAction(stored_data=output)
 
+    def _launch_path(self, path):
+        # relative paths are relative to the launch directory, not the current directory
+        return os.path.join(self.launch_dir or os.getcwd(), path)
+
     def _load_params(self, d):
         if d.get('stdin_file') and d.get('stdin_key'):
             raise ValueError('ScriptTask cannot process both a key and file as the standard in!')
@@ -47,7 +47,8 @@ class TemplateWriterTask(FiretaskBase):
             output = t.render(self.context)
 
             write_mode = 'w+' if self.append_file else 'w'
-            with open(self.output_file, write_mode) as of:
+            with open(os.path.join(self.launch_dir or os.getcwd(), self.output_file),
+                      write_mode) as of:
                 of.write(output)
 
     def _load_params(self, d):
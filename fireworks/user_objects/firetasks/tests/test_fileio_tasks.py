@@ -11,9 +11,11 @@ __date__ = '1/6/14'
 
 import unittest
 import os
+import shutil
+import tempfile
 
 from fireworks.user_objects.firetasks.fileio_tasks import FileWriteTask, \
-    CompressDirTask, ArchiveDirTask, DecompressDirTask
+    CompressDirTask, ArchiveDirTask, DecompressDirTask, FileTransferTask
 from fireworks.utilities.fw_serializers import load_object_from_file
 
 
@@ -66,5 +68,25 @@ class CompressDecompressArchiveDirTest(unittest.TestCase):
         os.chdir(self.cwd)
 
 
+class LaunchDirTest(unittest.TestCase):
+
+    def setUp(self):
+        self.launch_dir = tempfile.mkdtemp()
+
+    def test_relative_paths(self):
+        tasks = [FileWriteTask(files_to_write=[{"filename": "myfile", "contents": "hello"}]),
+                 FileTransferTask(mode="copy", files=[{"src": "myfile", "dest": "copied"}]),
+                 ArchiveDirTask(base_name="archive", format="gztar")]
+        for t in tasks:
+            t.launch_dir = self.launch_dir
+            t.run_task({})
+        for f in ["myfile", "copied", "archive.tar.gz"]:
+            self.assertTrue(os.path.exists(os.path.join(self.launch_dir, f)))
+            self.assertFalse(os.path.exists(f))
+
+    def tearDown(self):
+        shutil.rmtree(self.launch_dir)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -10,14 +10,13 @@ add/delete/update any file of any size.
 import zlib
 import os
 
-from pymongo import MongoClient
 import gridfs
 
 from monty.serialization import loadfn
 from monty.json import MSONable
 
 from fireworks.fw_config import LAUNCHPAD_LOC
-from fireworks.utilities.fw_utilities import get_fw_logger
+from fireworks.utilities.fw_utilities import get_fw_logger, get_mongo_client
 
 
 __author__ = 'Kiran Mathew'
@@ -29,7 +28,7 @@ class FilePad(MSONable):
 
     def __init__(self, host='localhost', port=27017, database='fireworks', username=None,
                  password=None, filepad_coll_name="filepad", gridfs_coll_name="filepad_gfs", logdir=None,
-                 strm_lvl=None):
+                 strm_lvl=None, mongoclient_kwargs=None):
         """
         Args:
             host (str): hostname
@@ -41,6 +40,8 @@ class FilePad(MSONable):
             gridfs_coll_name (str): gridfs collection name
             logdir (str): path to the log directory
             strm_lvl (str): the logger stream level
+            mongoclient_kwargs (dict): other keyword arguments of the MongoClient, shared with the
+                LaunchPads connecting with the same parameters
         """
         self.host = host
         self.port = int(port)
@@ -48,16 +49,16 @@ class FilePad(MSONable):
         self.username = username
         self.password = password
         self.gridfs_coll_name = gridfs_coll_name
+        self.mongoclient_kwargs = mongoclient_kwargs or {}
+        client_kwargs = dict(self.mongoclient_kwargs)
+        if self.username:
+            client_kwargs.update(username=self.username, password=self.password,
+                                 authSource=database)
         try:
-            self.connection = MongoClient(self.host, self.port)
+            self.connection = get_mongo_client(self.host, self.port, **client_kwargs)
             self.db = self.connection[database]
         except:
             raise Exception("connection failed")
-        try:
-            if self.username:
-                self.db.authenticate(self.username, self.password)
-        except:
-            raise Exception("authentication failed")
 
         # set collections: filepad and gridfs
         self.filepad = self.db[filepad_coll_name]
@@ -299,7 +300,7 @@ class FilePad(MSONable):
 
         return cls(creds.get("host", "localhost"), int(creds.get("port", 27017)),
                    creds.get("name", "fireworks"), user, password, coll_name,
-                   gfs_name)
+                   gfs_name, mongoclient_kwargs=creds.get("mongoclient_kwargs"))
 
     @classmethod
     def auto_load(cls):
@@ -2,6 +2,8 @@
 
 import logging
 import datetime
+import json
+import threading
 from multiprocessing.managers import BaseManager
 import string
 import sys
@@ -13,6 +15,8 @@ import errno
 import six
 import contextlib
 
+from pymongo import MongoClient
+
 from fireworks.fw_config import FWData, FW_BLOCK_FORMAT, DS_PASSWORD, FW_LOGGING_FORMAT
 
 __author__ = 'Anubhav Jain, Xiaohui Qu'
@@ -26,6 +30,10 @@ PREVIOUS_STREAM_LOGGERS = []  # contains the name of loggers that have already b
 PREVIOUS_FILE_LOGGERS = []  # contains the name of file loggers that have already been initialized
 DEFAULT_FORMATTER = logging.Formatter(FW_LOGGING_FORMAT)
 
+MONGO_CLIENTS = {}  # the MongoClients of this process, by connection parameters
+MONGO_CLIENTS_LOCK = threading.Lock()
+MONGO_CLIENTS_PID = os.getpid()
+
 
 def get_fw_logger(name, l_dir=None, file_levels=('DEBUG', 'ERROR'), stream_level='DEBUG',
                   formatter=DEFAULT_FORMATTER, clear_logs=False):
@@ -159,6 +167,34 @@ def create_datestamp_dir(root_dir, l_logger, prefix='block_'):
 
 _g_ip, _g_host = None, None
 
+def get_mongo_client(host=None, port=None, **kwargs):
+    """
+    Return the MongoClient of this process for the given connection parameters, and create it on
+    first use. The LaunchPads and FilePads connecting with the same parameters thus share a single
+    connection pool. A forked process does not reuse the clients of its parent, but creates its
+    own ones.
+
+    Args:
+        host (str): hostname or MongoDB connection string URI
+        port (int): port number
+        kwargs: other keyword arguments of MongoClient, e.g. maxPoolSize
+
+    Returns:
+        MongoClient
+    """
+    global MONGO_CLIENTS_LOCK, MONGO_CLIENTS_PID
+    if os.getpid() != MONGO_CLIENTS_PID:
+        # the lock might have been held by another thread of the parent at the time of the fork
+        MONGO_CLIENTS_LOCK = threading.Lock()
+        MONGO_CLIENTS_PID = os.getpid()
+        MONGO_CLIENTS.clear()
+    key = json.dumps([host, port, kwargs], sort_keys=True, default=str)
+    with MONGO_CLIENTS_LOCK:
+        if key not in MONGO_CLIENTS:
+            MONGO_CLIENTS[key] = MongoClient(host, port, **kwargs)
+        return MONGO_CLIENTS[key]
+
+
 def get_my_ip():
     global _g_ip
     if _g_ip is None: